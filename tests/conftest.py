@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +39,10 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def thumbnails_without_worker_threads(settings):
+    # Тесты работают в режиме autocommit: пул потоков миниатюр
+    # писал бы в базу и MEDIA_ROOT параллельно со следующим тестом
+    settings.POSTS_THUMBNAIL_WORKERS = 0
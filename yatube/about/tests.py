@@ -1,7 +1,10 @@
 from http import HTTPStatus
+from django.contrib.auth import get_user_model
 from django.test import TestCase, Client
 from django.urls import reverse
 
+User = get_user_model()
+
 
 class URLTests(TestCase):
 
@@ -67,3 +70,24 @@ class StaticViewsTests(TestCase):
             with self.subTest(reverse_name=reverse_name):
                 self.assertTemplateUsed(
                     self.guest_client.get(reverse_name), template)
+
+
+class CacheHeadersTests(TestCase):
+
+    def test_about_pages_are_cacheable(self):
+        """Страницы кешируются надолго: у гостя публично, у вошедшего
+        пользователя - только в его браузере."""
+        user = User.objects.create_user(username='auth')
+        for url in (reverse('about:author'), reverse('about:tech')):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('max-age=86400', response['Cache-Control'])
+                self.assertIn('Cookie', response['Vary'])
+                self.assertEqual(self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                    HTTPStatus.NOT_MODIFIED)
+                self.client.force_login(user)
+                self.assertIn('private',
+                              self.client.get(url)['Cache-Control'])
+                self.client.logout()
@@ -1,9 +1,33 @@
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.views.generic import TemplateView
 
+# Страницы "об авторе" меняются только с выкладкой
+ABOUT_MAX_AGE = 60 * 60 * 24
 
-class AboutAuthorView(TemplateView):
+
+class CachedTemplateView(TemplateView):
+    """Статичная страница, которую браузеры и прокси хранят
+    ABOUT_MAX_AGE секунд.
+
+    В шапке есть имя вошедшего пользователя, поэтому ответ различается
+    по Cookie, а его страницу хранит только его браузер.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True,
+                                max_age=ABOUT_MAX_AGE)
+        else:
+            patch_cache_control(response, public=True,
+                                max_age=ABOUT_MAX_AGE)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+
+class AboutAuthorView(CachedTemplateView):
     template_name = 'about/about_author.html'
 
 
-class AboutTechView(TemplateView):
+class AboutTechView(CachedTemplateView):
     template_name = 'about/about_tech.html'
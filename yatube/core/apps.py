@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .checks import check_production
+        from .db import configure_sqlite
+        check_production()
+        connection_created.connect(configure_sqlite,
+                                   dispatch_uid='core_configure_sqlite')
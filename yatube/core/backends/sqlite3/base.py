@@ -0,0 +1,22 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite с режимом начала транзакций OPTIONS['transaction_mode'].
+
+    Обычный BEGIN (DEFERRED) берет блокировку на запись только при
+    первой записи. Если транзакция до этого читала (get_or_create,
+    select_for_update), а другой писатель успел закоммитить, SQLite
+    сразу возвращает "database is locked", не дожидаясь busy_timeout.
+    BEGIN IMMEDIATE берет блокировку в начале atomic(), и писатели
+    просто ждут друг друга.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('transaction_mode', None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
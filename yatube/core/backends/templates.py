@@ -0,0 +1,28 @@
+import time
+from django.template.backends import django
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    """Шаблоны Django с замером времени отрисовки для
+    core.profiling; запросы во время отрисовки помечаются именем
+    шаблона для core.slow_queries. Вложенные {% include %}
+    отрисовываются внутри шаблона верхнего уровня и отдельно
+    не считаются."""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+class Template(django.Template):
+
+    def render(self, context=None, request=None):
+        from core.profiling import record_template_time, rendering
+        start = time.perf_counter()
+        try:
+            with rendering(self.origin.template_name):
+                return super().render(context, request)
+        finally:
+            record_template_time(time.perf_counter() - start)
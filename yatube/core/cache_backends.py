@@ -0,0 +1,418 @@
+"""Общие для всех процессов бэкенды кеша.
+
+LocMemCache у каждого воркера свой: кеш дублируется, а сброс версий
+лент в одном процессе не виден остальным. SQLiteCache хранит данные
+в одном файле на сервере, RedisCache ходит к любому серверу
+с протоколом Redis (RESP). LocMemCache и FileBasedCache - обычные
+бэкенды Django с тем же учетом попаданий.
+
+Время всех операций попадает в замер cache запроса (core.profiling),
+счетчики попаданий - в /metrics (core.metrics).
+"""
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import wraps
+from urllib.parse import urlparse
+from django.core.cache.backends import filebased, locmem
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from . import metrics
+from .profiling import timed
+
+# Счетчики попаданий общие для всех экземпляров бэкенда в процессе:
+# Django создает отдельный экземпляр кеша на каждый поток
+_stats = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+
+class CacheStatsMixin:
+    """Учет попаданий, промахов и вытеснений."""
+
+    def _count(self, event, amount=1):
+        with _stats_lock:
+            _stats[self.location][event] += amount
+        metrics.inc(f'yatube_cache_{event}_total',
+                    {'backend': type(self).__name__}, amount)
+
+    def stats(self):
+        with _stats_lock:
+            counters = dict(_stats[self.location])
+        for event in ('hits', 'misses', 'evictions'):
+            counters.setdefault(event, 0)
+        return counters
+
+
+CACHE_OPERATIONS = ('get', 'get_many', 'set', 'add', 'touch', 'incr',
+                    'delete', 'has_key', 'clear')
+_MISSING = object()
+
+
+def _timed_operation(method):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with timed('cache'):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def timed_operations(cls):
+    """Оборачивает операции бэкенда в замер cache."""
+    for name in CACHE_OPERATIONS:
+        setattr(cls, name, _timed_operation(getattr(cls, name)))
+    return cls
+
+
+class DjangoCacheStatsMixin(CacheStatsMixin):
+    """Учет попаданий для бэкендов Django (get_many вызывает get)."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return value
+
+
+@timed_operations
+class LocMemCache(DjangoCacheStatsMixin, locmem.LocMemCache):
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.location = name
+
+
+@timed_operations
+class FileBasedCache(DjangoCacheStatsMixin, filebased.FileBasedCache):
+
+    def __init__(self, directory, params):
+        super().__init__(directory, params)
+        self.location = directory
+
+
+@timed_operations
+class SQLiteCache(CacheStatsMixin, BaseCache):
+    """Кеш в файле SQLite, общий для всех воркеров сервера.
+
+    Число записей ограничено MAX_ENTRIES: при переполнении удаляются
+    просроченные записи, а затем давно не читавшиеся (LRU). Время
+    последнего чтения обновляется не чаще раза в ACCESS_RESOLUTION
+    секунд, чтобы чтение почти не превращалось в запись.
+    """
+    ACCESS_RESOLUTION = 30
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.location, timeout=10, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, '
+                'value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed '
+                               'ON cache (accessed)')
+            self._local.connection = connection
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expires(self, timeout):
+        # Абсолютное время истечения (или None - без срока)
+        return self.get_backend_timeout(timeout)
+
+    def _fetch(self, key):
+        """Значение живой записи или None."""
+        now = time.time()
+        row = self._db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            self._db.execute('DELETE FROM cache WHERE key = ? AND expires = ?',
+                             (key, expires))
+            return None
+        if accessed < now - self.ACCESS_RESOLUTION:
+            self._db.execute('UPDATE cache SET accessed = ? WHERE key = ?',
+                             (now, key))
+        return value
+
+    def get(self, key, default=None, version=None):
+        value = self._fetch(self._key(key, version))
+        if value is None:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return pickle.loads(value)
+
+    def _store(self, key, value, timeout, replace):
+        now = time.time()
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if not replace:
+                db.execute('DELETE FROM cache WHERE key = ? AND expires <= ?',
+                           (key, now))
+            cursor = db.execute(
+                f'{verb} INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 self._expires(timeout), now),
+            )
+            stored = cursor.rowcount > 0
+            self._cull(now)
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return stored
+
+    def _cull(self, now):
+        count = self._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        evicted = self._db.execute(
+            'DELETE FROM cache WHERE expires <= ?', (now,)).rowcount
+        count -= evicted
+        if count > self._max_entries:
+            # Удаляем с запасом, чтобы не чистить таблицу на каждой записи
+            excess = count - self._max_entries
+            if self._cull_frequency:
+                excess += self._max_entries // self._cull_frequency
+            evicted += self._db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)', (excess,)
+            ).rowcount
+        self._count('evictions', evicted)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(self._key(key, version), value, timeout, replace=True)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store(self._key(key, version), value, timeout,
+                           replace=False)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._expires(timeout), self._key(key, version), time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно для всех процессов: чтение и запись в одной
+        транзакции BEGIN IMMEDIATE."""
+        key = self._key(key, version)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            value = self._fetch(key)
+            if value is None:
+                raise ValueError(f"Key '{key}' not found")
+            new_value = pickle.loads(value) + delta
+            db.execute('UPDATE cache SET value = ? WHERE key = ?',
+                       (pickle.dumps(new_value, pickle.HIGHEST_PROTOCOL), key))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return new_value
+
+    def delete(self, key, version=None):
+        self._db.execute('DELETE FROM cache WHERE key = ?',
+                         (self._key(key, version),))
+
+    def has_key(self, key, version=None):
+        return self._fetch(self._key(key, version)) is not None
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живет весь поток: открывать файл на каждый запрос
+        # дороже, чем держать его
+        pass
+
+
+class RedisError(Exception):
+    pass
+
+
+@timed_operations
+class RedisCache(CacheStatsMixin, BaseCache):
+    """Кеш на сервере с протоколом Redis.
+
+    LOCATION: redis://host:port/db. Клиент минимальный, без внешних
+    зависимостей; ограничение размера и LRU настраиваются на сервере
+    (maxmemory и maxmemory-policy allkeys-lru). Целые числа хранятся
+    как есть, чтобы incr выполнялся на сервере атомарно.
+    """
+    SOCKET_TIMEOUT = 5
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        url = urlparse(location)
+        self._address = (url.hostname or '127.0.0.1', url.port or 6379)
+        self._db_number = int(url.path.strip('/') or 0)
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection(self._address, self.SOCKET_TIMEOUT)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        if self._db_number:
+            self._command('SELECT', self._db_number)
+        return sock
+
+    def _read_reply(self):
+        reader = self._local.reader
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Соединение с сервером кеша закрыто')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            return reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f'Неизвестный ответ сервера: {line!r}')
+
+    def _command(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = self._connect()
+        try:
+            sock.sendall(b''.join(parts))
+            return self._read_reply()
+        except (OSError, ConnectionError):
+            self._drop()
+            raise
+
+    def _drop(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    @staticmethod
+    def _encode(value):
+        if type(value) is int:
+            return str(value).encode()
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(value):
+        if value[:1] == b'\x80':
+            return pickle.loads(value)
+        return int(value)
+
+    def _expiry_args(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        if expires is None:
+            return ()
+        return ('PX', max(int((expires - time.time()) * 1000), 1))
+
+    def get(self, key, default=None, version=None):
+        value = self._command('GET', self._key(key, version))
+        if value is None:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return self._decode(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._command('SET', self._key(key, version), self._encode(value),
+                      *self._expiry_args(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._command(
+            'SET', self._key(key, version), self._encode(value),
+            *self._expiry_args(timeout), 'NX'
+        ) is not None
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        args = self._expiry_args(timeout)
+        if not args:
+            return bool(self._command('PERSIST', key)) or self.has_key(key)
+        return bool(self._command('PEXPIRE', key, args[1]))
+
+    def incr(self, key, delta=1, version=None):
+        """EXISTS и INCRBY в одной транзакции MULTI/EXEC: ключ, истекший
+        между ними, не воскресает без срока жизни."""
+        key = self._key(key, version)
+        self._command('MULTI')
+        self._command('EXISTS', key)
+        self._command('INCRBY', key, delta)
+        exists, value = self._command('EXEC')
+        if not exists:
+            # INCRBY создал ключ заново - убираем его
+            self._command('DEL', key)
+            raise ValueError(f"Key '{key}' not found")
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._command(
+            'MGET', *[self._key(key, version) for key in keys])
+        found = {key: self._decode(value)
+                 for key, value in zip(keys, values) if value is not None}
+        self._count('hits', len(found))
+        self._count('misses', len(keys) - len(found))
+        return found
+
+    def delete(self, key, version=None):
+        self._command('DEL', self._key(key, version))
+
+    def has_key(self, key, version=None):
+        return bool(self._command('EXISTS', self._key(key, version)))
+
+    def clear(self):
+        self._command('FLUSHDB')
+
+    def close(self, **kwargs):
+        pass
@@ -0,0 +1,32 @@
+"""Проверка, что на боевом сервере не включена отладка."""
+import sys
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+DEBUG_APPS = ('debug_toolbar',)
+
+
+def debug_instrumentation():
+    """Что из отладочных инструментов включено в настройках
+    или импортировано в процесс."""
+    found = []
+    if settings.DEBUG:
+        found.append('DEBUG = True')
+    for app in DEBUG_APPS:
+        if app in settings.INSTALLED_APPS:
+            found.append(f'{app} в INSTALLED_APPS')
+        if any(name.startswith(f'{app}.') for name in settings.MIDDLEWARE):
+            found.append(f'{app} в MIDDLEWARE')
+        if app in sys.modules:
+            found.append(f'модуль {app} загружен')
+    return found
+
+
+def check_production():
+    """Не дает запустить prod с отладочными инструментами."""
+    if getattr(settings, 'YATUBE_ENV', None) != 'prod':
+        return
+    found = debug_instrumentation()
+    if found:
+        raise ImproperlyConfigured(
+            'Отладка в боевых настройках: ' + ', '.join(found))
@@ -0,0 +1,42 @@
+"""Настройка соединений SQLite.
+
+По умолчанию SQLite пишет журнал отката (journal_mode=DELETE): пока идет
+запись, читатели ждут, а конкурирующие записи быстро получают
+"database is locked". В режиме WAL читатели не блокируются записью,
+а busy_timeout заставляет писателей подождать друг друга.
+"""
+from django.conf import settings
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В режиме WAL NORMAL не теряет целостность, только последние
+    # транзакции при отключении питания
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - размер в килобайтах
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def sqlite_pragmas():
+    """PRAGMA для новых соединений: DEFAULT_PRAGMAS с поправками
+    из настройки SQLITE_PRAGMAS (None - не выполнять PRAGMA)."""
+    pragmas = {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+    return {name: value for name, value in pragmas.items()
+            if value is not None}
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Обработчик connection_created: выполняет PRAGMA на каждом
+    новом соединении с SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, sqlite_pragmas())
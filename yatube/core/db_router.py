@@ -0,0 +1,81 @@
+"""Чтение лент с реплик базы данных.
+
+Представления, помеченные декоратором replica_reads, читают с одной
+из реплик DATABASE_REPLICAS, все остальные запросы и любые записи идут
+в default. Пользователь, который только что что-то записал, еще
+DATABASE_REPLICA_PIN_SECONDS секунд читает из default (cookie
+PIN_COOKIE): реплика может отставать, а свой пост или лайк он должен
+увидеть сразу.
+"""
+import random
+import threading
+from django.conf import settings
+
+PIN_COOKIE = 'db_pin_primary'
+
+_state = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def replica_pin_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10)
+
+
+def replica_reads(view_func):
+    """Помечает представление, которое только читает данные."""
+    view_func.replica_reads = True
+    return view_func
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if (getattr(_state, 'use_replicas', False)
+                and not getattr(_state, 'pinned', False)
+                and not getattr(_state, 'wrote', False)):
+            aliases = replicas()
+            if aliases:
+                return random.choice(aliases)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии default, объекты из них можно связывать
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Включает чтение с реплик для помеченных представлений
+    и закрепляет за default пользователей, которые только что писали."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.use_replicas = False
+        _state.pinned = PIN_COOKIE in request.COOKIES
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            wrote = _state.wrote
+        finally:
+            _state.use_replicas = _state.pinned = _state.wrote = False
+        if wrote and replicas():
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=replica_pin_seconds(),
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _state.use_replicas = getattr(view_func, 'replica_reads', False)
@@ -0,0 +1,146 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.db import apply_pragmas, sqlite_pragmas
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Workload:
+    """Читатели листают ленту, писатели ставят лайки: как в get_or_create,
+    транзакция сначала читает, потом пишет."""
+
+    def __init__(self, path, pragmas, rows, begin='BEGIN'):
+        self.path = path
+        self.pragmas = pragmas
+        self.begin = begin
+        self.rows = rows
+        self.lock = threading.Lock()
+        self.latencies = {'read': [], 'write': []}
+        self.errors = 0
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, isolation_level=None,
+                                     check_same_thread=False)
+        apply_pragmas(connection, self.pragmas)
+        return connection
+
+    def prepare(self):
+        connection = self.connect()
+        connection.executescript(
+            'CREATE TABLE post (id INTEGER PRIMARY KEY, pub_date REAL, '
+            'text TEXT, likes INTEGER NOT NULL DEFAULT 0);'
+            'CREATE INDEX post_pub_date ON post (pub_date DESC, id);'
+            'CREATE TABLE post_like (id INTEGER PRIMARY KEY, post INTEGER, '
+            'user INTEGER);'
+        )
+        connection.execute('BEGIN')
+        connection.executemany(
+            'INSERT INTO post (pub_date, text) VALUES (?, ?)',
+            ((time.time() - i, 'Текст поста ' * 20)
+             for i in range(self.rows)))
+        connection.execute('COMMIT')
+        connection.close()
+
+    def read(self, connection):
+        offset = random.randrange(0, max(self.rows - 10, 1))
+        connection.execute('SELECT id, text, likes FROM post ORDER BY '
+                           'pub_date DESC, id LIMIT 10 OFFSET ?',
+                           (offset,)).fetchall()
+
+    def write(self, connection):
+        post = random.randrange(1, self.rows + 1)
+        connection.execute(self.begin)
+        try:
+            connection.execute('SELECT likes FROM post WHERE id = ?',
+                               (post,)).fetchone()
+            connection.execute('INSERT INTO post_like (post, user) '
+                               'VALUES (?, ?)', (post, random.random()))
+            connection.execute('UPDATE post SET likes = likes + 1 '
+                               'WHERE id = ?', (post,))
+            connection.execute('COMMIT')
+        except sqlite3.OperationalError:
+            connection.execute('ROLLBACK')
+            raise
+
+    def worker(self, kind, deadline):
+        connection = self.connect()
+        operation = getattr(self, kind)
+        latencies = []
+        errors = 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                operation(connection)
+            except sqlite3.OperationalError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        connection.close()
+        with self.lock:
+            self.latencies[kind].extend(latencies)
+            self.errors += errors
+
+    def run(self, readers, writers, seconds):
+        deadline = time.monotonic() + seconds
+        threads = [
+            threading.Thread(target=self.worker, args=(kind, deadline))
+            for kind, count in (('read', readers), ('write', writers))
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            kind: (len(values) / seconds, percentile(values, 0.95) * 1000)
+            for kind, values in self.latencies.items()
+        }
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает конкурентные чтение и запись в SQLite: настройки '
+            'по умолчанию против SQLITE_PRAGMAS и transaction_mode')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--rows', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        mode = settings.DATABASES['default'].get('OPTIONS', {}).get(
+            'transaction_mode')
+        setups = (
+            ('по умолчанию', {}, 'BEGIN'),
+            ('SQLITE_PRAGMAS', sqlite_pragmas(),
+             f'BEGIN {mode}' if mode else 'BEGIN'),
+        )
+        for label, pragmas, begin in setups:
+            directory = tempfile.mkdtemp()
+            try:
+                workload = Workload(os.path.join(directory, 'bench.sqlite3'),
+                                    pragmas, options['rows'], begin)
+                workload.prepare()
+                result = workload.run(options['readers'], options['writers'],
+                                      options['seconds'])
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+            (reads, read_p95), (writes, write_p95) = (result['read'],
+                                                      result['write'])
+            self.stdout.write(
+                f'{label}: чтений {reads:.0f}/с (p95 {read_p95:.1f} мс), '
+                f'записей {writes:.0f}/с (p95 {write_p95:.1f} мс), '
+                f'ошибок "database is locked": {workload.errors}'
+            )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import slow_queries
+
+
+class Command(BaseCommand):
+    help = ('Медленные SQL-запросы из журнала SLOW_QUERY_LOG по убыванию '
+            'суммарного времени, с планом самого медленного случая')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--view', help='Только запросы представления, '
+                                           'например posts:search')
+        parser.add_argument('--clear', action='store_true',
+                            help='Очистить журнал')
+
+    def handle(self, *args, **options):
+        if not slow_queries.log_path():
+            raise CommandError('Журнал выключен: задайте SLOW_QUERY_LOG')
+        if options['clear']:
+            slow_queries.clear()
+            self.stdout.write(self.style.SUCCESS('Журнал очищен'))
+            return
+        entries = slow_queries.top(options['limit'], options['view'])
+        if not entries:
+            self.stdout.write('Медленных запросов нет')
+            return
+        for number, entry in enumerate(entries, 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{number}. {entry["total_ms"]:.1f} мс всего, '
+                f'выполнений: {entry["count"]}, '
+                f'максимум {entry["max_ms"]:.1f} мс '
+                f'[{entry["fingerprint"][:12]}]'))
+            self.stdout.write(f'   представление: {entry["view"] or "-"}, '
+                              f'шаблон: {entry["template"] or "-"}')
+            self.stdout.write(f'   {entry["sql"]}')
+            for line in entry['plan'].splitlines():
+                self.stdout.write(f'     {line}')
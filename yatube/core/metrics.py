@@ -0,0 +1,340 @@
+"""Счетчики и гистограммы для Prometheus (/metrics).
+
+Каждый процесс сервера копит значения в памяти и не чаще раза
+в METRICS_FLUSH_INTERVAL секунд сбрасывает их целиком в свой файл
+в METRICS_DIR. /metrics складывает файлы всех процессов, поэтому
+за pre-fork сервером (gunicorn, uwsgi) видны суммы по всем воркерам,
+а также по процессу generate_thumbnails --watch. Файлы завершившихся
+процессов при чтении складываются в общий DEAD_FILE и удаляются
+(как mark_process_dead в prometheus_client): каталог не растет
+с каждым перезапуском воркеров, а счетчики не уменьшаются. Живость
+процесса проверяется по pid, поэтому METRICS_DIR не должен быть
+общим для нескольких серверов.
+
+Без METRICS_DIR /metrics показывает только процесс, ответивший
+на запрос.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Имя -> (тип, описание)
+METRICS = {
+    'yatube_request_duration_seconds': (
+        'histogram', 'Время ответа по имени URL'),
+    'yatube_db_queries_total': (
+        'counter', 'SQL-запросов по имени URL'),
+    'yatube_cache_hits_total': ('counter', 'Попаданий в кеш'),
+    'yatube_cache_misses_total': ('counter', 'Промахов кеша'),
+    'yatube_cache_evictions_total': ('counter', 'Вытесненных записей кеша'),
+    'yatube_thumbnails_total': (
+        'counter', 'Попыток построить миниатюры: done, retry '
+                   '(задание вернулось в очередь), failed'),
+    'yatube_reaction_writes_total': (
+        'counter', 'Записанных строк Like/Dislike по способу записи'),
+}
+# Сумма значений завершившихся процессов
+DEAD_FILE = 'dead.json'
+LOCK_FILE = '.lock'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                    10)
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 1)
+
+
+def request_namespaces():
+    """Приложения, по URL которых собирается время ответа."""
+    return getattr(settings, 'METRICS_NAMESPACES',
+                   ('posts', 'users', 'about'))
+
+
+def _labels_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _as_dump(counters, histograms):
+    """Значения в виде, который пишется в файл процесса."""
+    return {
+        'counters': [[name, dict(labels), value] for
+                     (name, labels), value in counters.items()],
+        'histograms': [[name, dict(labels), histogram] for
+                       (name, labels), histogram in histograms.items()],
+    }
+
+
+class Registry:
+    """Значения метрик одного процесса."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.name = f'{self.pid}-{int(time.time() * 1000)}.json'
+        self.counters = {}
+        self.histograms = {}
+        self.flushed = 0.0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    def inc(self, name, labels, amount):
+        key = (name, _labels_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, _labels_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': list(buckets),
+                    'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def dump(self):
+        with self.lock:
+            return _as_dump(self.counters, self.histograms)
+
+    def flush(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        _write(os.path.join(directory, self.name), self.dump())
+
+
+_registry = Registry()
+_registry_lock = threading.Lock()
+
+
+def registry():
+    """Реестр текущего процесса; после fork - новый, пустой."""
+    global _registry
+    if _registry.pid != os.getpid():
+        with _registry_lock:
+            if _registry.pid != os.getpid():
+                _registry = Registry()
+    return _registry
+
+
+def _maybe_flush(current):
+    directory = metrics_dir()
+    if (not directory
+            or time.monotonic() - current.flushed < flush_interval()
+            # Файл пишет один поток, остальные не ждут
+            or not current.flush_lock.acquire(blocking=False)):
+        return
+    try:
+        current.flushed = time.monotonic()
+        current.flush(directory)
+    except OSError:
+        logger.exception('Не удалось записать метрики в %s', directory)
+    finally:
+        current.flush_lock.release()
+
+
+def inc(name, labels=None, amount=1):
+    current = registry()
+    current.inc(name, labels, amount)
+    _maybe_flush(current)
+
+
+def observe(name, value, labels=None, buckets=DURATION_BUCKETS):
+    current = registry()
+    current.observe(name, labels, value, buckets)
+    _maybe_flush(current)
+
+
+def record_request(record):
+    """Время ответа и число запросов к базе из core.profiling."""
+    view = record['view']
+    if not view or view.split(':')[0] not in request_namespaces():
+        return
+    labels = {'view': view}
+    observe('yatube_request_duration_seconds', record['wall_ms'] / 1000,
+            labels)
+    inc('yatube_db_queries_total', labels, record['queries'])
+
+
+@atexit.register
+def _flush_on_exit():
+    directory = metrics_dir()
+    if (directory and _registry.pid == os.getpid()
+            and (_registry.counters or _registry.histograms)):
+        _registry.flush(directory)
+
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, dump):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(dump, file)
+    os.replace(temporary, path)
+
+
+def _merge(dumps):
+    """Сумма выгрузок: (counters, histograms) по ключу (имя, метки)."""
+    counters = {}
+    histograms = {}
+    for dump in dumps:
+        for name, labels, value in dump['counters']:
+            key = (name, _labels_key(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, histogram in dump['histograms']:
+            key = (name, _labels_key(labels))
+            total = histograms.get(key)
+            if total is None:
+                histograms[key] = {**histogram,
+                                   'counts': list(histogram['counts'])}
+                continue
+            total['counts'] = [a + b for a, b
+                               in zip(total['counts'], histogram['counts'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+    return counters, histograms
+
+
+def _process_alive(name):
+    """Жив ли процесс, записавший файл name ({pid}-{мс}.json)."""
+    try:
+        pid = int(name.split('-', 1)[0])
+    except ValueError:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Процесс есть, но принадлежит другому пользователю
+        pass
+    return True
+
+
+@contextmanager
+def _locked(directory, exclusive=False):
+    """Блокировка каталога: чтение не видит файлы, которые в этот
+    момент переносятся в DEAD_FILE."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def prune_dead(directory):
+    """Переносит значения завершившихся процессов в DEAD_FILE и удаляет
+    их файлы. Возвращает число удаленных файлов."""
+    if fcntl is None:
+        return 0
+    with _locked(directory, exclusive=True):
+        dead = [path for path in glob.glob(os.path.join(directory, '*.json*'))
+                if os.path.basename(path) != DEAD_FILE
+                and not _process_alive(os.path.basename(path))]
+        if not dead:
+            return 0
+        dead_file = os.path.join(directory, DEAD_FILE)
+        dumps = [_read(path) for path in [dead_file] + dead
+                 if not path.endswith('.tmp')]
+        _write(dead_file, _as_dump(*_merge(filter(None, dumps))))
+        for path in dead:
+            os.remove(path)
+    return len(dead)
+
+
+def collect():
+    """Суммы по всем процессам: (counters, histograms) со значениями
+    по ключу (имя, метки)."""
+    dumps = []
+    directory = metrics_dir()
+    current = registry()
+    if directory and os.path.isdir(directory):
+        try:
+            prune_dead(directory)
+        except OSError:
+            logger.exception('Не удалось убрать метрики завершившихся '
+                             'процессов из %s', directory)
+        with _locked(directory):
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                if os.path.basename(path) != current.name:
+                    dumps.append(_read(path))
+    dumps.append(current.dump())
+    return _merge(filter(None, dumps))
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"'
+                          for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition():
+    """Текст в формате Prometheus 0.0.4."""
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} '
+                                 f'{_format_value(value)}')
+            continue
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'],
+                                    histogram['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket'
+                             f'{_format_labels(labels, le=bound)} '
+                             f'{cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, le="+Inf")} '
+                         f'{histogram["count"]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} '
+                         f'{_format_value(histogram["sum"])}')
+            lines.append(f'{name}_count{_format_labels(labels)} '
+                         f'{histogram["count"]}')
+    return '\n'.join(lines) + '\n'
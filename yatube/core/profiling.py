@@ -0,0 +1,360 @@
+"""Замеры каждого запроса: время, SQL, шаблоны, повторы запросов.
+
+RequestProfileMiddleware для каждого запроса считает общее время,
+число и время SQL-запросов, время отрисовки шаблонов (через бэкенд
+core.backends.templates), обращений к кешу и построения миниатюр
+(timed) и складывает их по имени представления в скользящие
+гистограммы в памяти процесса. С REQUEST_PROFILING_LOG каждый запрос
+пишется строкой JSON в файл с ротацией, с SERVER_TIMING замеры
+уходят клиенту в заголовке Server-Timing. Время ответа и число
+SQL-запросов также попадают в /metrics (core.metrics), медленные
+запросы - в журнал core.slow_queries.
+
+Один и тот же запрос, выполненный за ответ много раз с разными
+параметрами (например, count() в каждой карточке ленты), - признак
+N+1: такие запросы попадают в запись под ключом n_plus_one.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from logging.handlers import RotatingFileHandler
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from . import metrics, slow_queries
+
+logger = logging.getLogger(__name__)
+log_records = logging.getLogger(f'{__name__}.requests')
+log_records.propagate = False
+
+# Границы корзин гистограмм, миллисекунды
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SLOTS = 10
+# Список значений IN (%s, %s, ...) любой длины - один вид запроса
+PLACEHOLDERS_RE = re.compile(r'%s(?:, %s)+')
+
+_current = threading.local()
+_log_lock = threading.Lock()
+_log_handler = None
+
+
+def profiling_enabled():
+    return getattr(settings, 'REQUEST_PROFILING', True)
+
+
+def n_plus_one_threshold():
+    """Сколько одинаковых запросов за ответ считается N+1."""
+    return getattr(settings, 'REQUEST_PROFILING_N_PLUS_ONE', 5)
+
+
+def server_timing(request):
+    """Отдавать ли заголовок Server-Timing: SERVER_TIMING = True -
+    всем, 'staff' - только сотрудникам, False - никому."""
+    mode = getattr(settings, 'SERVER_TIMING', 'staff')
+    if mode == 'staff':
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
+    return bool(mode)
+
+
+def histogram_window():
+    """За сколько последних секунд хранятся гистограммы."""
+    return getattr(settings, 'REQUEST_PROFILING_WINDOW', 600)
+
+
+def query_shape(sql):
+    return PLACEHOLDERS_RE.sub('%s', sql)
+
+
+class RollingHistogram:
+    """Гистограмма за последние window секунд.
+
+    Окно поделено на SLOTS отрезков; отрезок, вышедший из окна,
+    переиспользуется под новый, поэтому память не растет.
+    """
+
+    def __init__(self, window, buckets=BUCKETS):
+        self.buckets = buckets
+        self.slot_seconds = window / SLOTS
+        self._slots = [None] * SLOTS
+        self._lock = threading.Lock()
+
+    def _slot(self, now):
+        number = int(now // self.slot_seconds)
+        index = number % SLOTS
+        slot = self._slots[index]
+        if slot is None or slot['number'] != number:
+            slot = {'number': number,
+                    'counts': [0] * (len(self.buckets) + 1),
+                    'count': 0, 'sum': 0.0}
+            self._slots[index] = slot
+        return slot
+
+    def observe(self, value, now=None):
+        now = time.time() if now is None else now
+        index = next((position for position, bound
+                      in enumerate(self.buckets) if value <= bound),
+                     len(self.buckets))
+        with self._lock:
+            slot = self._slot(now)
+            slot['counts'][index] += 1
+            slot['count'] += 1
+            slot['sum'] += value
+
+    def snapshot(self, now=None):
+        """{'buckets': [(граница, число)], 'count', 'sum'};
+        последняя граница - None (больше всех)."""
+        now = time.time() if now is None else now
+        oldest = int(now // self.slot_seconds) - SLOTS + 1
+        counts = [0] * (len(self.buckets) + 1)
+        count, total = 0, 0.0
+        with self._lock:
+            for slot in self._slots:
+                if slot is None or slot['number'] < oldest:
+                    continue
+                counts = [a + b for a, b in zip(counts, slot['counts'])]
+                count += slot['count']
+                total += slot['sum']
+        return {'buckets': list(zip(self.buckets + (None,), counts)),
+                'count': count, 'sum': total}
+
+    def percentile(self, fraction, now=None):
+        """Верхняя граница корзины, в которую попал перцентиль."""
+        snapshot = self.snapshot(now)
+        if not snapshot['count']:
+            return None
+        rank = fraction * snapshot['count']
+        seen = 0
+        for bound, count in snapshot['buckets']:
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+
+class ViewStats:
+    """Скользящая статистика одного представления."""
+    METRICS = ('wall_ms', 'db_ms', 'template_ms', 'queries')
+
+    def __init__(self, window):
+        self.histograms = {metric: RollingHistogram(window)
+                           for metric in self.METRICS}
+        self.n_plus_one = RollingHistogram(window, buckets=())
+
+    def observe(self, record):
+        for metric, histogram in self.histograms.items():
+            histogram.observe(record[metric])
+        if record['n_plus_one']:
+            self.n_plus_one.observe(len(record['n_plus_one']))
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def view_stats(view_name):
+    with _stats_lock:
+        if view_name not in _stats:
+            _stats[view_name] = ViewStats(histogram_window())
+        return _stats[view_name]
+
+
+def stats_snapshot():
+    """{представление: {метрика: snapshot()}, 'n_plus_one': число}."""
+    with _stats_lock:
+        items = list(_stats.items())
+    return {
+        view_name: {
+            **{metric: histogram.snapshot()
+               for metric, histogram in stats.histograms.items()},
+            'n_plus_one': stats.n_plus_one.snapshot()['count'],
+        }
+        for view_name, stats in sorted(items)
+    }
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class RequestProfile:
+
+    def __init__(self, request=None):
+        self.request = request
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.queries = 0
+        self.shapes = Counter()
+        self.shape_time = defaultdict(float)
+        # Время по timed(): cache, thumbnail
+        self.timings = defaultdict(float)
+        self.timing_depth = Counter()
+        # Шаблоны, которые сейчас отрисовываются
+        self.templates = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            shape = query_shape(sql)
+            self.db_time += duration
+            self.queries += 1
+            self.shapes[shape] += 1
+            self.shape_time[shape] += duration
+            if duration * 1000 >= slow_queries.threshold_ms():
+                self.slow_query(context['connection'], sql, params, many,
+                                duration)
+
+    def slow_query(self, connection, sql, params, many, duration):
+        match = getattr(self.request, 'resolver_match', None)
+        slow_queries.record(
+            connection, sql, None if many else params, duration,
+            view=match.view_name if match else None,
+            template=self.templates[-1] if self.templates else None)
+
+    def repeated_queries(self, threshold):
+        return [
+            {'sql': shape, 'count': count,
+             'ms': round(self.shape_time[shape] * 1000, 2)}
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+    def record(self, request, response):
+        match = request.resolver_match
+        return {
+            'time': timezone.now().isoformat(),
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'wall_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_ms': round(self.timings['cache'] * 1000, 2),
+            'thumbnail_ms': round(self.timings['thumbnail'] * 1000, 2),
+            'queries': self.queries,
+            'n_plus_one': self.repeated_queries(n_plus_one_threshold()),
+        }
+
+
+def current_profile():
+    """Замеры текущего запроса или None вне RequestProfileMiddleware."""
+    return getattr(_current, 'profile', None)
+
+
+def record_template_time(seconds):
+    profile = current_profile()
+    if profile is not None:
+        profile.template_time += seconds
+
+
+@contextmanager
+def rendering(template_name):
+    """Запросы внутри блока относятся к шаблону template_name."""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    profile.templates.append(template_name)
+    try:
+        yield
+    finally:
+        profile.templates.pop()
+
+
+@contextmanager
+def timed(metric):
+    """Добавляет время блока к замеру metric текущего запроса.
+
+    Вложенные блоки того же замера не суммируются: get_many кеша,
+    вызывающий get, считается один раз.
+    """
+    profile = current_profile()
+    if profile is None or profile.timing_depth[metric]:
+        yield
+        return
+    profile.timing_depth[metric] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.timings[metric] += time.perf_counter() - start
+        profile.timing_depth[metric] -= 1
+
+
+def server_timing_header(record):
+    entries = [
+        f'db;dur={record["db_ms"]};desc="SQL ({record["queries"]})"',
+        f'render;dur={record["template_ms"]}',
+        f'cache;dur={record["cache_ms"]}',
+        f'thumbnail;dur={record["thumbnail_ms"]}',
+        f'total;dur={record["wall_ms"]}',
+    ]
+    return ', '.join(entries)
+
+
+def _write_log(record):
+    global _log_handler
+    path = getattr(settings, 'REQUEST_PROFILING_LOG', None)
+    if not path:
+        return
+    path = os.path.abspath(path)
+    with _log_lock:
+        if _log_handler is None or _log_handler.baseFilename != path:
+            if _log_handler is not None:
+                log_records.removeHandler(_log_handler)
+                _log_handler.close()
+            _log_handler = RotatingFileHandler(
+                path,
+                maxBytes=getattr(settings, 'REQUEST_PROFILING_LOG_MAX_BYTES',
+                                 10 * 1024 * 1024),
+                backupCount=getattr(settings,
+                                    'REQUEST_PROFILING_LOG_BACKUPS', 5),
+                delay=True,
+            )
+            log_records.addHandler(_log_handler)
+            log_records.setLevel(logging.INFO)
+    log_records.info(json.dumps(record, ensure_ascii=False))
+
+
+class RequestProfileMiddleware:
+    """Замеряет запрос; ставится первым, чтобы учесть остальные
+    middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling_enabled():
+            return self.get_response(request)
+        profile = _current.profile = RequestProfile(request)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.profile = None
+        record = profile.record(request, response)
+        request.profile_record = record
+        if record['view']:
+            view_stats(record['view']).observe(record)
+        metrics.record_request(record)
+        if record['n_plus_one']:
+            logger.warning('Повторяющиеся запросы в %s: %s', record['view'],
+                           '; '.join(f'{item["count"]} x {item["sql"]}'
+                                     for item in record['n_plus_one']))
+        _write_log(record)
+        if server_timing(request):
+            response['Server-Timing'] = server_timing_header(record)
+        return response
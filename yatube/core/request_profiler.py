@@ -0,0 +1,124 @@
+"""Профиль одного запроса по требованию сотрудника.
+
+К любому адресу добавляется параметр REQUEST_PROFILER_PARAM:
+
+* ?_profile - статистический профиль: отдельный поток каждые
+  REQUEST_PROFILER_INTERVAL секунд снимает стек потока запроса.
+  Файл .folded - свернутые стеки ("a;b;c 12") для flamegraph.pl,
+  speedscope и подобных инструментов;
+* ?_profile=cprofile - детерминированный профиль cProfile, файл
+  .prof для pstats и snakeviz.
+
+Ссылка на файл приходит в заголовке X-Profile. Запросы без параметра
+и запросы не сотрудников проходят без всяких замеров.
+"""
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from django.conf import settings
+from django.urls import reverse
+
+NAME_RE = re.compile(r'^[\w.-]+\.(folded|prof)$')
+
+
+def profiler_param():
+    return getattr(settings, 'REQUEST_PROFILER_PARAM', '_profile')
+
+
+def profiler_dir():
+    return getattr(settings, 'REQUEST_PROFILER_DIR',
+                   os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def sample_interval():
+    return getattr(settings, 'REQUEST_PROFILER_INTERVAL', 0.001)
+
+
+def profile_path(name):
+    """Путь к файлу профиля или None для чужого имени."""
+    if not NAME_RE.match(name):
+        return None
+    return os.path.join(profiler_dir(), name)
+
+
+class StackSampler:
+    """Снимает стек одного потока с заданным интервалом."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return (f'{code.co_name} ({os.path.basename(code.co_filename)}'
+                f':{code.co_firstlineno})')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in self.stacks.most_common())
+
+
+def _file_name(request, extension):
+    match = request.resolver_match
+    view = match.view_name.replace(':', '-') if match else 'request'
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return f'{stamp}-{view}-{uuid.uuid4().hex[:8]}.{extension}'
+
+
+class StaffProfilerMiddleware:
+    """Ставится после AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        param = profiler_param()
+        if (param not in request.META.get('QUERY_STRING', '')
+                or param not in request.GET
+                or not request.user.is_staff):
+            return self.get_response(request)
+        os.makedirs(profiler_dir(), exist_ok=True)
+        if request.GET[param] == 'cprofile':
+            profiler = cProfile.Profile()
+            response = profiler.runcall(self.get_response, request)
+            name = _file_name(request, 'prof')
+            profiler.dump_stats(os.path.join(profiler_dir(), name))
+        else:
+            sampler = StackSampler(threading.get_ident(), sample_interval())
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop()
+            name = _file_name(request, 'folded')
+            with open(os.path.join(profiler_dir(), name), 'w') as file:
+                file.write(sampler.folded())
+        response['X-Profile'] = request.build_absolute_uri(
+            reverse('core:download_profile', kwargs={'name': name}))
+        return response
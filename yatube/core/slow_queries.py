@@ -0,0 +1,164 @@
+"""Журнал медленных SQL-запросов.
+
+Запрос дольше SLOW_QUERY_MS миллисекунд с вероятностью
+SLOW_QUERY_SAMPLE_RATE попадает в файл SQLite SLOW_QUERY_LOG, общий
+для всех воркеров. Запросы объединяются по отпечатку - тексту без
+параметров и литералов, поэтому страницы ленты с разными OFFSET
+и IN любой длины - одна запись. Для самого медленного случая
+хранятся представление, шаблон, в котором выполнялся запрос
+(ленивые queryset'ы часто читаются при отрисовке), и EXPLAIN,
+снятый в тот же момент на том же соединении.
+
+Журнал смотрят командой slow_queries; пишется он только внутри
+запросов через RequestProfileMiddleware (core.profiling).
+"""
+import hashlib
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+# Список значений IN (%s, %s, ...) любой длины - один отпечаток
+PLACEHOLDERS_RE = re.compile(r'%s(?:, %s)+')
+# Строки и числа, которые Django подставляет в текст (LIMIT, OFFSET)
+LITERALS_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+EXPLAIN_PREFIXES = {'sqlite': 'EXPLAIN QUERY PLAN '}
+# Когда более медленное выполнение заменяет view и template записи:
+# если оно шло при отрисовке шаблона или шаблон еще не известен
+PLACE_CONDITION = ('excluded.max_ms > max_ms AND (excluded.template '
+                   'IS NOT NULL OR template IS NULL)')
+
+_local = threading.local()
+
+
+def log_path():
+    return getattr(settings, 'SLOW_QUERY_LOG', None)
+
+
+def threshold_ms():
+    return getattr(settings, 'SLOW_QUERY_MS', 100)
+
+
+def sample_rate():
+    return getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0)
+
+
+def normalize(sql):
+    """Текст запроса без параметров и литералов."""
+    return LITERALS_RE.sub('?', PLACEHOLDERS_RE.sub('%s', sql))
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode()).hexdigest()
+
+
+def _db():
+    path = log_path()
+    connection = getattr(_local, 'connection', None)
+    if connection is None or _local.path != path:
+        connection = sqlite3.connect(path, timeout=10, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS slow_queries ('
+            'fingerprint TEXT PRIMARY KEY, sql TEXT NOT NULL, '
+            'view TEXT, template TEXT, plan TEXT NOT NULL, '
+            'count INTEGER NOT NULL, total_ms REAL NOT NULL, '
+            'max_ms REAL NOT NULL, first_seen REAL NOT NULL, '
+            'last_seen REAL NOT NULL)'
+        )
+        _local.connection, _local.path = connection, path
+    return connection
+
+
+def explain(connection, sql, params):
+    """План запроса на том же соединении, в обход execute_wrapper."""
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor, 'EXPLAIN ')
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    except DatabaseError as error:
+        return f'EXPLAIN не выполнен: {error}'
+    finally:
+        cursor.close()
+    # В SQLite описание шага - последний столбец строки плана
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def record(connection, sql, params, duration, view, template):
+    """Учитывает медленный запрос; EXPLAIN - только если он медленнее
+    всех прежних с тем же отпечатком.
+
+    Пара view и template берется от самого медленного выполнения
+    при отрисовке шаблона, а пока такого не было - от самого
+    медленного вообще: один и тот же запрос часто выполняется
+    и в коде представления, и из шаблона, и место в шаблоне не должно
+    теряться из-за более медленного выполнения вне его.
+    """
+    if not log_path() or random.random() >= sample_rate():
+        return
+    milliseconds = duration * 1000
+    key = fingerprint(sql)
+    now = time.time()
+    try:
+        db = _db()
+        row = db.execute('SELECT max_ms FROM slow_queries '
+                         'WHERE fingerprint = ?', (key,)).fetchone()
+        if row is not None and row[0] >= milliseconds:
+            db.execute(
+                'UPDATE slow_queries SET count = count + 1, '
+                'total_ms = total_ms + ?, last_seen = ?, '
+                'view = CASE WHEN template IS NULL AND ? IS NOT NULL '
+                'THEN ? ELSE view END, '
+                'template = COALESCE(template, ?) '
+                'WHERE fingerprint = ?',
+                (milliseconds, now, template, view, template, key))
+            return
+        plan = (explain(connection, sql, params)
+                if sql.lstrip()[:6].upper() == 'SELECT' else '')
+        db.execute(
+            'INSERT INTO slow_queries VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?) '
+            'ON CONFLICT (fingerprint) DO UPDATE SET '
+            'count = count + 1, total_ms = total_ms + excluded.total_ms, '
+            'last_seen = excluded.last_seen, '
+            # Другой воркер мог успеть записать случай медленнее
+            f'view = CASE WHEN {PLACE_CONDITION} '
+            'THEN excluded.view ELSE view END, '
+            f'template = CASE WHEN {PLACE_CONDITION} '
+            'THEN excluded.template ELSE template END, '
+            'plan = CASE WHEN excluded.max_ms > max_ms '
+            'THEN excluded.plan ELSE plan END, '
+            'max_ms = MAX(max_ms, excluded.max_ms)',
+            (key, normalize(sql), view, template, plan, milliseconds,
+             milliseconds, now, now))
+    except sqlite3.Error:
+        logger.exception('Не удалось записать медленный запрос в %s',
+                         log_path())
+
+
+def top(limit=20, view=None):
+    """Записи журнала по убыванию суммарного времени."""
+    if not log_path():
+        return []
+    query = 'SELECT * FROM slow_queries'
+    params = []
+    if view:
+        query += ' WHERE view = ?'
+        params.append(view)
+    query += ' ORDER BY total_ms DESC LIMIT ?'
+    params.append(limit)
+    cursor = _db().execute(query, params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def clear():
+    if log_path():
+        _db().execute('DELETE FROM slow_queries')
@@ -1,5 +1,34 @@
-from django.test import TestCase
+import os
+import shutil
+import socketserver
+import json
+import pstats
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import sqlite3
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.contrib.auth import get_user_model
+from django.urls import ResolverMatch, reverse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
 from http import HTTPStatus
+from posts.models import Post
+from .cache_backends import LocMemCache, RedisCache, SQLiteCache
+from .checks import check_production, debug_instrumentation
+from . import metrics, profiling, slow_queries
+from .db import DEFAULT_PRAGMAS, apply_pragmas, sqlite_pragmas
+from .db_router import (PIN_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware,
+                        replica_reads)
 
 
 class ViewTestClass(TestCase):
@@ -14,3 +43,754 @@ class ViewTestClass(TestCase):
             'не соответствует ожиданиям'
         )
         self.assertTemplateUsed(response, template)
+
+
+class SQLiteCacheTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 0}},
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_add_incr(self):
+        """Базовые операции кеша работают."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertEqual(self.cache.incr('counter'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('expired', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('expired'))
+
+    def test_shared_between_instances(self):
+        """Два экземпляра с одним файлом видят одни данные."""
+        other = SQLiteCache(self.cache.location, {})
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_lru_eviction_and_stats(self):
+        """При переполнении вытесняются давно не читавшиеся записи."""
+        for i in range(3):
+            self.cache.set(f'key{i}', i)
+            # разное время последнего чтения
+            self.cache._db.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                (i, self.cache.make_key(f'key{i}')))
+        self.cache.set('key3', 3)
+        self.assertIsNone(self.cache.get('key0'))
+        self.assertEqual(self.cache.get('key3'), 3)
+        stats = self.cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertGreaterEqual(stats['misses'], 1)
+
+
+class RedisStandIn(socketserver.StreamRequestHandler):
+    """Минимальный сервер с протоколом Redis для проверки клиента."""
+    data = {}
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def bulk(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def command_get(self, args):
+        return self.bulk(self.data.get(args[1]))
+
+    def command_set(self, args):
+        if b'NX' in args[3:] and args[1] in self.data:
+            return b'$-1\r\n'
+        self.data[args[1]] = args[2]
+        return b'+OK\r\n'
+
+    def command_mget(self, args):
+        return b'*%d\r\n' % (len(args) - 1) + b''.join(
+            self.bulk(self.data.get(key)) for key in args[1:])
+
+    def command_exists(self, args):
+        return b':%d\r\n' % (args[1] in self.data)
+
+    def command_incrby(self, args):
+        value = int(self.data.get(args[1], b'0')) + int(args[2])
+        self.data[args[1]] = b'%d' % value
+        return b':' + self.data[args[1]] + b'\r\n'
+
+    def command_del(self, args):
+        return b':%d\r\n' % (self.data.pop(args[1], None) is not None)
+
+    def command_flushdb(self, args):
+        self.data.clear()
+        return b'+OK\r\n'
+
+    def command_multi(self, args):
+        self.queued = []
+        return b'+OK\r\n'
+
+    def command_exec(self, args):
+        queued, self.queued = self.queued, None
+        return b'*%d\r\n' % len(queued) + b''.join(
+            self.execute(command) for command in queued)
+
+    COMMANDS = {
+        b'GET': command_get, b'SET': command_set, b'MGET': command_mget,
+        b'EXISTS': command_exists, b'INCRBY': command_incrby,
+        b'DEL': command_del, b'FLUSHDB': command_flushdb,
+        b'MULTI': command_multi, b'EXEC': command_exec,
+    }
+
+    def execute(self, args):
+        command = self.COMMANDS.get(args[0].upper())
+        if command is None:
+            return b'-ERR unknown command\r\n'
+        return command(self, args)
+
+    def handle(self):
+        self.queued = None
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            if self.queued is not None and args[0].upper() != b'EXEC':
+                self.queued.append(args)
+                self.wfile.write(b'+QUEUED\r\n')
+                continue
+            self.wfile.write(self.execute(args))
+
+
+class RedisCacheTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), RedisStandIn)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever,
+                         daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_protocol_round_trip(self):
+        """Клиент RESP читает и пишет значения и счетчики."""
+        host, port = RedisCacheTests.server.server_address
+        cache = RedisCache(f'redis://{host}:{port}/0', {})
+        cache.clear()
+        cache.set('key', ['value'])
+        self.assertEqual(cache.get('key'), ['value'])
+        self.assertTrue(cache.add('counter', 1))
+        self.assertFalse(cache.add('counter', 5))
+        self.assertEqual(cache.incr('counter', 2), 3)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        self.assertFalse(cache.has_key('missing'))
+        self.assertEqual(cache.get_many(['key', 'counter', 'missing']),
+                         {'key': ['value'], 'counter': 3})
+        cache.delete('key')
+        self.assertIsNone(cache.get('key'))
+
+
+class SQLiteTuningTests(TestCase):
+
+    def test_pragmas_applied_to_connections(self):
+        """PRAGMA из настроек выполняются на соединении Django."""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0],
+                             sqlite_pragmas()['busy_timeout'])
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0],
+                             sqlite_pragmas()['cache_size'])
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -1000,
+                                       'mmap_size': None})
+    def test_setting_overrides_defaults(self):
+        pragmas = sqlite_pragmas()
+        self.assertEqual(pragmas['cache_size'], -1000)
+        self.assertNotIn('mmap_size', pragmas)
+        self.assertEqual(pragmas['journal_mode'],
+                         DEFAULT_PRAGMAS['journal_mode'])
+
+    def test_wal_on_file_database(self):
+        """Файловая база переключается в режим WAL."""
+        directory = tempfile.mkdtemp()
+        try:
+            db = sqlite3.connect(os.path.join(directory, 'db.sqlite3'))
+            apply_pragmas(db, sqlite_pragmas())
+            mode = db.execute('PRAGMA journal_mode').fetchone()[0]
+            db.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.assertEqual(mode, 'wal')
+
+    def test_benchmark_command(self):
+        """Команда benchmark_sqlite выводит результаты обоих режимов."""
+        out = StringIO()
+        call_command('benchmark_sqlite', seconds=0.2, readers=1, writers=1,
+                     rows=50, stdout=out)
+        self.assertEqual(out.getvalue().count('чтений'), 2)
+
+
+class SQLiteTransactionModeTests(TransactionTestCase):
+
+    def test_atomic_begins_immediate(self):
+        """atomic() сразу берет блокировку на запись."""
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            with transaction.atomic():
+                pass
+        self.assertIn('BEGIN IMMEDIATE', queries)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.used = []
+
+    def run_view(self, method, request, marked=True):
+        def view(request):
+            return method(request)
+        if marked:
+            view = replica_reads(view)
+        middleware = ReplicaRoutingMiddleware(
+            lambda request: middleware.process_view(request, view, (), {})
+            or view(request))
+        return middleware(request)
+
+    def reading_view(self, request):
+        self.used.append(self.router.db_for_read(None))
+        return HttpResponse()
+
+    def writing_view(self, request):
+        self.used.append(self.router.db_for_write(None))
+        self.used.append(self.router.db_for_read(None))
+        return HttpResponse()
+
+    def test_marked_view_reads_from_replica(self):
+        """Помеченное представление читает с реплики, остальные - нет."""
+        self.run_view(self.reading_view, self.factory.get('/'))
+        self.run_view(self.reading_view, self.factory.get('/'), marked=False)
+        self.assertEqual(self.used, ['replica_1', 'default'])
+        self.assertEqual(self.router.db_for_read(None), 'default')
+
+    def test_write_pins_user_to_default(self):
+        """После записи чтение идет из default, ставится cookie."""
+        response = self.run_view(self.writing_view,
+                                 self.factory.get('/'))
+        self.assertEqual(self.used, ['default', 'default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+
+    def test_pinned_user_reads_from_default(self):
+        """С cookie закрепления реплика не используется."""
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        response = self.run_view(self.reading_view, request)
+        self.assertEqual(self.used, ['default'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica_1', 'posts'))
+        self.assertIsNone(self.router.allow_migrate('default', 'posts'))
+
+
+# Основная база и реплика - два файла; реплика - снимок основной,
+# после которого в основную записан еще один пост
+REPLICA_SCRIPT = """
+import json, os, sqlite3, django
+django.setup()
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client
+from core.db_router import PIN_COOKIE
+from posts.models import Post, User
+
+call_command('migrate', verbosity=0)
+author = User.objects.create_user(username='auth')
+Post.objects.create(author=author, text='Есть на реплике')
+connections.close_all()
+primary = sqlite3.connect(os.environ['YATUBE_DB_NAME'])
+replica = sqlite3.connect(os.environ['YATUBE_DB_REPLICAS'])
+primary.backup(replica)
+primary.close()
+replica.close()
+Post.objects.create(author=author, text='Только в основной')
+
+client = Client()
+counts = [len(client.get('/api/posts/').json()['results'])]
+client.cookies[PIN_COOKIE] = '1'
+counts.append(len(client.get('/api/posts/').json()['results']))
+print(json.dumps(counts))
+"""
+
+
+class ReplicaDatabaseTests(SimpleTestCase):
+
+    def test_reads_hit_replica_file_unless_pinned(self):
+        """Лента читается из файла реплики, закрепленный пользователь
+        читает из основной базы."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        env = {**os.environ,
+               'DJANGO_SETTINGS_MODULE': 'yatube.settings',
+               'YATUBE_DB_NAME': os.path.join(directory, 'primary.sqlite3'),
+               'YATUBE_DB_REPLICAS': os.path.join(directory,
+                                                  'replica.sqlite3')}
+        result = subprocess.run(
+            [sys.executable, '-c', REPLICA_SCRIPT], cwd=settings.BASE_DIR,
+            env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), [1, 2])
+
+
+class ProductionSettingsTests(SimpleTestCase):
+
+    def test_prod_refuses_debug_instrumentation(self):
+        """prod не запускается, если загружен debug_toolbar."""
+        self.assertIn('debug_toolbar в INSTALLED_APPS',
+                      debug_instrumentation())
+        with override_settings(YATUBE_ENV='prod'):
+            with self.assertRaises(ImproperlyConfigured):
+                check_production()
+        check_production()
+
+    def test_prod_settings_boot_without_toolbar(self):
+        """Боевые настройки загружаются без отладочных инструментов."""
+        env = {**os.environ, 'YATUBE_ENV': 'prod',
+               'YATUBE_SECRET_KEY': 'test-secret-key'}
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        script = (
+            'import os, sys, django; '
+            'os.environ["DJANGO_SETTINGS_MODULE"] = "yatube.settings"; '
+            'django.setup(); '
+            'from django.conf import settings; '
+            'print(settings.DEBUG, "debug_toolbar" in sys.modules, '
+            'settings.TEMPLATES[0]["OPTIONS"]["loaders"][0][0])'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, check=True)
+        self.assertEqual(
+            result.stdout.split(),
+            ['False', 'False', 'django.template.loaders.cached.Loader'])
+
+
+class RequestProfilingTests(TestCase):
+
+    def setUp(self):
+        profiling.reset_stats()
+        self.addCleanup(profiling.reset_stats)
+
+    def run_view(self, view):
+        request = RequestFactory().get('/repeated/')
+        request.resolver_match = ResolverMatch(view, (), {},
+                                               url_name='repeated')
+        profiling.RequestProfileMiddleware(view)(request)
+        return request.profile_record
+
+    def test_view_stats(self):
+        """Время, запросы и отрисовка шаблонов собираются по имени
+        представления."""
+        self.client.get('/')
+        stats = profiling.stats_snapshot()['posts:index']
+        self.assertEqual(stats['wall_ms']['count'], 1)
+        self.assertGreater(stats['queries']['sum'], 0)
+        self.assertGreater(stats['template_ms']['sum'], 0)
+        self.assertEqual(stats['n_plus_one'], 0)
+
+    def test_repeated_queries_are_flagged(self):
+        """Одинаковые запросы с разными параметрами - признак N+1,
+        списки IN любой длины считаются одним видом запроса."""
+        User = get_user_model()
+
+        def view(request):
+            for pk in range(5):
+                User.objects.filter(pk=pk).exists()
+            User.objects.filter(pk__in=[1, 2]).exists()
+            User.objects.filter(pk__in=[1, 2, 3]).exists()
+            return HttpResponse()
+
+        with self.assertLogs('core.profiling', 'WARNING'):
+            record = self.run_view(view)
+        self.assertEqual(record['queries'], 7)
+        self.assertEqual([item['count'] for item in record['n_plus_one']],
+                         [5])
+        self.assertEqual(
+            profiling.stats_snapshot()['repeated']['n_plus_one'], 1)
+
+    def test_rotating_jsonl_log(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'profile.jsonl')
+        with override_settings(REQUEST_PROFILING_LOG=path,
+                               REQUEST_PROFILING_LOG_MAX_BYTES=500,
+                               REQUEST_PROFILING_LOG_BACKUPS=2):
+            for _ in range(3):
+                self.client.get('/')
+        profiling._log_handler.close()
+        with open(path) as file:
+            record = json.loads(file.readline())
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertTrue(os.path.exists(path + '.1'))
+
+    def test_rolling_histogram_forgets_old_values(self):
+        histogram = profiling.RollingHistogram(window=60)
+        histogram.observe(3, now=0)
+        histogram.observe(300, now=55)
+        histogram.observe(7000, now=59)
+        self.assertEqual(histogram.snapshot(now=59)['count'], 3)
+        self.assertEqual(histogram.percentile(0.5, now=59), 500)
+        snapshot = histogram.snapshot(now=61)
+        self.assertEqual(snapshot['count'], 2)
+        self.assertEqual(snapshot['buckets'][-1], (None, 1))
+
+
+class ServerTimingTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.staff = User.objects.create_user(username='staff',
+                                             is_staff=True)
+        cls.user = User.objects.create_user(username='NoName')
+
+    def test_header_only_for_staff_by_default(self):
+        with override_settings(SERVER_TIMING='staff'):
+            self.assertFalse(self.client.get('/').has_header('Server-Timing'))
+            self.client.force_login(ServerTimingTests.user)
+            self.assertFalse(self.client.get('/').has_header('Server-Timing'))
+            self.client.force_login(ServerTimingTests.staff)
+            header = self.client.get('/')['Server-Timing']
+        for entry in ('db;dur=', 'render;dur=', 'cache;dur=',
+                      'thumbnail;dur=', 'total;dur='):
+            with self.subTest(entry=entry):
+                self.assertIn(entry, header)
+
+    def test_cache_time_is_measured_once(self):
+        """Время кеша считается по внешней операции: get_many,
+        вызывающий get, не удваивает замер."""
+        backend = LocMemCache('server-timing', {})
+        profiles = []
+
+        def view(request):
+            profile = profiling.current_profile()
+            backend.set('key', 1)
+            backend.get_many(['key', 'missing'])
+            profiles.append((dict(profile.timings),
+                             dict(profile.timing_depth)))
+            return HttpResponse()
+
+        profiling.RequestProfileMiddleware(view)(RequestFactory().get('/'))
+        timings, depth = profiles[0]
+        self.assertGreater(timings['cache'], 0)
+        self.assertEqual(depth['cache'], 0)
+        self.assertEqual(backend.stats()['hits'], 1)
+        self.assertEqual(backend.stats()['misses'], 1)
+
+
+class StaffProfilerTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.staff = User.objects.create_user(username='staff',
+                                             is_staff=True)
+        cls.user = User.objects.create_user(username='NoName')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(REQUEST_PROFILER_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory
+
+    def test_staff_gets_flame_graph_profile(self):
+        """?_profile дает сотруднику свернутые стеки запроса."""
+        self.client.force_login(StaffProfilerTests.staff)
+
+        def slow_render(*args, **kwargs):
+            # Запрос заведомо дольше интервала: поток сэмплера успевает
+            # снять стек и на быстрой машине
+            time.sleep(0.05)
+            return render(*args, **kwargs)
+
+        with mock.patch('posts.views.render', slow_render):
+            response = self.client.get('/', {'_profile': ''})
+        self.assertEqual(response.status_code, 200)
+        url = response['X-Profile']
+        self.assertIn('posts-index', url)
+        download = self.client.get(url)
+        folded = b''.join(download.streaming_content).decode()
+        download.close()
+        stack, count = folded.splitlines()[0].rsplit(' ', 1)
+        self.assertIn(';', stack)
+        self.assertGreater(int(count), 0)
+
+    def test_cprofile_mode(self):
+        self.client.force_login(StaffProfilerTests.staff)
+        response = self.client.get('/', {'_profile': 'cprofile'})
+        name = response['X-Profile'].rstrip('/').rsplit('/', 1)[1]
+        stats = pstats.Stats(os.path.join(self.directory, name))
+        self.assertTrue(any(function == 'index'
+                            for _, _, function in stats.stats))
+
+    def test_profile_is_staff_only(self):
+        self.client.force_login(StaffProfilerTests.user)
+        response = self.client.get('/', {'_profile': ''})
+        self.assertFalse(response.has_header('X-Profile'))
+        self.assertEqual(os.listdir(self.directory), [])
+        self.client.force_login(StaffProfilerTests.staff)
+        response = self.client.get(reverse(
+            'core:download_profile', kwargs={'name': '..passwd.prof'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = get_user_model().objects.create_user(username='staff',
+                                                         is_staff=True)
+
+    def setUp(self):
+        # Чистый реестр: счетчики процесса копятся с начала прогона
+        self.addCleanup(setattr, metrics, '_registry', metrics._registry)
+        metrics._registry = metrics.Registry()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(METRICS_DIR=directory,
+                                              METRICS_TOKEN='secret')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory
+
+    def scrape(self, **headers):
+        response = self.client.get(
+            '/metrics', **{'HTTP_AUTHORIZATION': 'Bearer secret', **headers})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_request_latency_and_queries_by_url_name(self):
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('about:author'))
+        text = self.scrape()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram',
+                      text)
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="posts:index"} 1', text)
+        self.assertIn('yatube_request_duration_seconds_bucket'
+                      '{view="about:author",le="+Inf"} 1', text)
+        self.assertIn('yatube_db_queries_total{view="posts:index"}', text)
+        # Сам /metrics и служебные адреса не учитываются
+        self.assertNotIn('view="metrics"', text)
+
+    def test_cache_thumbnail_and_reaction_counters(self):
+        backend = LocMemCache('metrics-test', {})
+        backend.get('missing')
+        backend.set('present', 1)
+        backend.get('present')
+        metrics.inc('yatube_thumbnails_total', {'status': 'done'})
+        metrics.inc('yatube_reaction_writes_total', {'mode': 'direct'})
+        text = self.scrape()
+        self.assertIn('yatube_cache_hits_total{backend="LocMemCache"} 1',
+                      text)
+        self.assertIn('yatube_cache_misses_total{backend="LocMemCache"} 1',
+                      text)
+        self.assertIn('yatube_thumbnails_total{status="done"} 1', text)
+        self.assertIn('yatube_reaction_writes_total{mode="direct"} 1', text)
+
+    def test_values_are_summed_across_processes(self):
+        """Значения завершившегося процесса берутся из METRICS_DIR."""
+        metrics.inc('yatube_thumbnails_total', {'status': 'done'}, 2)
+        env = {**os.environ, 'YATUBE_METRICS_DIR': self.directory,
+               'DJANGO_SETTINGS_MODULE': 'yatube.settings'}
+        script = (
+            'import django; django.setup(); '
+            'from core import metrics; '
+            'metrics.inc("yatube_thumbnails_total", {"status": "done"}, 3); '
+            'metrics.observe("yatube_request_duration_seconds", 0.02, '
+            '{"view": "posts:index"})'
+        )
+        subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR,
+                       env=env, check=True)
+        metrics.observe('yatube_request_duration_seconds', 3,
+                        {'view': 'posts:index'})
+        text = metrics.exposition()
+        self.assertIn('yatube_thumbnails_total{status="done"} 5', text)
+        self.assertIn('yatube_request_duration_seconds_bucket'
+                      '{view="posts:index",le="0.025"} 1', text)
+        self.assertIn('yatube_request_duration_seconds_bucket'
+                      '{view="posts:index",le="5"} 2', text)
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="posts:index"} 2', text)
+
+    def test_dead_process_files_are_merged(self):
+        """Файлы завершившихся процессов сливаются в один, счетчики
+        при этом не уменьшаются."""
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+
+        def write(name, value):
+            with open(os.path.join(self.directory, name), 'w') as file:
+                json.dump({'counters': [['yatube_thumbnails_total',
+                                         {'status': 'done'}, value]],
+                           'histograms': []}, file)
+
+        write(f'{process.pid}-1.json', 2)
+        write(f'{process.pid}-1.json.tmp', 100)
+        alive = f'{os.getpid()}-1.json'
+        write(alive, 1)
+        self.assertIn('yatube_thumbnails_total{status="done"} 3',
+                      metrics.exposition())
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory)
+                   if name.endswith(('.json', '.tmp'))),
+            [alive, metrics.DEAD_FILE])
+        write(f'{process.pid}-2.json', 3)
+        self.assertIn('yatube_thumbnails_total{status="done"} 6',
+                      metrics.exposition())
+        self.assertEqual(metrics.prune_dead(self.directory), 0)
+
+    def test_metrics_access(self):
+        """Локальный адрес без токена не пускается: за прокси с него
+        приходят все запросы."""
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'},
+                        {'HTTP_AUTHORIZATION': 'secret'},
+                        {'HTTP_X_FORWARDED_FOR': '127.0.0.1'}):
+            with self.subTest(headers=headers):
+                response = self.client.get('/metrics',
+                                           REMOTE_ADDR='127.0.0.1', **headers)
+                self.assertEqual(response.status_code, 403)
+        with override_settings(METRICS_TOKEN=None):
+            response = self.client.get('/metrics',
+                                       HTTP_AUTHORIZATION='Bearer ')
+            self.assertEqual(response.status_code, 403)
+            self.client.force_login(MetricsTests.staff)
+            self.scrape()
+
+
+class SlowQueryLogTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = get_user_model().objects.create_user(username='NoName')
+        Post.objects.create(author=cls.user, text='Найденный текст')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # Порог 0 - медленным считается каждый запрос
+        settings_override = override_settings(
+            SLOW_QUERY_LOG=os.path.join(directory, 'slow.sqlite3'),
+            SLOW_QUERY_MS=0, SLOW_QUERY_SAMPLE_RATE=1.0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_fingerprint_ignores_parameters_and_literals(self):
+        self.assertEqual(
+            slow_queries.fingerprint(
+                'SELECT * FROM t WHERE id IN (%s, %s) LIMIT 10 OFFSET 20'),
+            slow_queries.fingerprint(
+                'SELECT * FROM t WHERE id IN (%s) LIMIT 10 OFFSET 30'))
+        self.assertNotEqual(slow_queries.fingerprint('SELECT a FROM t'),
+                            slow_queries.fingerprint('SELECT b FROM t'))
+
+    def test_queries_logged_with_view_template_and_plan(self):
+        self.client.force_login(SlowQueryLogTests.user)
+        self.client.get(reverse('posts:search'), {'q': 'текст'})
+        self.client.get(reverse('posts:search'), {'q': 'другой'})
+        self.client.get(reverse('posts:follow_index'))
+        entries = slow_queries.top(limit=1000)
+        fingerprints = [entry['fingerprint'] for entry in entries]
+        self.assertEqual(len(fingerprints), len(set(fingerprints)))
+        self.assertEqual(entries, sorted(
+            entries, key=lambda entry: entry['total_ms'], reverse=True))
+        views = {entry['view'] for entry in entries}
+        self.assertTrue({'posts:search', 'posts:follow_index'} <= views)
+        # Одинаковые запросы двух поисков - одна запись
+        self.assertTrue(any(entry['view'] == 'posts:search'
+                            and entry['count'] >= 2 for entry in entries))
+        # Найденные посты читаются только при отрисовке шаблона, и место
+        # в шаблоне не зависит от того, какое выполнение было медленнее
+        self.assertIn(('posts:search', 'posts/search.html'),
+                      {(entry['view'], entry['template'])
+                       for entry in entries})
+        selects = [entry for entry in entries
+                   if entry['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for entry in selects:
+            self.assertRegex(entry['plan'], r'SCAN|SEARCH|USE|CONSTANT')
+
+    def test_slower_hit_without_template_keeps_attribution(self):
+        sql = 'SELECT * FROM posts_post WHERE id = %s'
+        slow_queries.record(connection, sql, [1], 0.002, 'posts:index',
+                            'posts/index.html')
+        slow_queries.record(connection, sql, [2], 0.005, None, None)
+        slow_queries.record(connection, sql, [3], 0.001, 'posts:profile',
+                            'posts/profile.html')
+        entry, = slow_queries.top()
+        self.assertEqual(
+            (entry['count'], entry['max_ms'], entry['view'],
+             entry['template']),
+            (3, 5.0, 'posts:index', 'posts/index.html'))
+        # Без известного шаблона место берется и от более быстрого случая
+        slow_queries.clear()
+        slow_queries.record(connection, sql, [1], 0.005, None, None)
+        slow_queries.record(connection, sql, [2], 0.001, 'posts:index',
+                            'posts/index.html')
+        entry, = slow_queries.top()
+        self.assertEqual((entry['view'], entry['template']),
+                         ('posts:index', 'posts/index.html'))
+
+    def test_sampling(self):
+        with override_settings(SLOW_QUERY_SAMPLE_RATE=0):
+            self.client.get(reverse('posts:index'))
+        self.assertEqual(slow_queries.top(), [])
+
+    def test_command_ranks_by_total_time(self):
+        self.client.get(reverse('posts:index'))
+        out = StringIO()
+        call_command('slow_queries', '--limit', '2', '--view', 'posts:index',
+                     stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('1. '))
+        self.assertIn('представление: posts:index', out.getvalue())
+        self.assertNotIn('3. ', out.getvalue())
+        call_command('slow_queries', '--clear', stdout=StringIO())
+        self.assertEqual(slow_queries.top(), [])
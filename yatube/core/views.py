@@ -1,4 +1,13 @@
+import hmac
+import os
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
+from django.views.decorators.cache import never_cache
+from .metrics import exposition
+from .request_profiler import profile_path
 
 
 def page_not_found(request, exception):
@@ -20,3 +29,36 @@ def server_error(request):
 def permission_denied(request, exception):
     template = 'core/403.html'
     return render(request, template, status=403)
+
+
+@staff_member_required
+def download_profile(request, name):
+    path = profile_path(name)
+    if path is None or not os.path.exists(path):
+        raise Http404('Профиль не найден')
+    return FileResponse(open(path, 'rb'), as_attachment=True,
+                        filename=name)
+
+
+def metrics_token_valid(request):
+    """Заголовок Authorization: Bearer <METRICS_TOKEN>."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, value = request.META.get(
+        'HTTP_AUTHORIZATION', '').partition(' ')
+    if not token or scheme.lower() != 'bearer':
+        return False
+    return hmac.compare_digest(value.strip().encode(), token.encode())
+
+
+@never_cache
+def metrics(request):
+    """Метрики для Prometheus: сотрудникам и по токену METRICS_TOKEN.
+
+    Адрес клиента не проверяется: за прокси на том же сервере
+    все запросы приходят с 127.0.0.1.
+    """
+    if not (request.user.is_staff or metrics_token_valid(request)):
+        raise PermissionDenied
+    return HttpResponse(exposition(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
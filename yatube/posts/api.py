@@ -0,0 +1,162 @@
+"""JSON API лент только для чтения.
+
+Те же выборки, что у HTML-страниц index, group_posts, profile
+и post_detail, без отрисовки шаблонов. Параметр fields выбирает поля
+поста (fields=id,text,author): из базы читаются только нужные
+столбцы. Ленты листаются курсором (ссылки next и previous), limit -
+размер страницы. Неизменившиеся ленты отдаются ответом 304 по ETag
+или Last-Modified (см. posts.conditional).
+"""
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from core.db_router import replica_reads
+from .conditional import (
+    conditional, group_validators, index_validators, post_detail_validators,
+    profile_validators
+)
+from .models import Comment, Group, Post, User
+from .paginators import CursorPaginator
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+# Поле API -> (столбцы для only(), связь для select_related, значение)
+POST_FIELDS = {
+    'id': (('id',), None, lambda post: post.pk),
+    'text': (('text',), None, lambda post: post.text),
+    'pub_date': (('pub_date',), None,
+                 lambda post: post.pub_date.isoformat()),
+    'author': (('author', 'author__username'), 'author',
+               lambda post: post.author.username),
+    'group': (('group', 'group__slug'), 'group',
+              lambda post: post.group.slug if post.group else None),
+    'image': (('image',), None,
+              lambda post: post.image.url if post.image else None),
+    'thumbnail': (('thumbnail_url',), None,
+                  lambda post: post.thumbnail_url or None),
+    'likes': (('likes_count',), None, lambda post: post.likes_count),
+    'dislikes': (('dislikes_count',), None,
+                 lambda post: post.dislikes_count),
+}
+# Столбцы сортировки нужны курсору всегда
+CURSOR_COLUMNS = ('id', 'pub_date')
+# Клиенты API держат ленту открытой и опрашивают ее: каждый раз
+# переспрашивают сервер, а неизменившаяся лента стоит один 304
+CACHE_CONTROL = {'no_cache': True}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def requested_fields(request):
+    value = request.GET.get('fields')
+    if not value:
+        return list(POST_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = sorted(set(fields) - set(POST_FIELDS))
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(unknown)}. '
+                         f'Доступны: {", ".join(POST_FIELDS)}')
+    return fields
+
+
+def requested_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('limit должен быть числом')
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def select_fields(queryset, fields):
+    """Ограничивает выборку столбцами запрошенных полей."""
+    columns = set(CURSOR_COLUMNS)
+    related = set()
+    for name in fields:
+        field_columns, relation, _ = POST_FIELDS[name]
+        columns.update(field_columns)
+        if relation:
+            related.add(relation)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+def serialize_post(post, fields):
+    return {name: POST_FIELDS[name][2](post) for name in fields}
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'author': comment.author.username,
+        'text': comment.text,
+        'quote': comment.hidden_text,
+        'created': comment.created.isoformat(),
+        'parent': comment.comment_p_id,
+        'depth': comment.depth,
+    }
+
+
+def page_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return request.build_absolute_uri(f'?{query.urlencode()}')
+
+
+def error_response(error):
+    return JsonResponse({'error': str(error)}, status=400,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def feed_response(request, queryset):
+    try:
+        fields = requested_fields(request)
+        limit = requested_limit(request)
+    except BadRequest as error:
+        return error_response(error)
+    paginator = CursorPaginator(select_fields(queryset, fields), limit)
+    page = paginator.get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [serialize_post(post, fields) for post in page],
+        'next': page_url(request, page.next_cursor),
+        'previous': page_url(request, page.previous_cursor),
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@replica_reads
+@conditional(index_validators, **CACHE_CONTROL)
+def index(request):
+    return feed_response(request, Post.objects.all())
+
+
+@replica_reads
+@conditional(group_validators, **CACHE_CONTROL)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(request, group.posts.all())
+
+
+@replica_reads
+@conditional(profile_validators, **CACHE_CONTROL)
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_response(request, author.posts.all())
+
+
+@replica_reads
+@conditional(post_detail_validators, **CACHE_CONTROL)
+def post_detail(request, post_id):
+    try:
+        fields = requested_fields(request)
+    except BadRequest as error:
+        return error_response(error)
+    post = get_object_or_404(
+        select_fields(Post.objects.all(), fields), pk=post_id)
+    comments = Comment.objects.thread(post).select_related('author')
+    return JsonResponse({
+        'post': serialize_post(post, fields),
+        'comments': [serialize_comment(comment) for comment in comments],
+    }, json_dumps_params={'ensure_ascii': False})
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     name = "posts"
     verbose_name = "Редактирование сообщений"
+
+    def ready(self):
+        from PIL import Image
+        from . import signals  # noqa: F401
+        from .uploads import max_image_pixels
+        # Pillow откажется открывать файл с вдвое большим числом пикселей
+        Image.MAX_IMAGE_PIXELS = max_image_pixels()
@@ -0,0 +1,135 @@
+"""Условные ответы (ETag, Last-Modified, 304) для лент и постов.
+
+Валидаторы считаются дешевле страницы: один MAX(pub_date) или
+MAX(created) по индексу и версии лент из feed_cache, которые
+меняются при любой правке поста, комментария или реакции. Поэтому
+ETag меняется и тогда, когда новых постов нет, а изменился, например,
+счетчик лайков. Last-Modified - время самого нового поста
+или комментария.
+"""
+import hashlib
+from calendar import timegm
+from functools import wraps
+from django.db.models import Count, Max
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, quote_etag
+)
+from django.utils.http import http_date
+from .feed_cache import (
+    INDEX_SCOPE, get_versions, group_scope, post_scopes, profile_scope
+)
+from .models import Follow, Group, Post, User
+from .reaction_buffer import pending_reactions
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def feed_validators(queryset, *scopes):
+    """(ETag, Last-Modified) ленты queryset, показанной на scopes."""
+    latest = queryset.aggregate(latest=Max('pub_date'))['latest']
+    return make_etag(latest, *get_versions(scopes)), latest
+
+
+def post_validators(post_id):
+    """(ETag, Last-Modified) поста с комментариями - одним запросом."""
+    post = Post.objects.filter(pk=post_id).values(
+        'pub_date', 'author_id', 'group_id').annotate(
+        latest_comment=Max('comments__created')).first()
+    if post is None:
+        return None
+    last_modified = max(filter(None, (post['pub_date'],
+                                      post['latest_comment'])))
+    scopes = post_scopes(post['author_id'], post['group_id'])
+    return (make_etag(post_id, post['pub_date'], post['latest_comment'],
+                      *get_versions(scopes)),
+            last_modified)
+
+
+def index_validators(request):
+    return feed_validators(Post.objects.all(), INDEX_SCOPE)
+
+
+def group_validators(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return None
+    return feed_validators(Post.objects.filter(group_id=group_id),
+                           group_scope(group_id))
+
+
+def profile_validators(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    return feed_validators(Post.objects.filter(author_id=author_id),
+                           profile_scope(author_id))
+
+
+def post_detail_validators(request, post_id):
+    return post_validators(post_id)
+
+
+def follow_validators(request):
+    """Лента подписок: меняется и при подписке или отписке."""
+    follows = Follow.objects.filter(user=request.user).aggregate(
+        count=Count('pk'), last=Max('pk'))
+    etag, last_modified = feed_validators(
+        Post.objects.filter(author__following__user=request.user),
+        INDEX_SCOPE)
+    return make_etag(etag, follows['count'], follows['last']), last_modified
+
+
+def per_user(validators):
+    """Валидаторы HTML-страницы: в шапке и формах есть данные
+    пользователя, поэтому ETag у каждого свой. Он меняется и после
+    клика по реакции, которая еще лежит в буфере."""
+    def user_validators(request, *args, **kwargs):
+        result = validators(request, *args, **kwargs)
+        if result is None:
+            return None
+        etag, last_modified = result
+        user = request.user.pk if request.user.is_authenticated else 'anon'
+        return (make_etag(etag, user,
+                          *sorted(pending_reactions(request).items())),
+                last_modified)
+    return user_validators
+
+
+def conditional(validators, **cache_control):
+    """Отвечает 304 на GET и HEAD, если валидаторы совпали с присланными.
+
+    validators(request, *args, **kwargs) возвращает (etag,
+    last_modified) или None, если их не вычислить (например, объекта
+    нет) - тогда представление просто вызывается. Представление
+    и шаблоны при 304 не выполняются. cache_control передается
+    в patch_cache_control для ответов 200 и 304.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            etag, last_modified = (
+                validators(request, *args, **kwargs) or (None, None))
+            etag = quote_etag(etag) if etag else None
+            timestamp = (timegm(last_modified.utctimetuple())
+                         if last_modified else None)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            if etag and not response.has_header('ETag'):
+                response['ETag'] = etag
+            if timestamp and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(timestamp)
+            if cache_control:
+                patch_cache_control(response, **cache_control)
+            return response
+        return wrapper
+    return decorator
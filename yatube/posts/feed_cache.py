@@ -0,0 +1,89 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'feed:version:{}'
+INDEX_SCOPE = 'index'
+
+
+def feed_cache_timeout():
+    return getattr(settings, 'POSTS_FEED_CACHE_TIMEOUT', 300)
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def profile_scope(author_id):
+    return f'profile:{author_id}'
+
+
+def post_scopes(author_id, group_id):
+    """Ленты, на которых показывается пост."""
+    scopes = [INDEX_SCOPE, profile_scope(author_id)]
+    if group_id:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def _initial_version():
+    # Версия из времени: если ключ версии вытеснят из кеша, новая
+    # все равно окажется больше всех прежних
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys
+               if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, 0) for key in keys]
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), None)
+
+
+def invalidate(*scopes):
+    """Сбрасывает закешированные страницы лент.
+
+    Версия увеличивается сразу и еще раз после коммита транзакции:
+    страница, отрисованная параллельным запросом по незакоммиченным
+    еще данным, не переживет вторую смену версии.
+    """
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def feed_cache_context(request, *scopes):
+    """Контекст для {% cache %} вокруг списка постов.
+
+    Ключ фрагмента включает версии лент, параметры запроса (номер
+    страницы или курсор) и пользователя: в карточках есть отметки
+    и ссылки, зависящие от того, кто смотрит. Реакции пользователя,
+    еще не записанные из буфера (request.pending_reactions
+    из reaction_buffer), тоже входят в ключ: счетчики с ними
+    отрисовываются в отдельный фрагмент.
+    """
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    pending = getattr(request, 'pending_reactions', None)
+    if pending:
+        user = f'{user}:' + hashlib.md5(
+            repr(sorted(pending.items())).encode()).hexdigest()
+    versions = '.'.join(map(str, get_versions(scopes)))
+    return {
+        'feed_cache_key': f'{":".join(scopes)}:{versions}:{query}:{user}',
+        'feed_cache_timeout': feed_cache_timeout(),
+    }
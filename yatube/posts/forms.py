@@ -1,6 +1,10 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import Textarea
+from django.template.defaultfilters import filesizeformat
 from .models import Post, Comment
+from .uploads import max_upload_size, prepare_image
 
 
 class PostForm(forms.ModelForm):
@@ -8,6 +12,28 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('group', 'text', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Файл сверх предела LimitedUploadHandler уже отбросил,
+        # до ImageField и Pillow он не доходит
+        self.oversized_image = None
+        image = self.files.get('image')
+        if getattr(image, 'oversized', False):
+            self.files = self.files.copy()
+            self.files.pop('image')
+            self.oversized_image = image
+
+    def clean_image(self):
+        if self.oversized_image is not None:
+            raise ValidationError(
+                f'Размер файла не должен превышать '
+                f'{filesizeformat(max_upload_size())}'
+            )
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            image = prepare_image(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from posts.models import Comment, Follow, Group, Post
+from posts.query_plans import check_plans, view_querysets
+
+
+class Command(BaseCommand):
+    help = ('Проверяет EXPLAIN QUERY PLAN запросов лент: без полного '
+            'просмотра таблиц и сортировки во временном B-дереве')
+
+    def handle(self, *args, **options):
+        follow = Follow.objects.first()
+        group = Group.objects.first()
+        post = (Comment.objects.select_related('post').first()
+                or Post.objects.first())
+        if not (follow and group and post):
+            raise CommandError(
+                'Для проверки нужны подписка, группа и пост в базе')
+        post = getattr(post, 'post', post)
+        report = check_plans(view_querysets(
+            follow.user, group, post.author, post))
+        failed = []
+        for name, (plan, problems) in report.items():
+            if options['verbosity'] > 1 or problems:
+                self.stdout.write(f'{name}:\n{plan}\n')
+            if problems:
+                failed.append(name)
+        if failed:
+            raise CommandError('Запросы без подходящего индекса: '
+                               + ', '.join(failed))
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено запросов: {len(report)}, все используют индексы'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from posts.reaction_buffer import flush
+
+
+class Command(BaseCommand):
+    help = ('Записывает в базу реакции из файлового буфера '
+            '(POSTS_REACTIONS_BUFFER)')
+
+    def handle(self, *args, **options):
+        flushed = flush()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано реакций: {flushed}'
+        ))
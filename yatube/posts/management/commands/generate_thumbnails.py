@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand
+from posts.models import ThumbnailJob
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Строит миниатюры картинок постов: задания из очереди '
+            'и картинки, загруженные до появления очереди')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Число параллельных потоков'
+        )
+        parser.add_argument(
+            '--retry-failed', action='store_true',
+            help='Повторить задания, завершившиеся ошибкой'
+        )
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Не завершаться, а проверять очередь каждые --interval секунд'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2,
+            help='Пауза между проверками очереди в режиме --watch'
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            ThumbnailJob.objects.filter(status=ThumbnailJob.FAILED).update(
+                status=ThumbnailJob.PENDING, attempts=0)
+        added = thumbnails.enqueue_missing()
+        while True:
+            requeued = thumbnails.requeue_stale()
+            done = thumbnails.drain(options['workers'])
+            if not options['watch']:
+                break
+            if done or requeued:
+                self.stdout.write(f'Готово миниатюр: {done}')
+            time.sleep(options['interval'])
+        failed = ThumbnailJob.objects.filter(
+            status=ThumbnailJob.FAILED).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Новых заданий: {added}, возвращено в очередь: {requeued}, '
+            f'готово миниатюр: {done}, с ошибкой: {failed}'
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from posts.search import REBUILD_BATCH_SIZE, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Пересоздает поисковый индекс постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=REBUILD_BATCH_SIZE,
+            help='Сколько постов индексировать за одну транзакцию'
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {total}'
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from posts.models import Follow, TimelineEntry
+from posts.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = 'Заполняет и исправляет ленты подписок пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя, можно указать несколько раз'
+        )
+
+    def handle(self, *args, **options):
+        users = options['users'] or sorted(
+            set(Follow.objects.values_list('user', flat=True))
+            | set(TimelineEntry.objects.values_list('user', flat=True))
+        )
+        added = removed = 0
+        for user_id in users:
+            user_added, user_removed = rebuild_timeline(user_id)
+            added += user_added
+            removed += user_removed
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено записей: {added}, удалено: {removed}'
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from posts.services import repair_reaction_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики лайков и дизлайков у постов'
+
+    def handle(self, *args, **options):
+        repaired = repair_reaction_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено постов: {repaired}'
+        ))
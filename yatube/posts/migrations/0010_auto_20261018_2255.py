@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:55
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_reaction_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    for field, model_name in (('likes_count', 'Like'),
+                              ('dislikes_count', 'Dislike')):
+        model = apps.get_model('posts', model_name)
+        counts = model.objects.filter(post=OuterRef('pk')).order_by(
+        ).values('post').annotate(total=Count('pk')).values('total')
+        Post.objects.update(**{field: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_auto_20221224_1908'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество дизлайков'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество лайков'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='hidden_text',
+            field=models.TextField(blank=True, default=None, help_text='Отредактируйте цитату при необходимости', null=True, verbose_name='Цитата'),
+        ),
+        migrations.RunPython(fill_reaction_counters,
+                             migrations.RunPython.noop),
+    ]
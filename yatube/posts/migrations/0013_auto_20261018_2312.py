@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+def fill_comment_paths(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    children = {}
+    for pk, parent in Comment.objects.values_list('pk', 'comment_p'):
+        children.setdefault(parent, []).append(pk)
+    level = [(pk, '', 0) for pk in children.get(None, [])]
+    updated = []
+    while level:
+        next_level = []
+        for pk, parent_path, depth in level:
+            path = parent_path + str(pk).zfill(10)
+            updated.append(Comment(pk=pk, path=path, depth=depth))
+            next_level.extend((child, path, depth + 1)
+                              for child in children.get(pk, []))
+        level = next_level
+    Comment.objects.bulk_update(updated, ('path', 'depth'), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_auto_20261018_2300'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень вложенности'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.RunPython(fill_comment_paths, migrations.RunPython.noop),
+    ]
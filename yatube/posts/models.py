@@ -1,7 +1,9 @@
+import json
 from datetime import datetime
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.db.models import SET_NULL
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -45,20 +47,142 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        storage=ContentAddressedStorage(),
+        blank=True,
+        db_index=True
+    )
+    thumbnail_url = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        verbose_name="Адрес миниатюры"
+    )
+    image_renditions = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name="Варианты картинки"
+    )
+    likes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Количество лайков"
+    )
+    dislikes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Количество дизлайков"
     )
-
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def renditions(self):
+        """Варианты картинки для srcset (см. posts.thumbnails)."""
+        try:
+            return json.loads(self.image_renditions or '{}')
+        except ValueError:
+            return {}
+
     class Meta:
         verbose_name = "Сообщение"
         verbose_name_plural = "Сообщения"
         ordering = ['-pub_date', 'pk']
+        # Под сортировку лент: страница читается из индекса по порядку,
+        # без сортировки во временном B-дереве
+        indexes = (
+            models.Index(fields=('-pub_date', 'id'),
+                         name='post_pub_date_idx'),
+            models.Index(fields=('author', '-pub_date', 'id'),
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=('group', '-pub_date', 'id'),
+                         name='post_group_pub_date_idx'),
+        )
+
+
+class ThumbnailJob(models.Model):
+    """Задание на построение миниатюры картинки поста.
+
+    Очередь хранится в базе и переживает перезапуск сервера:
+    незавершенные задания дорабатывает команда generate_thumbnails.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="thumbnail_job",
+        verbose_name="Пост"
+    )
+    image = models.CharField(max_length=255, verbose_name="Картинка")
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True,
+        verbose_name="Состояние"
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Попыток"
+    )
+    error = models.CharField(max_length=255, blank=True,
+                             verbose_name="Ошибка")
+    updated = models.DateTimeField(auto_now=True, verbose_name="Изменено")
+
+    def __str__(self):
+        return f'{self.image} ({self.status})'
+
+    class Meta:
+        verbose_name = "Задание на миниатюру"
+        verbose_name_plural = "Задания на миниатюры"
+        ordering = ['pk']
+
+
+class CommentQuerySet(models.QuerySet):
+    """Выборки веток комментариев по материализованному пути.
+
+    Все методы - один запрос с диапазонным условием по индексу
+    (post, path), порядок по path - обход дерева в глубину.
+    """
+
+    def thread(self, post):
+        return self.filter(post=post).order_by('path')
+
+    def subtree(self, comment):
+        return self.filter(
+            post_id=comment.post_id,
+            path__gte=comment.path,
+            path__lt=comment.path + Comment.PATH_END,
+        ).order_by('path')
+
+    def max_depth(self, depth):
+        return self.filter(depth__lte=depth)
+
+    def move_subtree(self, old_path, new_path, depth_delta):
+        """Переносит потомков узла со старым путем под новый путь."""
+        descendants = list(self.filter(
+            path__gt=old_path, path__lt=old_path + Comment.PATH_END
+        ))
+        for comment in descendants:
+            comment.path = new_path + comment.path[len(old_path):]
+            comment.depth += depth_delta
+        self.bulk_update(descendants, ('path', 'depth'), batch_size=500)
 
 
 class Comment(models.Model):
+    # Путь - id предков и самого комментария, по PATH_STEP цифр на уровень
+    PATH_STEP = 10
+    PATH_END = ':'  # следующий после '9' символ
+    MAX_DEPTH = 25
+
     hidden_text = models.TextField(
         default=None,
         blank=True,
@@ -97,14 +221,52 @@ class Comment(models.Model):
         verbose_name="Комментарий",
         help_text='Комментарий, к которому будет относиться комментарий'
     )
+    path = models.CharField(
+        max_length=255,
+        default='',
+        editable=False,
+        verbose_name="Путь в ветке"
+    )
+    depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Уровень вложенности"
+    )
+
+    objects = CommentQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
+    def build_path(self):
+        own = str(self.pk).zfill(self.PATH_STEP)
+        if self.comment_p_id is None:
+            return own, 0
+        parent = self.comment_p
+        return parent.path + own, parent.depth + 1
+
+    def save(self, *args, **kwargs):
+        """Сохраняет комментарий и поддерживает путь его ветки."""
+        super().save(*args, **kwargs)
+        path, depth = self.build_path()
+        if path == self.path:
+            return
+        old_path, old_depth = self.path, self.depth
+        self.path, self.depth = path, depth
+        Comment.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        if old_path:
+            Comment.objects.move_subtree(old_path, path, depth - old_depth)
+
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         ordering = ['-created', 'pk']
+        indexes = (
+            models.Index(fields=('post', 'path'),
+                         name='comment_post_path_idx'),
+            models.Index(fields=('post', '-created', 'id'),
+                         name='comment_post_created_idx'),
+        )
 
 
 class Follow(models.Model):
@@ -132,6 +294,41 @@ class Follow(models.Model):
         ]
 
 
+class TimelineEntry(models.Model):
+    """Пост в ленте подписок пользователя (fan-out при публикации)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="Подписчик"
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name="Пост"
+    )
+    # Копия Post.pub_date: лента читается одним проходом по индексу
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Ленты подписок"
+        ordering = ['-pub_date', 'post']
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', 'post'),
+                name='timeline_user_pub_date_idx'
+            ),
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post',),
+                name='unique_timeline_entry'
+            ),
+        )
+
+
 class Like(models.Model):
     post = models.ForeignKey(
         Post, on_delete=models.CASCADE, related_name="like"
@@ -164,3 +361,25 @@ class Dislike(models.Model):
                 name='unique_dislike'
             ),
         )
+
+
+class SearchTerm(models.Model):
+    """Строка инвертированного индекса поиска: слово -> пост."""
+    term = models.CharField(max_length=64, verbose_name="Слово")
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="search_terms",
+        verbose_name="Пост"
+    )
+    weight = models.PositiveIntegerField(default=1, verbose_name="Вес")
+
+    class Meta:
+        verbose_name = "Слово поискового индекса"
+        verbose_name_plural = "Поисковый индекс"
+        constraints = (
+            models.UniqueConstraint(
+                fields=('term', 'post',),
+                name='unique_search_term'
+            ),
+        )
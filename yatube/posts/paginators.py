@@ -0,0 +1,185 @@
+import base64
+import binascii
+import hashlib
+import json
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# До этого числа строк считаем точно, дальше берем число из кеша
+EXACT_COUNT_LIMIT = 1000
+COUNT_CACHE_TIMEOUT = 60
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator без COUNT(*) по всей выборке на каждый запрос.
+
+    Если общее число известно заранее (например, счетчик постов автора),
+    оно передается в count. Небольшие выборки считаются точно через
+    COUNT с LIMIT, а для больших результат COUNT(*) кешируется
+    на COUNT_CACHE_TIMEOUT секунд, так что ссылки на глубокие страницы
+    остаются, а полный подсчет выполняется не чаще раза за этот срок.
+    """
+
+    def __init__(self, object_list, per_page, count=None,
+                 exact_limit=EXACT_COUNT_LIMIT,
+                 timeout=COUNT_CACHE_TIMEOUT, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.known_count = count
+        self.exact_limit = exact_limit
+        self.timeout = timeout
+
+    def count_cache_key(self):
+        query = str(self.object_list.order_by().query)
+        return 'paginator:count:' + hashlib.md5(query.encode()).hexdigest()
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        probe = self.object_list.order_by()[:self.exact_limit + 1].count()
+        if probe <= self.exact_limit:
+            return probe
+        key = self.count_cache_key()
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, self.timeout)
+        return count
+
+
+class CursorPage:
+    """Страница курсорного паджинатора.
+
+    Ведет себя как последовательность постов и отдает непрозрачные
+    токены соседних страниц вместо номеров.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-паджинатор по полям сортировки queryset.
+
+    Каждая страница - один запрос вида WHERE (pub_date, pk) за курсором
+    LIMIT per_page + 1, без COUNT(*) и OFFSET, поэтому глубокие страницы
+    открываются так же быстро, как первая. Поля сортировки должны
+    однозначно упорядочивать строки, по умолчанию берется сортировка
+    queryset, а без нее - Meta.ordering модели (для Post это
+    ('-pub_date', 'pk')). Сортировать можно и по аннотациям.
+    """
+    NEXT = 'n'
+    PREVIOUS = 'p'
+
+    def __init__(self, object_list, per_page, ordering=None):
+        model = object_list.model
+        self.ordering = tuple(ordering or object_list.query.order_by
+                              or model._meta.ordering)
+        self.object_list = object_list.order_by(*self.ordering)
+        self.per_page = int(per_page)
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-'),
+             self._field(object_list, name.lstrip('-')))
+            for name in self.ordering
+        ]
+
+    @staticmethod
+    def _field(object_list, name):
+        """Поле модели или аннотации, по которому идет сортировка."""
+        annotation = object_list.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        if name == 'pk':
+            return object_list.model._meta.pk
+        return object_list.model._meta.get_field(name)
+
+    def encode_cursor(self, obj, direction):
+        values = []
+        for name, _, _ in self.fields:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat')
+                          else value)
+        raw = json.dumps([direction] + values).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, значения полей) или None для
+        испорченного курсора."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, *values = json.loads(raw.decode())
+            if (direction not in (self.NEXT, self.PREVIOUS)
+                    or len(values) != len(self.fields)):
+                return None
+            values = [field.to_python(value)
+                      for (_, _, field), value in zip(self.fields, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+        return direction, values
+
+    def _beyond(self, values, backwards):
+        """Q-условие "строго после" (или "строго до") набора значений
+        в порядке сортировки паджинатора."""
+        condition = Q()
+        equal = Q()
+        for (name, descending, _), value in zip(self.fields, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_page(self, cursor=None):
+        decoded = self.decode_cursor(cursor) if cursor else None
+        limit = self.per_page + 1
+        if decoded is None:
+            rows = list(self.object_list[:limit])
+            has_more, has_before = len(rows) > self.per_page, False
+        elif decoded[0] == self.NEXT:
+            rows = list(self.object_list.filter(
+                self._beyond(decoded[1], backwards=False))[:limit])
+            has_more, has_before = len(rows) > self.per_page, True
+        else:
+            rows = list(self.object_list.filter(
+                self._beyond(decoded[1], backwards=True)
+            ).reverse()[:limit])
+            has_before = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_more = True
+        rows = rows[:self.per_page]
+        next_cursor = previous_cursor = None
+        if rows and has_more:
+            next_cursor = self.encode_cursor(rows[-1], self.NEXT)
+        if rows and has_before:
+            previous_cursor = self.encode_cursor(rows[0], self.PREVIOUS)
+        return CursorPage(rows, self, next_cursor, previous_cursor)
@@ -0,0 +1,81 @@
+"""Проверка планов запросов лент (EXPLAIN QUERY PLAN в SQLite).
+
+Страница ленты должна читаться из индекса в нужном порядке: полный
+просмотр таблицы (SCAN TABLE без индекса) или сортировка во временном
+B-дереве (USE TEMP B-TREE) означают, что на большой базе запрос
+будет перебирать все строки.
+
+Поиск и лента подписок без материализованной ленты (POSTS_TIMELINE =
+False) проверяются тоже, но сортировка во временном B-дереве у них
+ожидаема: порядок поиска - вычисляемый ранг, а лента подписок
+сливает посты многих авторов. Сортируются только найденные строки,
+полного просмотра таблиц быть не должно.
+"""
+import re
+from .models import Comment, Post
+from .paginators import CursorPaginator
+from .search import search_posts, tokenize
+from .timeline import timeline_posts
+
+PAGE_SIZE = 10
+FULL_SCAN_RE = re.compile(r'\bSCAN (TABLE )?\w+$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+def view_querysets(user, group, author, post):
+    """Запросы, которыми представления читают ленты и комментарии.
+
+    Возвращает {название: (queryset, паджинируется ли по курсору,
+    допустимые строки плана)}. Поисковый запрос - первое слово
+    текста post.
+    """
+    feed = Post.objects.select_related('group', 'author')
+    querysets = {
+        'index': (feed.all(), True, ()),
+        'group_posts': (group.posts.select_related('author').all(), True,
+                        ()),
+        'profile': (author.posts.all(), True, ()),
+        'follow_index': (timeline_posts(user), True, ()),
+        'follow_index (POSTS_TIMELINE = False)': (
+            feed.filter(author__following__user=user), True, (TEMP_SORT,)),
+        'post_detail': (Comment.objects.thread(post).select_related(
+            'author'), False, ()),
+    }
+    words = tokenize(post.text)
+    if words:
+        querysets['search'] = (search_posts(words[0], feed), False,
+                               (TEMP_SORT,))
+    return querysets
+
+
+def page_queries(name, queryset, cursor):
+    """Первая страница и, для лент, следующая страница по курсору."""
+    yield name, queryset[:PAGE_SIZE]
+    if not cursor:
+        return
+    paginator = CursorPaginator(queryset, PAGE_SIZE)
+    first = paginator.object_list.first()
+    if first is None:
+        return
+    _, values = paginator.decode_cursor(
+        paginator.encode_cursor(first, paginator.NEXT))
+    yield f'{name} (cursor)', paginator.object_list.filter(
+        paginator._beyond(values, backwards=False))[:PAGE_SIZE + 1]
+
+
+def plan_problems(plan):
+    """Строки плана с полным просмотром таблицы или временной сортировкой."""
+    return [line.strip() for line in plan.splitlines()
+            if TEMP_SORT in line or FULL_SCAN_RE.search(line.strip())]
+
+
+def check_plans(querysets):
+    """Возвращает {название запроса: (план, найденные проблемы)}."""
+    report = {}
+    for view_name, (queryset, cursor, allowed) in querysets.items():
+        for name, query in page_queries(view_name, queryset, cursor):
+            plan = query.explain()
+            report[name] = (plan, [
+                problem for problem in plan_problems(plan)
+                if not any(marker in problem for marker in allowed)])
+    return report
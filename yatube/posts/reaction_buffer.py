@@ -0,0 +1,399 @@
+"""Отложенная запись лайков и дизлайков.
+
+С POSTS_REACTIONS_BUFFER клик по реакции не пишет в Like/Dislike,
+а добавляет в буфер итоговое состояние пары (пользователь, пост):
+'like', 'dislike' или None. Буфер сбрасывается в базу одной
+транзакцией каждые POSTS_REACTIONS_FLUSH_MS миллисекунд или после
+POSTS_REACTIONS_FLUSH_EVENTS пар: bulk_create, удаление одним
+запросом и по одному UPDATE счетчиков на каждую разницу.
+
+Буфер 'memory' живет в процессе сервера и годится для одного
+процесса. Путь к файлу включает общий для всех воркеров буфер
+в формате JSONL под блокировкой flock. Повторная запись одних
+и тех же состояний ничего не меняет, поэтому сброс, прерванный
+падением процесса, можно просто повторить.
+
+Ответ на клик ставит cookie PENDING_COOKIE. Пока она есть,
+ReactionBufferMiddleware читает из буфера состояния пользователя,
+а представления накладывают их на счетчики постов (overlay_pending):
+свою реакцию пользователь видит сразу, хотя в базе ее еще нет.
+Когда буфер записан, middleware удаляет cookie.
+"""
+import atexit
+import json
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from core import metrics
+from .feed_cache import invalidate, post_scopes
+from .models import Dislike, Like, Post, User
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PENDING_COOKIE = 'reactions_pending'
+KINDS = {Like: 'like', Dislike: 'dislike'}
+MODELS = {kind: model for model, kind in KINDS.items()}
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+_timer = None
+_timer_lock = threading.Lock()
+
+
+def buffer_location():
+    """None - реакции пишутся сразу, 'memory' или путь к файлу."""
+    return getattr(settings, 'POSTS_REACTIONS_BUFFER', None)
+
+
+def flush_interval():
+    """Через сколько миллисекунд после клика сбрасывать буфер
+    (0 - только по числу событий и командой flush_reactions)."""
+    return getattr(settings, 'POSTS_REACTIONS_FLUSH_MS', 500)
+
+
+def flush_events():
+    return getattr(settings, 'POSTS_REACTIONS_FLUSH_EVENTS', 100)
+
+
+def stored_reaction(user_id, post_id):
+    """Реакция пользователя на пост, уже записанная в базу."""
+    for model, kind in KINDS.items():
+        if model.objects.filter(user_id=user_id, post_id=post_id).exists():
+            return kind
+    return None
+
+
+def next_state(user_id, post_id, kind, pending):
+    """Состояние после клика: повторный клик снимает реакцию,
+    противоположный - заменяет ее."""
+    key = (user_id, post_id)
+    current = (pending[key] if key in pending
+               else stored_reaction(user_id, post_id))
+    return None if current == kind else kind
+
+
+class MemoryBuffer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def record(self, user_id, post_id, kind):
+        """Добавляет клик, возвращает число пар в буфере."""
+        with self._lock:
+            self._pending[(user_id, post_id)] = next_state(
+                user_id, post_id, kind, self._pending)
+            return len(self._pending)
+
+    def pending_for(self, user_id):
+        """{post_id: состояние} еще не записанных реакций пользователя."""
+        with self._lock:
+            return {post_id: state for (user, post_id), state
+                    in self._pending.items() if user == user_id}
+
+    def flush(self, apply):
+        # Буфер заблокирован до конца записи: клик, пришедший во время
+        # сброса, должен увидеть уже записанное состояние
+        with self._lock:
+            pending = self._pending
+            if pending:
+                apply(pending)
+            self._pending = {}
+        return len(pending)
+
+
+class FileBuffer:
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise ImproperlyConfigured(
+                'Файловый буфер реакций требует fcntl.flock')
+        self.path = path
+
+    @contextmanager
+    def _locked(self):
+        with open(self.path, 'a+') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield file
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read(file):
+        file.seek(0)
+        pending = {}
+        for line in file:
+            try:
+                user_id, post_id, state = json.loads(line)
+            except ValueError:
+                # Недописанная строка процесса, упавшего при записи
+                continue
+            pending[(user_id, post_id)] = state
+        return pending
+
+    def record(self, user_id, post_id, kind):
+        with self._locked() as file:
+            pending = self._read(file)
+            state = next_state(user_id, post_id, kind, pending)
+            file.write(json.dumps([user_id, post_id, state]) + '\n')
+            file.flush()
+            pending[(user_id, post_id)] = state
+            return len(pending)
+
+    def pending_for(self, user_id):
+        with self._locked() as file:
+            pending = self._read(file)
+        return {post_id: state for (user, post_id), state
+                in pending.items() if user == user_id}
+
+    def flush(self, apply):
+        with self._locked() as file:
+            pending = self._read(file)
+            if pending:
+                apply(pending)
+            file.truncate(0)
+        return len(pending)
+
+
+def get_buffer():
+    location = buffer_location()
+    if not location:
+        return None
+    with _buffers_lock:
+        if location not in _buffers:
+            _buffers[location] = (MemoryBuffer() if location == 'memory'
+                                  else FileBuffer(location))
+        return _buffers[location]
+
+
+def stored_rows(keys):
+    """{(user_id, post_id): (kind, pk)} записанных реакций для пар keys."""
+    stored = {}
+    for model, kind in KINDS.items():
+        rows = model.objects.filter(
+            user_id__in={user_id for user_id, _ in keys},
+            post_id__in={post_id for _, post_id in keys},
+        ).values_list('pk', 'user_id', 'post_id')
+        for pk, user_id, post_id in rows:
+            if (user_id, post_id) in keys:
+                stored[(user_id, post_id)] = (kind, pk)
+    return stored
+
+
+def changes(states, stored):
+    """Что записать для перехода от stored к states: строки
+    на удаление {kind: [pk]}, на создание {kind: [объекты]}
+    и разница счетчиков {post_id: Counter}."""
+    removed = defaultdict(list)
+    created = defaultdict(list)
+    deltas = defaultdict(Counter)
+    for (user_id, post_id), state in states.items():
+        kind, pk = stored.get((user_id, post_id), (None, None))
+        if kind == state:
+            continue
+        if kind:
+            removed[kind].append(pk)
+            deltas[post_id][kind] -= 1
+        if state:
+            created[state].append(
+                MODELS[state](user_id=user_id, post_id=post_id))
+            deltas[post_id][state] += 1
+    return removed, created, deltas
+
+
+def _remove(removed):
+    # Одним DELETE без сбора объектов и сигналов на каждую строку:
+    # на реакции никто не ссылается, кеш лент сбрасывается один раз
+    for kind, pks in removed.items():
+        meta = MODELS[kind]._meta
+        placeholders = ', '.join(['%s'] * len(pks))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {connection.ops.quote_name(meta.db_table)} '
+                f'WHERE {connection.ops.quote_name(meta.pk.column)} '
+                f'IN ({placeholders})', pks)
+
+
+def _create(created):
+    for kind, objects in created.items():
+        MODELS[kind].objects.bulk_create(objects)
+
+
+def _update_counters(deltas):
+    """Один UPDATE на каждую разницу (лайки, дизлайки)."""
+    by_delta = defaultdict(list)
+    for post_id, delta in deltas.items():
+        by_delta[delta['like'], delta['dislike']].append(post_id)
+    for (likes, dislikes), post_ids in by_delta.items():
+        if likes or dislikes:
+            Post.objects.filter(pk__in=post_ids).update(
+                likes_count=F('likes_count') + likes,
+                dislikes_count=F('dislikes_count') + dislikes,
+            )
+
+
+def apply_states(states):
+    """Записывает итоговые состояния {(user_id, post_id): kind}.
+
+    Строки Like/Dislike, счетчики на Post и кеш лент меняются одной
+    транзакцией; сигналы на каждую строку не отправляются.
+    """
+    posts = {
+        post_id: (author_id, group_id)
+        for post_id, author_id, group_id in Post.objects.filter(
+            pk__in={post_id for _, post_id in states}
+        ).order_by().values_list('pk', 'author_id', 'group_id')
+    }
+    users = set(User.objects.filter(
+        pk__in={user_id for user_id, _ in states}
+    ).values_list('pk', flat=True))
+    # Посты и пользователи, удаленные до сброса, пропускаются
+    states = {key: state for key, state in states.items()
+              if key[0] in users and key[1] in posts}
+    if not states:
+        return
+    with transaction.atomic():
+        removed, created, deltas = changes(states, stored_rows(states))
+        _remove(removed)
+        _create(created)
+        metrics.inc('yatube_reaction_writes_total', {'mode': 'buffered'},
+                    sum(map(len, removed.values()))
+                    + sum(map(len, created.values())))
+        _update_counters(deltas)
+    scopes = set()
+    for post_id in deltas:
+        scopes.update(post_scopes(*posts[post_id]))
+    if scopes:
+        invalidate(*scopes)
+
+
+def flush():
+    """Сбрасывает буфер в базу, возвращает число записанных пар."""
+    reaction_buffer = get_buffer()
+    if reaction_buffer is None:
+        return 0
+    return reaction_buffer.flush(apply_states)
+
+
+def _flush_in_background():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    close_old_connections()
+    try:
+        flush()
+    except Exception:
+        logger.exception('Не удалось записать реакции из буфера')
+    finally:
+        close_old_connections()
+
+
+def _schedule_flush():
+    global _timer
+    interval = flush_interval()
+    if not interval:
+        return
+    with _timer_lock:
+        if _timer is None:
+            _timer = threading.Timer(interval / 1000, _flush_in_background)
+            _timer.daemon = True
+            _timer.start()
+
+
+def buffer_reaction(user, post_id, model):
+    """Кладет клик в буфер. False - буфер выключен, реакцию нужно
+    записать сразу (services.toggle_reaction)."""
+    reaction_buffer = get_buffer()
+    if reaction_buffer is None:
+        return False
+    pending = reaction_buffer.record(user.pk, post_id, KINDS[model])
+    if pending >= flush_events():
+        reaction_buffer.flush(apply_states)
+    else:
+        _schedule_flush()
+    return True
+
+
+@atexit.register
+def _flush_on_exit():
+    if _buffers:
+        _flush_in_background()
+
+
+def pending_reactions(request):
+    """{post_id: состояние} реакций пользователя, которые еще лежат
+    в буфере (их читает ReactionBufferMiddleware)."""
+    return getattr(request, 'pending_reactions', {})
+
+
+def pending_deltas(request, post_ids):
+    """{post_id: Counter} - на сколько изменятся счетчики постов
+    post_ids после записи реакций пользователя из буфера."""
+    states = {(request.user.pk, post_id): state for post_id, state
+              in pending_reactions(request).items() if post_id in post_ids}
+    if not states:
+        return {}
+    return changes(states, stored_rows(states))[2]
+
+
+def overlay_pending(request, posts):
+    """Показывает пользователю его реакции из буфера: поправляет
+    likes_count и dislikes_count у постов posts в памяти.
+
+    Без реакций в буфере posts не перебирается, чтобы не выполнять
+    запрос страницы, закешированной в шаблоне.
+    """
+    if not pending_reactions(request):
+        return
+    posts = list(posts)
+    deltas = pending_deltas(request, {post.pk for post in posts})
+    for post in posts:
+        delta = deltas.get(post.pk)
+        if delta:
+            post.likes_count += delta['like']
+            post.dislikes_count += delta['dislike']
+
+
+def overlay_pending_stats(request, author, stats):
+    """То же для сумм likes и dislikes в статистике автора
+    (services.get_profile_stats)."""
+    pending = pending_reactions(request)
+    if not pending:
+        return
+    post_ids = set(Post.objects.filter(
+        author=author, pk__in=pending).values_list('pk', flat=True))
+    for delta in pending_deltas(request, post_ids).values():
+        stats['likes'] += delta['like']
+        stats['dislikes'] += delta['dislike']
+
+
+class ReactionBufferMiddleware:
+    """Читает из буфера реакции пользователя, у которого есть cookie
+    PENDING_COOKIE, и удаляет cookie, когда буфер записан."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PENDING_COOKIE not in request.COOKIES:
+            return self.get_response(request)
+        reaction_buffer = get_buffer()
+        if reaction_buffer is not None and request.user.is_authenticated:
+            request.pending_reactions = reaction_buffer.pending_for(
+                request.user.pk)
+        response = self.get_response(request)
+        if (not pending_reactions(request)
+                and PENDING_COOKIE not in response.cookies):
+            response.delete_cookie(PENDING_COOKIE)
+        return response
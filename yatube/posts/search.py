@@ -0,0 +1,113 @@
+import re
+from collections import Counter
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .models import Post, SearchTerm
+
+TOKEN_RE = re.compile(r'\w+')
+TERM_MAX_LENGTH = SearchTerm._meta.get_field('term').max_length
+# Слова из запроса сверх этого числа игнорируются
+QUERY_MAX_TERMS = 8
+# Совпадение в названии группы или имени автора ценнее, чем в тексте
+FIELD_WEIGHTS = (
+    ('text', 1),
+    ('group_title', 3),
+    ('author_name', 2),
+)
+# Верхняя граница для поиска по префиксу диапазоном term >= p AND term < p+
+PREFIX_END = chr(0x10FFFF)
+REBUILD_BATCH_SIZE = 500
+
+
+def tokenize(text):
+    """Разбивает текст на слова в нижнем регистре."""
+    return [token[:TERM_MAX_LENGTH]
+            for token in TOKEN_RE.findall((text or '').lower())]
+
+
+def post_terms(post):
+    """Слова поста с весами: текст, название группы и имя автора."""
+    author = post.author
+    fields = {
+        'text': post.text,
+        'group_title': post.group.title if post.group_id else '',
+        'author_name': ' '.join((author.username, author.first_name,
+                                 author.last_name)),
+    }
+    weights = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for token in tokenize(fields[field]):
+            weights[token] += weight
+    return weights
+
+
+def _terms_for(post):
+    return [SearchTerm(term=term, post=post, weight=weight)
+            for term, weight in post_terms(post).items()]
+
+
+def index_post(post):
+    """Перестраивает записи индекса одного поста."""
+    with transaction.atomic():
+        SearchTerm.objects.filter(post=post).delete()
+        SearchTerm.objects.bulk_create(_terms_for(post))
+
+
+def index_posts(queryset, batch_size=REBUILD_BATCH_SIZE):
+    """Переиндексирует посты пачками, возвращает их число."""
+    queryset = queryset.select_related('author', 'group').order_by('pk')
+    total = 0
+    batch = []
+    for post in queryset.iterator(chunk_size=batch_size):
+        batch.append(post)
+        if len(batch) >= batch_size:
+            total += _index_batch(batch)
+            batch = []
+    if batch:
+        total += _index_batch(batch)
+    return total
+
+
+def _index_batch(posts):
+    with transaction.atomic():
+        SearchTerm.objects.filter(post__in=posts).delete()
+        SearchTerm.objects.bulk_create(
+            [term for post in posts for term in _terms_for(post)],
+            batch_size=REBUILD_BATCH_SIZE,
+        )
+    return len(posts)
+
+
+def rebuild_index(batch_size=REBUILD_BATCH_SIZE):
+    """Полностью пересоздает поисковый индекс."""
+    SearchTerm.objects.all().delete()
+    return index_posts(Post.objects.all(), batch_size)
+
+
+def _prefix(token):
+    return Q(term__gte=token, term__lt=token + PREFIX_END)
+
+
+def search_posts(query, queryset=None):
+    """Посты, в которых есть все слова запроса (по префиксу).
+
+    Каждое слово - диапазонный поиск по индексу term, без регулярных
+    выражений и полного просмотра таблицы постов. Результат отсортирован
+    по суммарному весу совпадений, затем по дате публикации.
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    tokens = list(dict.fromkeys(tokenize(query)))[:QUERY_MAX_TERMS]
+    if not tokens:
+        return queryset.none()
+    matched = Q()
+    for token in tokens:
+        queryset = queryset.filter(pk__in=SearchTerm.objects.filter(
+            _prefix(token)).values('post'))
+        matched |= _prefix(token)
+    rank = SearchTerm.objects.filter(matched, post=OuterRef('pk')).order_by(
+    ).values('post').annotate(total=Sum('weight')).values('total')
+    return queryset.annotate(
+        rank=Coalesce(Subquery(rank, output_field=IntegerField()), 0)
+    ).order_by('-rank', '-pub_date', 'pk')
@@ -0,0 +1,129 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import (
+    Count, F, IntegerField, OuterRef, Subquery, Sum
+)
+from django.db.models.functions import Coalesce
+from core import metrics
+from .models import Post, User, Follow, Like, Dislike
+
+REPAIR_BATCH_SIZE = 500
+
+# Модель реакции -> (счетчик на Post, противоположная модель, ее счетчик)
+REACTIONS = {
+    Like: ('likes_count', Dislike, 'dislikes_count'),
+    Dislike: ('dislikes_count', Like, 'likes_count'),
+}
+
+
+def toggle_reaction(user, post_id, model):
+    """Переключает реакцию пользователя на пост.
+
+    Противоположная реакция снимается и заменяется новой, повторный клик
+    снимает реакцию. Строки Like/Dislike и счетчики на Post меняются
+    в одной транзакции через F-выражения, поэтому параллельные клики
+    не сбивают счетчики.
+    """
+    counter, opposite, opposite_counter = REACTIONS[model]
+    lookup = {'post_id': post_id, 'user': user}
+    changes = {}
+    created = False
+    with transaction.atomic():
+        removed, _ = opposite.objects.filter(**lookup).delete()
+        if removed:
+            changes[opposite_counter] = F(opposite_counter) - removed
+            deleted = 0
+        else:
+            deleted, _ = model.objects.filter(**lookup).delete()
+        if deleted:
+            changes[counter] = F(counter) - deleted
+        else:
+            _, created = model.objects.get_or_create(**lookup)
+            if created:
+                changes[counter] = F(counter) + 1
+        if changes:
+            Post.objects.filter(pk=post_id).update(**changes)
+    metrics.inc('yatube_reaction_writes_total', {'mode': 'direct'},
+                removed + deleted + created)
+
+
+def reaction_counts(model):
+    """Подзапрос с фактическим числом реакций model на пост."""
+    counts = model.objects.filter(post=OuterRef('pk')).order_by(
+    ).values('post').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+def repair_reaction_counters(queryset=None):
+    """Пересчитывает счетчики реакций, разошедшиеся с таблицами
+    Like/Dislike. Возвращает число исправленных постов."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    drifted = queryset.annotate(
+        real_likes=reaction_counts(Like),
+        real_dislikes=reaction_counts(Dislike),
+    ).exclude(
+        likes_count=F('real_likes'), dislikes_count=F('real_dislikes')
+    ).values_list('pk', flat=True)
+    drifted = list(drifted)
+    for start in range(0, len(drifted), REPAIR_BATCH_SIZE):
+        Post.objects.filter(
+            pk__in=drifted[start:start + REPAIR_BATCH_SIZE]
+        ).update(
+            likes_count=reaction_counts(Like),
+            dislikes_count=reaction_counts(Dislike),
+        )
+    return len(drifted)
+
+
+def _author_subquery(queryset, field, aggregate):
+    """Коррелированный подзапрос с агрегатом по строкам автора."""
+    values = queryset.filter(**{field: OuterRef('pk')}).order_by(
+    ).values(field).annotate(total=aggregate).values('total')
+    return Coalesce(Subquery(values, output_field=IntegerField()), 0)
+
+
+def get_profile_stats(author):
+    """Возвращает статистику автора одним запросом к БД.
+
+    Ключи: posts_count, likes, dislikes, followers_count, following_count.
+    Лайки и дизлайки суммируются по денормализованным счетчикам постов.
+    """
+    return User.objects.filter(pk=author.pk).annotate(
+        posts_count=_author_subquery(Post.objects, 'author', Count('pk')),
+        likes=_author_subquery(Post.objects, 'author', Sum('likes_count')),
+        dislikes=_author_subquery(
+            Post.objects, 'author', Sum('dislikes_count')
+        ),
+        followers_count=_author_subquery(
+            Follow.objects, 'author', Count('pk')
+        ),
+        following_count=_author_subquery(Follow.objects, 'user', Count('pk')),
+    ).values(
+        'posts_count', 'likes', 'dislikes',
+        'followers_count', 'following_count',
+    ).get()
+
+
+def build_comment_tree(comments, newest_first=False):
+    """Раскладывает комментарии поста по веткам за один проход.
+
+    Возвращает комментарии верхнего уровня; у каждого комментария
+    появляются атрибуты replies (прямые ответы в порядке выборки)
+    и reply_count. Запрос к БД выполняется один раз, при переборе
+    comments. Выборка Comment.objects.thread() идет от старых
+    к новым; newest_first разворачивает ветки и ответы.
+    """
+    replies = defaultdict(list)
+    roots = []
+    for comment in comments:
+        if comment.comment_p_id is None:
+            roots.append(comment)
+        else:
+            replies[comment.comment_p_id].append(comment)
+    for comment in comments:
+        comment.replies = replies[comment.pk]
+        if newest_first:
+            comment.replies.reverse()
+        comment.reply_count = len(comment.replies)
+    return roots[::-1] if newest_first else roots
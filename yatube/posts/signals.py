@@ -0,0 +1,172 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .feed_cache import (
+    INDEX_SCOPE, group_scope, invalidate, post_scopes, profile_scope
+)
+from .models import Post, Group, User, Follow, Comment, Like, Dislike
+from .search import index_post, index_posts
+from . import thumbnails, timeline
+
+AUTHOR_NAME_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, **kwargs):
+    """Обновляет поисковый индекс поста после сохранения."""
+    if not raw:
+        index_post(instance)
+
+
+@receiver(post_save, sender=Group)
+def reindex_group_posts(sender, instance, created=False, raw=False,
+                        **kwargs):
+    """Название группы входит в индекс ее постов."""
+    if not (raw or created):
+        index_posts(instance.posts.all())
+
+
+@receiver(post_save, sender=User)
+def reindex_author_posts(sender, instance, created=False, raw=False,
+                         update_fields=None, **kwargs):
+    """Имя автора входит в индекс его постов."""
+    if raw or created:
+        return
+    if update_fields and not AUTHOR_NAME_FIELDS & set(update_fields):
+        return
+    index_posts(instance.posts.all())
+    # Имя автора видно в карточках его постов и на лентах их групп
+    group_ids = instance.posts.exclude(group=None).order_by().values_list(
+        'group_id', flat=True).distinct()
+    invalidate(INDEX_SCOPE, profile_scope(instance.pk),
+               *map(group_scope, group_ids))
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created=False, raw=False, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков."""
+    if raw or not timeline.timeline_enabled():
+        return
+    if created:
+        timeline.fan_out(instance)
+    else:
+        timeline.sync_pub_date(instance)
+
+
+@receiver(post_save, sender=Follow)
+def fill_timeline(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and timeline.timeline_enabled():
+        timeline.follow_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_timeline(sender, instance, **kwargs):
+    if timeline.timeline_enabled():
+        timeline.unfollow_author(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, raw=False, **kwargs):
+    """Запоминает прежние группу и картинку: при переносе поста лента
+    группы тоже устаревает, а старая миниатюра больше не подходит."""
+    if raw or not instance.pk:
+        return
+    previous = Post.objects.filter(pk=instance.pk).values_list(
+        'group_id', 'image').first()
+    if previous is None:
+        return
+    instance._previous_group_id, instance._previous_image = previous
+    if instance._previous_image != instance.image.name:
+        instance.thumbnail_url = ''
+        instance.image_renditions = ''
+
+
+@receiver(post_save, sender=Post)
+def enqueue_thumbnail(sender, instance, raw=False, **kwargs):
+    """Миниатюра строится в фоне, а не при первом показе поста."""
+    if raw or not instance.image or instance.thumbnail_url:
+        return
+    if not thumbnails.reuse_existing(instance):
+        thumbnails.enqueue(instance)
+
+
+@receiver(post_save, sender=Post)
+def confirm_image(sender, instance, raw=False, **kwargs):
+    """Пост с картинкой записан: заявка загрузки на файл больше
+    не нужна (см. ContentAddressedStorage)."""
+    name = instance.image.name
+    if not raw and name:
+        storage = instance.image.storage
+        transaction.on_commit(lambda: storage.unclaim(name))
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, raw=False, **kwargs):
+    previous_image = getattr(instance, '_previous_image', None)
+    if not raw and previous_image and previous_image != instance.image.name:
+        transaction.on_commit(
+            lambda: thumbnails.release_image(previous_image))
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    """Файл картинки удаляется вместе с последним постом с ней."""
+    name = instance.image.name
+    if name:
+        transaction.on_commit(lambda: thumbnails.release_image(name))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    scopes = post_scopes(instance.author_id, instance.group_id)
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id and previous_group_id != instance.group_id:
+        scopes.append(group_scope(previous_group_id))
+    invalidate(*scopes)
+
+
+@receiver(post_delete, sender=Comment)
+def reroot_comment_replies(sender, instance, **kwargs):
+    """Ответы удаленного комментария становятся корнями веток
+    (comment_p у них обнуляется), их пути укорачиваются."""
+    if instance.path:
+        Comment.objects.move_subtree(
+            instance.path, '', -(instance.depth + 1))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Dislike)
+@receiver(post_delete, sender=Dislike)
+def invalidate_post_card_feeds(sender, instance, raw=False, **kwargs):
+    """Число комментариев и реакций видно в карточке поста."""
+    if raw:
+        return
+    post = Post.objects.filter(pk=instance.post_id).values_list(
+        'author_id', 'group_id').first()
+    if post:
+        invalidate(*post_scopes(*post))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_profile_feed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(profile_scope(instance.author_id))
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_feeds(sender, instance, created=False, raw=False,
+                           **kwargs):
+    """Название группы видно и в карточках на профилях авторов."""
+    if raw:
+        return
+    author_ids = [] if created else instance.posts.order_by().values_list(
+        'author_id', flat=True).distinct()
+    invalidate(INDEX_SCOPE, group_scope(instance.pk),
+               *map(profile_scope, author_ids))
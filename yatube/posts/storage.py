@@ -0,0 +1,97 @@
+import hashlib
+import os
+import time
+from contextlib import contextmanager, suppress
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+HASH_CHUNK_SIZE = 64 * 1024
+# Служебные файлы (блокировки и заявки) внутри MEDIA_ROOT
+SERVICE_DIR = '.refs'
+# Столько секунд заявка защищает файл, если пост так и не сохранился
+CLAIM_SECONDS = 300
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем из хеша содержимого.
+
+    posts/image.gif превращается в posts/<sha256>.gif: одинаковые
+    загрузки занимают место на диске один раз и получают общие
+    миниатюры, а разные файлы с одним именем не конфликтуют.
+    Файл удаляется, когда на него не ссылается ни один пост
+    (см. posts.thumbnails.release_image).
+
+    Сохранение и удаление одного хеша идут под общей блокировкой,
+    а сохранение оставляет заявку на файл, которую снимает коммит
+    поста (signals.confirm_image): удаление не трогает файл, который
+    загрузка уже нашла, но пост с ним еще не записан.
+    """
+
+    @staticmethod
+    def content_hash(content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def _service_path(self, filename):
+        return os.path.join(self.location, SERVICE_DIR, filename)
+
+    def _claim_path(self, name):
+        return self._service_path(name.replace('/', '_') + '.claim')
+
+    @contextmanager
+    def lock(self, name):
+        """Блокировка хеша name для всех процессов."""
+        if fcntl is None:
+            yield
+            return
+        # Файлы блокировок не удаляются, поэтому их число ограничено
+        path = self._service_path(os.path.basename(name)[:2] + '.lock')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def claim(self, name):
+        path = self._claim_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a'):
+            os.utime(path)
+
+    def unclaim(self, name):
+        with suppress(FileNotFoundError):
+            os.remove(self._claim_path(name))
+
+    def claimed(self, name):
+        try:
+            claimed_at = os.path.getmtime(self._claim_path(name))
+        except FileNotFoundError:
+            return False
+        return time.time() - claimed_at < CLAIM_SECONDS
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory,
+                            self.content_hash(content) + extension)
+        with self.lock(name):
+            self.claim(name)
+            if self.exists(name):
+                return name
+            return super().save(name, content, max_length=max_length)
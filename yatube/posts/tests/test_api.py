@@ -0,0 +1,125 @@
+from datetime import timedelta
+from http import HTTPStatus
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from ..models import Comment, Group, Like, Post, User
+
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        now = timezone.now()
+        cls.posts = [
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Пост {number}',
+                                pub_date=now - timedelta(minutes=number))
+            for number in range(12)
+        ]
+        cls.comment = Comment.objects.create(
+            author=cls.author, text='Комментарий', post=cls.posts[0])
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_feeds_list_posts(self):
+        """Ленты отдают посты в порядке страниц сайта."""
+        urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:api_profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+                self.assertEqual(
+                    [post['id'] for post in data['results']],
+                    [post.pk for post in ApiTests.posts[:10]])
+                self.assertEqual(data['results'][0]['author'], 'auth')
+                self.assertEqual(data['results'][0]['group'], 'test-slug')
+                self.assertIsNone(data['previous'])
+
+    def test_sparse_fields(self):
+        """fields ограничивает поля ответа и столбцы запроса."""
+        url = reverse('posts:api_index')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'fields': 'id,text'})
+        self.assertEqual(response.json()['results'][0],
+                         {'id': ApiTests.posts[0].pk, 'text': 'Пост 0'})
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('password', response.json()['error'])
+
+    def test_cursor_pagination(self):
+        """Ссылки next и previous листают ленту без повторов."""
+        url = reverse('posts:api_index')
+        first = self.client.get(url, {'limit': 5, 'fields': 'id'}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(
+            [post['id'] for post in first['results'] + second['results']],
+            [post.pk for post in ApiTests.posts[:10]])
+        self.assertIn('fields=id', second['next'])
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_post_detail_with_comments(self):
+        comment = Comment.objects.get(pk=ApiTests.comment.pk)
+        response = self.client.get(reverse(
+            'posts:api_post_detail',
+            kwargs={'post_id': ApiTests.posts[0].pk}))
+        data = response.json()
+        self.assertEqual(data['post']['text'], 'Пост 0')
+        self.assertEqual(
+            data['comments'],
+            [{'id': comment.pk, 'author': 'auth',
+              'text': 'Комментарий', 'quote': None,
+              'created': comment.created.isoformat(),
+              'parent': None, 'depth': 0}])
+
+    def test_missing_objects(self):
+        urls = (
+            reverse('posts:api_group_list', kwargs={'slug': 'missing'}),
+            reverse('posts:api_profile', kwargs={'username': 'missing'}),
+            reverse('posts:api_post_detail', kwargs={'post_id': 10 ** 6}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code,
+                                 HTTPStatus.NOT_FOUND)
+
+    def test_unchanged_feed_is_not_modified(self):
+        """Повторный запрос с ETag получает 304 без выборки постов,
+        после новой реакции ETag меняется."""
+        url = reverse('posts:api_index')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        Like.objects.create(post=ApiTests.posts[3], user=ApiTests.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_new_comment_changes_post_etag(self):
+        url = reverse('posts:api_post_detail',
+                      kwargs={'post_id': ApiTests.posts[1].pk})
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(author=ApiTests.author, text='Новый',
+                               post=ApiTests.posts[1])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.json()['comments']), 1)
@@ -1,7 +1,8 @@
-from ..models import Post, User
+from ..models import Post, Group, User, Comment, Follow
 from django.test import Client, TestCase
 from django.urls import reverse
 from django.core.cache import cache
+from ..feed_cache import get_versions, group_scope, profile_scope
 
 REVERSE_URL = reverse('posts:index')
 
@@ -12,17 +13,87 @@ class CacheTests(TestCase):
     def setUpClass(cls):
         super().setUpClass()
         cls.author = User.objects.create_user(username='auth')
+        cls.user = User.objects.create_user(username='NoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
         cls.authorized_client = Client()
         cls.authorized_client.force_login(cls.author)
         cls.post = Post.objects.create(
-            author=cls.author, text='Тестовый пост')
+            author=cls.author, text='Тестовый пост', group=cls.group)
+        cls.reverse_list = [
+            REVERSE_URL,
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        ]
+
+    def setUp(self):
+        cache.clear()
 
     def test_cache_for_index(self):
         """Тестирование праильной работы кеширования шаблона 'index'"""
         content = self.authorized_client.get(REVERSE_URL).content
-        CacheTests.post.delete()
+        # update() не отправляет сигналов: страница берется из кеша
+        Post.objects.filter(pk=CacheTests.post.pk).update(text='Изменен')
         new_content = self.authorized_client.get(REVERSE_URL).content
         self.assertEqual(content, new_content)
         cache.clear()
         newest_content = self.authorized_client.get(REVERSE_URL).content
         self.assertNotEqual(new_content, newest_content)
+
+    def test_cached_feed_skips_post_queries(self):
+        """Закешированная лента не запрашивает посты повторно"""
+        self.authorized_client.get(REVERSE_URL)
+        with self.assertNumQueries(4):
+            # сессия, пользователь, валидатор ETag (MAX(pub_date))
+            # и число постов для паджинатора
+            self.authorized_client.get(REVERSE_URL)
+
+    def test_writes_invalidate_cached_feeds(self):
+        """Изменения постов, комментариев, реакций и подписок сразу
+        видны в закешированных лентах"""
+        writes = (
+            lambda: Comment.objects.create(
+                author=CacheTests.user, post=CacheTests.post,
+                text='Комментарий'),
+            lambda: Post.objects.create(
+                author=CacheTests.author, text='Новый пост',
+                group=CacheTests.group),
+            lambda: Follow.objects.create(
+                user=CacheTests.user, author=CacheTests.author),
+            lambda: CacheTests.post.delete(),
+        )
+        for write in writes:
+            for rev in CacheTests.reverse_list:
+                self.authorized_client.get(rev)
+            before = [self.authorized_client.get(rev).content
+                      for rev in CacheTests.reverse_list]
+            write()
+            after = [self.authorized_client.get(rev).content
+                     for rev in CacheTests.reverse_list]
+            with self.subTest(write=write):
+                self.assertNotEqual(before, after,
+                                    'Кеш ленты не сброшен после записи')
+
+    def test_renames_invalidate_related_feeds(self):
+        """Имя автора видно в лентах его групп, группа - в лентах
+        профилей ее авторов"""
+        group_feed = reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+        self.authorized_client.get(group_feed)
+        CacheTests.author.first_name = 'Новое'
+        CacheTests.author.save()
+        self.assertContains(self.authorized_client.get(group_feed), 'Новое')
+        scope = profile_scope(CacheTests.author.pk)
+        before = get_versions([scope])
+        CacheTests.group.title = 'Новое название'
+        CacheTests.group.save()
+        self.assertNotEqual(get_versions([scope]), before)
+        scope = group_scope(CacheTests.group.pk)
+        before = get_versions([scope])
+        # Посты без группы: ленты чужих групп не сбрасываются
+        Post.objects.create(author=CacheTests.user, text='Без группы')
+        CacheTests.user.last_name = 'Другой'
+        CacheTests.user.save()
+        self.assertEqual(get_versions([scope]), before)
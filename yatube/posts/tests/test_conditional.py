@@ -0,0 +1,78 @@
+from http import HTTPStatus
+from django.test import Client, TestCase
+from django.urls import reverse
+from ..models import Comment, Follow, Group, Post, User
+
+
+class ConditionalPagesTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.user = User.objects.create_user(username='NoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Тестовый пост')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(ConditionalPagesTests.user)
+
+    def urls(self):
+        return (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:post_detail',
+                    kwargs={'post_id': ConditionalPagesTests.post.pk}),
+            reverse('posts:follow_index'),
+        )
+
+    def test_unchanged_page_is_not_rendered(self):
+        """Страница с тем же ETag отдается ответом 304 без шаблона."""
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertTrue(response.has_header('Last-Modified'))
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertEqual(response.templates, [])
+
+    def test_etag_depends_on_user(self):
+        """В шапке страницы есть пользователь: у гостя свой ETag."""
+        url = reverse('posts:index')
+        etag = self.authorized_client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_changes_update_etag(self):
+        """Новый пост, комментарий или подписка меняют ETag."""
+        changes = {
+            reverse('posts:index'): lambda: Post.objects.create(
+                author=ConditionalPagesTests.user, text='Новый пост'),
+            reverse('posts:post_detail', kwargs={
+                'post_id': ConditionalPagesTests.post.pk
+            }): lambda: Comment.objects.create(
+                author=ConditionalPagesTests.user, text='Комментарий',
+                post=ConditionalPagesTests.post),
+            reverse('posts:follow_index'): lambda: Follow.objects.filter(
+                user=ConditionalPagesTests.user).delete(),
+        }
+        for url, change in changes.items():
+            with self.subTest(url=url):
+                etag = self.authorized_client.get(url)['ETag']
+                change()
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
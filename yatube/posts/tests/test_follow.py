@@ -1,6 +1,9 @@
 import tempfile
+from io import StringIO
 from django.conf import settings
-from ..models import Post, User, Follow
+from django.core.cache import cache
+from django.core.management import call_command
+from ..models import Post, User, Follow, TimelineEntry
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
@@ -93,3 +96,65 @@ class CreateFormTests(TestCase):
         for key, expected in dict.items():
             with self.subTest(key=key):
                 self.assertEqual(key, expected)
+
+
+@override_settings(POSTS_TIMELINE=True)
+class TimelineTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.user = User.objects.create_user(username='NoName')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+        cls.reverse_feed = reverse('posts:follow_index')
+
+    def setUp(self):
+        cache.clear()
+
+    def feed(self):
+        response = self.authorized_client.get(TimelineTests.reverse_feed)
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_new_post_fanned_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков при публикации."""
+        old_post = Post.objects.create(author=TimelineTests.author,
+                                       text='Старый пост')
+        Follow.objects.create(user=TimelineTests.user,
+                              author=TimelineTests.author)
+        new_post = Post.objects.create(author=TimelineTests.author,
+                                       text='Новый пост')
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=TimelineTests.user).count(), 2,
+            'Лента подписок не заполнена'
+        )
+        self.assertEqual(self.feed(), [new_post.pk, old_post.pk])
+
+    def test_unfollow_clears_timeline(self):
+        """Отписка убирает посты автора из ленты."""
+        follow = Follow.objects.create(user=TimelineTests.user,
+                                       author=TimelineTests.author)
+        Post.objects.create(author=TimelineTests.author, text='Пост')
+        follow.delete()
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(POSTS_TIMELINE_FANOUT_LIMIT=0)
+    def test_heavy_author_read_on_demand(self):
+        """Посты авторов с большим числом подписчиков читаются
+        без раскладки по лентам."""
+        Follow.objects.create(user=TimelineTests.user,
+                              author=TimelineTests.author)
+        cache.clear()
+        post = Post.objects.create(author=TimelineTests.author, text='Пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), [post.pk])
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=TimelineTests.user,
+                              author=TimelineTests.author)
+        post = Post.objects.create(author=TimelineTests.author, text='Пост')
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.feed(), [post.pk])
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 from django.conf import settings
@@ -47,6 +48,11 @@ class CreateFormTests(TestCase):
              b'\x02\x00\x01\x00\x00\x02\x02\x0C'
              b'\x0A\x00\x3B')
         )
+        # Картинки хранятся под хешем содержимого
+        cls.image_names = [
+            f'posts/{hashlib.sha256(content).hexdigest()}.gif'
+            for content in cls.image_gif_list
+        ]
         cls.uploaded = SimpleUploadedFile(
             name='image.gif',
             content=cls.image_gif_list[0],
@@ -103,7 +109,7 @@ class CreateFormTests(TestCase):
                 text='Новый тестовый текст',
                 author=1,
                 group=1,
-                image='posts/image.gif'
+                image=CreateFormTests.image_names[0]
             ).exists()
         )
 
@@ -138,7 +144,7 @@ class CreateFormTests(TestCase):
                 text='Совершенно новый тестовый текст',
                 author=1,
                 group=2,
-                image='posts/image_2.gif'
+                image=CreateFormTests.image_names[1]
             ).exists()
         )
 
@@ -1,5 +1,5 @@
 from django.test import TestCase
-from ..models import Group, Post, User
+from ..models import Comment, Group, Post, User
 
 
 class PostModelTest(TestCase):
@@ -55,3 +55,52 @@ class PostModelTest(TestCase):
                 self.assertEqual(post._meta.get_field(field).help_text,
                                  expected_value,
                                  'help_text не соответствует ожидаемому')
+
+
+class CommentPathTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(author=self.user, post=self.post,
+                                      text=text, comment_p=parent)
+
+    def test_thread_subtree_and_depth(self):
+        """Ветка, поддерево и срез по глубине - по одному запросу."""
+        root = self.comment('root')
+        reply = self.comment('reply', root)
+        nested = self.comment('nested', reply)
+        other = self.comment('other')
+        self.assertEqual(nested.depth, 2)
+        self.assertTrue(nested.path.startswith(reply.path))
+        with self.assertNumQueries(1):
+            self.assertEqual(list(Comment.objects.thread(self.post)),
+                             [root, reply, nested, other])
+        with self.assertNumQueries(1):
+            self.assertEqual(list(Comment.objects.subtree(reply)),
+                             [reply, nested])
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                list(Comment.objects.thread(self.post).max_depth(1)),
+                [root, reply, other]
+            )
+
+    def test_delete_reroots_replies(self):
+        """Ответы удаленного комментария становятся корнями веток."""
+        root = self.comment('root')
+        reply = self.comment('reply', root)
+        nested = self.comment('nested', reply)
+        root.delete()
+        reply.refresh_from_db()
+        nested.refresh_from_db()
+        self.assertIsNone(reply.comment_p)
+        self.assertEqual((reply.path, reply.depth),
+                         (str(reply.pk).zfill(Comment.PATH_STEP), 0))
+        self.assertEqual((nested.path, nested.depth),
+                         (reply.path + str(nested.pk).zfill(10), 1))
+        self.assertEqual(list(Comment.objects.subtree(reply)),
+                         [reply, nested])
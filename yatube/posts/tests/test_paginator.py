@@ -1,7 +1,11 @@
 
-from django.test import TestCase, Client
-from ..models import Post, Group, User
+from django.core.cache import cache
+from django.test import TestCase, Client, override_settings
+from django.utils import timezone
+from ..models import Post, Group, User, Follow
 from django.urls import reverse
+from ..paginators import CachedCountPaginator, CursorPaginator
+from ..timeline import timeline_posts
 from ..views import POSTS_PER_PAGE
 
 
@@ -50,3 +54,114 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(response.context['page_obj']),
                                  POSTS_PER_PAGE,
                                  'Паджинатор страницы работает не верно')
+
+
+class CursorPaginatorTest(TestCase):
+    """Проверка работы курсорного паджинатора"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        pub_date = timezone.now()
+        # Половина постов с одинаковой датой: порядок держится на pk
+        Post.objects.bulk_create(
+            [Post(author=cls.author,
+             text='Тестовый пост' + str(i),
+             pub_date=pub_date if i % 2 else timezone.now())
+             for i in range(25)]
+        )
+        cls.expected = list(Post.objects.values_list('pk', flat=True))
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.author)
+
+    def test_pages_follow_model_ordering(self):
+        """Курсоры проходят ленту вперед и назад без пропусков и повторов"""
+        paginator = CursorPaginator(Post.objects.all(), POSTS_PER_PAGE)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        seen = [post.pk for page in pages for post in page]
+        self.assertEqual(seen, CursorPaginatorTest.expected,
+                         'Курсорный паджинатор работает не верно')
+        self.assertFalse(pages[0].has_previous())
+        previous = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual([post.pk for post in previous],
+                         [post.pk for post in pages[-2]],
+                         'Переход на предыдущую страницу работает не верно')
+
+    def test_pages_follow_queryset_ordering(self):
+        """Курсоры учитывают сортировку queryset, в том числе
+        по аннотациям (лента подписок)"""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=CursorPaginatorTest.author)
+        paginator = CursorPaginator(timeline_posts(reader), POSTS_PER_PAGE)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        seen = [post.pk for page in pages for post in page]
+        self.assertEqual(seen, CursorPaginatorTest.expected)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор открывает первую страницу"""
+        paginator = CursorPaginator(Post.objects.all(), POSTS_PER_PAGE)
+        page = paginator.get_page('not-a-cursor')
+        self.assertEqual([post.pk for post in page],
+                         CursorPaginatorTest.expected[:POSTS_PER_PAGE])
+
+    @override_settings(POSTS_PAGINATION='cursor')
+    def test_index_uses_cursor_pages(self):
+        """Лента в режиме 'cursor' отдает страницу по токену"""
+        response = self.authorized_client.get(reverse('posts:index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), POSTS_PER_PAGE)
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': page_obj.next_cursor})
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            CursorPaginatorTest.expected[POSTS_PER_PAGE:POSTS_PER_PAGE * 2]
+        )
+
+
+class CachedCountPaginatorTest(TestCase):
+    """Проверка подсчета страниц без COUNT(*) на каждый запрос"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        Post.objects.bulk_create(
+            [Post(author=cls.author, text='Тестовый пост' + str(i))
+             for i in range(14)]
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_small_result_counted_exactly(self):
+        """Небольшая выборка считается точно"""
+        paginator = CachedCountPaginator(Post.objects.all(), POSTS_PER_PAGE)
+        self.assertEqual(paginator.count, 14)
+        Post.objects.create(author=CachedCountPaginatorTest.author,
+                            text='Еще пост')
+        paginator = CachedCountPaginator(Post.objects.all(), POSTS_PER_PAGE)
+        self.assertEqual(paginator.count, 15)
+
+    def test_large_result_count_taken_from_cache(self):
+        """Число строк большой выборки берется из кеша"""
+        paginator = CachedCountPaginator(Post.objects.all(), POSTS_PER_PAGE,
+                                         exact_limit=5)
+        self.assertEqual(paginator.count, 14)
+        Post.objects.create(author=CachedCountPaginatorTest.author,
+                            text='Еще пост')
+        paginator = CachedCountPaginator(Post.objects.all(), POSTS_PER_PAGE,
+                                         exact_limit=5)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 14)
+
+    def test_known_count_skips_queries(self):
+        """Переданное число не требует запросов к БД"""
+        paginator = CachedCountPaginator(Post.objects.all(), POSTS_PER_PAGE,
+                                         count=14)
+        with self.assertNumQueries(0):
+            self.assertEqual(paginator.num_pages, 2)
@@ -0,0 +1,55 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from ..models import Comment, Follow, Group, Post, User
+from ..query_plans import check_plans, plan_problems, view_querysets
+
+
+class QueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {i}')
+        Comment.objects.create(author=cls.reader, post=cls.post,
+                               text='Комментарий')
+
+    def test_feed_queries_use_indexes(self):
+        """Ни одна лента не просматривает таблицу целиком и не
+        сортирует во временном B-дереве."""
+        report = check_plans(view_querysets(
+            QueryPlanTests.reader, QueryPlanTests.group,
+            QueryPlanTests.author, QueryPlanTests.post))
+        # Поиск и лента подписок без материализации проверяются тоже
+        self.assertIn('search', report)
+        self.assertIn('follow_index (POSTS_TIMELINE = False) (cursor)',
+                      report)
+        for name, (plan, problems) in report.items():
+            with self.subTest(query=name):
+                self.assertEqual(problems, [], plan)
+
+    def test_plan_problems(self):
+        """Полный просмотр и временная сортировка распознаются."""
+        plan = ('2 0 0 SCAN TABLE posts_post\n'
+                '5 0 0 SCAN posts_post USING INDEX post_pub_date_idx\n'
+                '9 0 0 USE TEMP B-TREE FOR ORDER BY')
+        self.assertEqual(plan_problems(plan), [
+            '2 0 0 SCAN TABLE posts_post',
+            '9 0 0 USE TEMP B-TREE FOR ORDER BY',
+        ])
+
+    def test_command(self):
+        """Команда check_query_plans проходит на индексах модели."""
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('все используют индексы', out.getvalue())
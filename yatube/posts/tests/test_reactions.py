@@ -0,0 +1,155 @@
+import os
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from .. import reaction_buffer
+from ..models import Post, User, Like, Dislike
+
+
+class ReactionTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.user = User.objects.create_user(username='NoName')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый пост')
+        cls.like_url = reverse('posts:like', kwargs={'post_id': cls.post.pk})
+        cls.dislike_url = reverse('posts:dislike',
+                                  kwargs={'post_id': cls.post.pk})
+
+    def setUp(self):
+        self.authorized_client = Client(HTTP_REFERER=reverse('posts:index'))
+        self.authorized_client.force_login(self.user)
+
+    def assertCounters(self, likes, dislikes):
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(
+            (post.likes_count, post.dislikes_count), (likes, dislikes),
+            'Счетчики реакций не соответствуют ожидаемым'
+        )
+        self.assertEqual(
+            (post.like.count(), post.dislike.count()), (likes, dislikes),
+            'Количество реакций в БД не соответствует ожидаемому'
+        )
+
+    def test_like_toggles(self):
+        """Повторный лайк снимает реакцию и счетчик."""
+        self.authorized_client.get(self.like_url)
+        self.assertCounters(1, 0)
+        self.authorized_client.get(self.like_url)
+        self.assertCounters(0, 0)
+
+    def test_dislike_replaces_like(self):
+        """Дизлайк заменяет лайк, счетчики меняются вместе."""
+        self.authorized_client.get(self.like_url)
+        self.authorized_client.get(self.dislike_url)
+        self.assertCounters(0, 1)
+        self.authorized_client.get(self.like_url)
+        self.assertCounters(1, 0)
+
+    def test_not_authorized_client_cannot_react(self):
+        """Не авторизованный пользователь не может поставить лайк."""
+        self.authorized_client.logout()
+        self.authorized_client.get(self.like_url)
+        self.assertCounters(0, 0)
+
+    def test_repair_command_fixes_drifted_counters(self):
+        """Команда repair_reaction_counters пересчитывает счетчики."""
+        Like.objects.create(post=self.post, user=self.user)
+        Dislike.objects.create(post=self.post,
+                               user=self.author)
+        out = StringIO()
+        call_command('repair_reaction_counters', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertCounters(1, 1)
+
+
+@override_settings(POSTS_REACTIONS_BUFFER='memory',
+                   POSTS_REACTIONS_FLUSH_MS=0,
+                   POSTS_REACTIONS_FLUSH_EVENTS=100)
+class BufferedReactionTests(ReactionTests):
+    """Те же сценарии с отложенной записью: пользователь сразу видит
+    свою реакцию, а в базу она попадает при сбросе буфера."""
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(reaction_buffer._buffers.clear)
+
+    def assertCounters(self, likes, dislikes):
+        # До записи счетчики на странице поправлены реакциями из буфера
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        post = response.context['post']
+        self.assertEqual((post.likes_count, post.dislikes_count),
+                         (likes, dislikes))
+        reaction_buffer.flush()
+        super().assertCounters(likes, dislikes)
+
+    def test_click_is_not_written_immediately(self):
+        """Клик только попадает в буфер и ставит cookie; следующие
+        запросы пользователя буфер не сбрасывают."""
+        response = self.authorized_client.get(self.like_url)
+        self.assertIn(reaction_buffer.PENDING_COOKIE, response.cookies)
+        for name, kwargs in (
+                ('posts:index', {}),
+                ('posts:profile', {'username': self.author.username}),
+                ('posts:post_detail', {'post_id': self.post.pk})):
+            with self.subTest(name=name):
+                response = self.authorized_client.get(
+                    reverse(name, kwargs=kwargs))
+                self.assertContains(response, '👍 +1')
+                if name == 'posts:profile':
+                    self.assertEqual(response.context['stats']['likes'], 1)
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(Post.objects.get(
+            pk=self.post.pk).likes_count, 0)
+        # Другие пользователи видят записанное состояние
+        self.assertContains(self.client.get(reverse('posts:index')),
+                            '👍 +0')
+        reaction_buffer.flush()
+        self.assertTrue(Like.objects.exists())
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, '👍 +1')
+        self.assertEqual(
+            response.cookies[reaction_buffer.PENDING_COOKIE]['max-age'], 0)
+
+    def test_flush_writes_many_users_at_once(self):
+        """Сброс записывает реакции всех пользователей, противоположные
+        заменяются, счетчики меняются на разницу."""
+        Dislike.objects.create(post=self.post,
+                               user=self.author)
+        Post.objects.filter(pk=self.post.pk).update(
+            dislikes_count=1)
+        buffer = reaction_buffer.get_buffer()
+        buffer.record(self.user.pk, self.post.pk, 'like')
+        buffer.record(self.author.pk, self.post.pk, 'like')
+        with self.assertNumQueries(9):
+            self.assertEqual(reaction_buffer.flush(), 2)
+        super().assertCounters(2, 0)
+
+    @override_settings(POSTS_REACTIONS_FLUSH_EVENTS=1)
+    def test_flush_after_event_limit(self):
+        self.authorized_client.get(self.like_url)
+        self.assertTrue(Like.objects.exists())
+
+    def test_file_buffer(self):
+        """Файловый буфер переживает пересоздание и повторный сброс."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        path = os.path.join(directory, 'reactions.jsonl')
+        self.addCleanup(os.remove, path)
+        with override_settings(POSTS_REACTIONS_BUFFER=path):
+            self.authorized_client.get(self.like_url)
+            self.authorized_client.get(self.dislike_url)
+            reaction_buffer._buffers.clear()
+            self.assertFalse(Like.objects.exists())
+            with open(path) as file:
+                self.assertEqual(len(file.readlines()), 2)
+            out = StringIO()
+            call_command('flush_reactions', stdout=out)
+            self.assertIn('1', out.getvalue())
+            super().assertCounters(0, 1)
+            self.assertEqual(os.path.getsize(path), 0)
@@ -0,0 +1,74 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from ..models import Post, Group, User, SearchTerm
+from ..search import search_posts
+
+REVERSE_URL = reverse('posts:search')
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth',
+                                              first_name='Vasya',
+                                              last_name='Pupkin')
+        cls.group = Group.objects.create(
+            title='Котики',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post_text = Post.objects.create(
+            author=cls.author, text='Пишу про котиков и собак')
+        cls.post_group = Post.objects.create(
+            author=cls.author, text='Просто пост', group=cls.group)
+        cls.guest_client = Client()
+
+    def search(self, query):
+        response = self.guest_client.get(REVERSE_URL, {'q': query})
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_search_ranks_results(self):
+        """Совпадение в названии группы выше совпадения в тексте."""
+        self.assertEqual(
+            self.search('котик'),
+            [SearchTests.post_group.pk, SearchTests.post_text.pk],
+            'Результаты поиска не соответствуют ожиданиям'
+        )
+
+    def test_search_requires_all_words(self):
+        """В результат попадают посты со всеми словами запроса."""
+        self.assertEqual(self.search('котиков собак'),
+                         [SearchTests.post_text.pk])
+        self.assertEqual(self.search('pupkin просто'),
+                         [SearchTests.post_group.pk])
+
+    def test_regex_is_not_interpreted(self):
+        """Запрос не трактуется как регулярное выражение."""
+        self.assertEqual(self.search('.*'), [])
+
+    def test_index_follows_post_and_group_changes(self):
+        """Индекс обновляется при изменении поста и группы."""
+        post = SearchTests.post_text
+        post.text = 'Теперь про попугаев'
+        post.save()
+        self.assertEqual(self.search('собак'), [])
+        self.assertEqual(self.search('попугаев'), [post.pk])
+        group = SearchTests.group
+        group.title = 'Кошки'
+        group.save()
+        self.assertEqual(self.search('кошки'),
+                         [SearchTests.post_group.pk])
+
+    def test_rebuild_command(self):
+        """Команда rebuild_search_index восстанавливает индекс."""
+        SearchTerm.objects.all().delete()
+        self.assertFalse(search_posts('котиков').exists())
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(
+            list(search_posts('котиков').values_list('pk', flat=True)),
+            [SearchTests.post_text.pk]
+        )
@@ -0,0 +1,196 @@
+import shutil
+import tempfile
+from io import StringIO
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
+from django.urls import reverse
+from core import metrics
+from ..models import Post, ThumbnailJob, User
+from .. import thumbnails
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Свой каталог: ThumbnailTests удаляет общий после своих тестов
+CONTENT_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+# Без пула потоков: задания выполняются в тестах явно, а не в фоне,
+# где они пишут в MEDIA_ROOT уже после его удаления
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self):
+        self.authorized_client.post(reverse('posts:post_create'), data={
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile('image.gif', SMALL_GIF,
+                                        content_type='image/gif'),
+        })
+        return Post.objects.get(text='Пост с картинкой')
+
+    def test_post_create_enqueues_job(self):
+        """Сохранение формы ставит миниатюру в очередь, шаблон
+        до ее готовности показывает оригинал."""
+        post = self.create_post()
+        job = ThumbnailJob.objects.get(post=post)
+        self.assertEqual(job.status, ThumbnailJob.PENDING)
+        self.assertEqual(job.image, post.image.name)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=(post.pk,)))
+        self.assertContains(response, post.image.url)
+
+    def test_process_job_stores_url(self):
+        """Готовая миниатюра записывается в пост и попадает в шаблон."""
+        post = self.create_post()
+        self.assertTrue(thumbnails.process_job(post.thumbnail_job.pk))
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail_url)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=(post.pk,)))
+        self.assertContains(response, post.thumbnail_url)
+        self.assertEqual(ThumbnailJob.objects.get(post=post).status,
+                         ThumbnailJob.DONE)
+
+    def test_missing_file_fails_job(self):
+        """Отсутствующий файл не роняет обработку очереди."""
+        post = Post.objects.create(author=self.author, text='Без файла',
+                                   image='posts/missing.gif')
+        self.addCleanup(setattr, metrics, '_registry', metrics._registry)
+        metrics._registry = metrics.Registry()
+        for _ in range(thumbnails.MAX_ATTEMPTS):
+            thumbnails.process_job(post.thumbnail_job.pk)
+        job = ThumbnailJob.objects.get(post=post)
+        self.assertEqual(job.status, ThumbnailJob.FAILED)
+        self.assertTrue(job.error)
+        counters, _ = metrics.collect()
+        self.assertEqual(
+            {labels: value for (name, labels), value in counters.items()
+             if name == 'yatube_thumbnails_total'},
+            {(('status', 'retry'),): thumbnails.MAX_ATTEMPTS - 1,
+             (('status', 'failed'),): 1})
+
+    def test_command_backfills_images(self):
+        """Команда generate_thumbnails строит миниатюры старых картинок."""
+        post = self.create_post()
+        ThumbnailJob.objects.all().delete()
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail_url)
+
+    @override_settings(POSTS_IMAGE_RENDITIONS={'widths': (320, 640)})
+    def test_renditions_in_srcset(self):
+        """Варианты картинки попадают в srcset шаблона."""
+        post = self.create_post()
+        thumbnails.process_job(post.thumbnail_job.pk)
+        post.refresh_from_db()
+        renditions = post.renditions
+        self.assertEqual(renditions['srcset'].count('w,'), 1)
+        self.assertTrue(renditions['srcset'].endswith(' 640w'))
+        self.assertTrue(renditions['placeholder'].startswith('data:image'))
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, f'srcset="{renditions["srcset"]}"')
+
+    def test_unsupported_formats_skipped(self):
+        """Форматы, которые не умеет записывать сборка, пропускаются."""
+        formats = thumbnails.supported_formats(('jpeg', 'bmp', 'heic'))
+        self.assertEqual(formats, ['jpeg'])
+
+
+@override_settings(MEDIA_ROOT=CONTENT_MEDIA_ROOT, POSTS_THUMBNAILS_SYNC=True,
+                   POSTS_THUMBNAIL_WORKERS=0)
+class ContentAddressedImageTests(TransactionTestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(CONTENT_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+
+    def create_post(self, text, content=SMALL_GIF):
+        self.authorized_client.post(reverse('posts:post_create'), data={
+            'text': text,
+            'image': SimpleUploadedFile('image.gif', content,
+                                        content_type='image/gif'),
+        })
+        return Post.objects.get(text=text)
+
+    def test_same_upload_stored_once(self):
+        """Одинаковые загрузки - один файл и одни миниатюры."""
+        first = self.create_post('Первый')
+        second = self.create_post('Второй')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(second.thumbnail_url)
+        self.assertEqual(second.thumbnail_url, first.thumbnail_url)
+        self.assertFalse(ThumbnailJob.objects.filter(post=second).exists())
+
+    def test_orphaned_image_deleted(self):
+        """Файл удаляется вместе с последним постом, который на него
+        ссылается."""
+        first = self.create_post('Первый')
+        second = self.create_post('Второй')
+        storage = first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
+
+    def test_pending_upload_keeps_released_image(self):
+        """Загрузка, нашедшая файл до удаления последнего поста,
+        но еще не записавшая свой пост, не остается без файла."""
+        post = self.create_post('Пост')
+        name = post.image.name
+        storage = post.image.storage
+        # Параллельная загрузка того же файла: сохранение прошло,
+        # коммита поста еще не было
+        self.assertEqual(storage.save(
+            'posts/image.gif', SimpleUploadedFile('image.gif', SMALL_GIF)),
+            name)
+        post.delete()
+        self.assertTrue(storage.exists(name))
+        Post.objects.create(author=self.author, text='Копия', image=name)
+        self.assertFalse(storage.claimed(name))
+        Post.objects.filter(image=name).delete()
+        thumbnails.release_image(name)
+        self.assertFalse(storage.exists(name))
+
+    def test_replaced_image_deleted(self):
+        """Замененная при редактировании картинка удаляется."""
+        post = self.create_post('Пост')
+        old_name = post.image.name
+        other_gif = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00')
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=(post.pk,)), data={
+                'text': 'Пост',
+                'image': SimpleUploadedFile('image.gif', other_gif,
+                                            content_type='image/gif'),
+            })
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old_name)
+        self.assertFalse(post.image.storage.exists(old_name))
+        self.assertTrue(post.image.storage.exists(post.image.name))
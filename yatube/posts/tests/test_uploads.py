@@ -0,0 +1,137 @@
+import shutil
+import struct
+import tempfile
+from io import BytesIO
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(size, image_format='JPEG', exif=False):
+    buffer = BytesIO()
+    options = {}
+    if exif:
+        data = Image.Exif()
+        data[0x010F] = 'Camera'
+        options['exif'] = data.tobytes()
+    Image.new('RGB', size, 'red').save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def make_xpm(width):
+    """XPM Pillow читает, но записывать не умеет."""
+    return (f'/* XPM */\nstatic char *image[] = {{\n"{width} 1 1 1",\n'
+            f'". c #FF0000",\n"{"." * width}"\n}};\n').encode()
+
+
+def make_mpo(size):
+    """Двухкадровый снимок камеры (MPO) с EXIF у первого кадра.
+
+    Pillow 8 не записывает MPO, поэтому сегмент APP2 с таблицей
+    кадров собирается вручную; смещения в ней считаются от начала
+    TIFF-заголовка внутри сегмента.
+    """
+    def segment(offset):
+        entries = (struct.pack('<IIIHH', 0x20030000, 0, 0, 0, 0)
+                   + struct.pack('<IIIHH', 0, 0, offset, 0, 0))
+        ifd = (struct.pack('<H', 3)
+               + struct.pack('<HHI4s', 0xB000, 7, 4, b'0100')
+               + struct.pack('<HHII', 0xB001, 4, 1, 2)
+               + struct.pack('<HHII', 0xB002, 7, len(entries), 8 + 42)
+               + struct.pack('<I', 0))
+        body = b'MPF\x00II*\x00' + struct.pack('<I', 8) + ifd + entries
+        return b'\xff\xe2' + struct.pack('>H', len(body) + 2) + body
+
+    first = make_image(size, exif=True)
+    # Второй кадр идет сразу за первым: SOI, маркер, длина и "MPF\0"
+    # предшествуют TIFF-заголовку
+    offset = len(first) + len(segment(0)) - 10
+    return first[:2] + segment(offset) + first[2:] + make_image(size)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class UploadTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, content, name='photo.jpg'):
+        return self.authorized_client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(name, content,
+                                        content_type='image/jpeg'),
+        })
+
+    @override_settings(POSTS_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_oversized_file_rejected(self):
+        """Файл сверх предела не сохраняется, форма сообщает об ошибке."""
+        response = self.upload(make_image((50, 50)))
+        self.assertFalse(Post.objects.exists())
+        self.assertIn('image', response.context['form'].errors)
+        self.assertEqual(response.context['form'].data['text'],
+                         'Пост с картинкой')
+
+    @override_settings(POSTS_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_rejected(self):
+        """Картинка с большим числом пикселей отклоняется."""
+        response = self.upload(make_image((50, 50)))
+        self.assertFalse(Post.objects.exists())
+        self.assertIn('image', response.context['form'].errors)
+
+    @override_settings(POSTS_IMAGE_MAX_SIDE=100)
+    def test_large_image_downscaled_without_exif(self):
+        """Большая картинка уменьшается, EXIF удаляется."""
+        self.upload(make_image((400, 200), exif=True))
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertNotIn('exif', image.info)
+
+    @override_settings(POSTS_IMAGE_MAX_SIDE=100)
+    def test_unwritable_format_reencoded_to_png(self):
+        """Большая картинка в формате, который Pillow не записывает,
+        сохраняется как PNG."""
+        response = self.upload(make_xpm(300), name='picture.xpm')
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.png'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual((image.format, image.size), ('PNG', (100, 1)))
+
+    def test_camera_mpo_stored_as_jpeg_without_exif(self):
+        """Снимок MPO - не анимация: EXIF удаляется и у небольшого."""
+        content = make_mpo((40, 20))
+        with Image.open(BytesIO(content)) as image:
+            self.assertEqual((image.format, image.n_frames), ('MPO', 2))
+        self.upload(content)
+        with Image.open(Post.objects.get().image.path) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (40, 20)))
+            self.assertNotIn('exif', image.info)
+
+    @override_settings(POSTS_IMAGE_MAX_SIDE=100)
+    def test_large_camera_mpo_downscaled(self):
+        self.upload(make_mpo((400, 200)))
+        with Image.open(Post.objects.get().image.path) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (100, 50)))
+
+    def test_small_image_kept(self):
+        """Небольшая картинка без EXIF сохраняется без пересжатия."""
+        content = make_image((40, 20))
+        self.upload(content)
+        post = Post.objects.get()
+        with open(post.image.path, 'rb') as saved:
+            self.assertEqual(saved.read(), content)
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 from http import HTTPStatus
@@ -36,6 +37,9 @@ class PostPagesTests(TestCase):
             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
             b'\x0A\x00\x3B'
         )
+        # Картинки хранятся под хешем содержимого
+        cls.image_name = (
+            f'posts/{hashlib.sha256(cls.image_gif).hexdigest()}.gif')
         cls.uploaded = SimpleUploadedFile(
             name='image.gif',
             content=cls.image_gif,
@@ -146,7 +150,8 @@ class PostPagesTests(TestCase):
             elements_dict = {'auth': first_object.author.username,
                              'Тестовый пост': first_object.text,
                              'Тестовая группа': first_object.group.title,
-                             'posts/image.gif': first_object.image.name
+                             PostPagesTests.image_name:
+                                 first_object.image.name
                              }
             for expected, field in elements_dict.items():
                 with self.subTest(field=field):
@@ -177,7 +182,7 @@ class PostPagesTests(TestCase):
         post_dict = {'Тестовый пост': first_post.text,
                      'Vasya Pupkin': first_post.author.get_full_name(),
                      'Тестовая группа': first_post.group.title,
-                     'posts/image.gif': first_post.image.name,
+                     PostPagesTests.image_name: first_post.image.name,
                      1: first_post.author.posts.count()}
         for expected, field in post_dict.items():
             with self.subTest(field=field):
@@ -216,3 +221,54 @@ class PostPagesTests(TestCase):
                     self.assertIsInstance(
                         form_field, expected,
                         f'Тип поля "{value}" не соответствует ожиданиям')
+
+    def test_profile_stats_in_context_correct(self):
+        """Статистика автора в 'profile' и 'post_detail' собрана верно."""
+        Post.objects.filter(pk=PostPagesTests.post.pk).update(
+            likes_count=3, dislikes_count=1)
+        expected = {'posts_count': 1, 'likes': 3, 'dislikes': 1,
+                    'followers_count': 0, 'following_count': 0}
+        for rev in PostPagesTests.reverse_list[2:4]:
+            with self.subTest(rev=rev):
+                response = self.authorized_client.get(rev)
+                self.assertEqual(response.context['stats'], expected,
+                                 'Статистика автора не соответствует '
+                                 'ожиданиям')
+
+    def test_post_detail_comment_tree(self):
+        """Ответы на комментарии собраны в дерево, число запросов
+        не зависит от числа комментариев."""
+        post = PostPagesTests.post
+        parent = PostPagesTests.comment
+        for i in range(5):
+            Comment.objects.create(author=PostPagesTests.author, post=post,
+                                   text=f'Ответ {i}', comment_p=parent)
+        self.authorized_client.get(PostPagesTests.reverse_list[3])
+        # На один больше, чем без ETag: валидатор поста и комментариев
+        with self.assertNumQueries(6):
+            response = self.authorized_client.get(
+                PostPagesTests.reverse_list[3])
+        tree = response.context['comment_tree']
+        self.assertEqual(tree, [parent])
+        self.assertEqual(tree[0].reply_count, 5)
+        self.assertEqual(len(tree[0].replies), 5)
+        self.assertContains(response, 'Развернуть ответы (5)')
+
+    def test_post_detail_reads_thread_by_path(self):
+        """Страница поста читает ветки через thread(): новые ветки
+        и ответы выше старых."""
+        post = PostPagesTests.post
+        old_root = PostPagesTests.comment
+        first = Comment.objects.create(author=PostPagesTests.author,
+                                       post=post, text='Первый',
+                                       comment_p=old_root)
+        second = Comment.objects.create(author=PostPagesTests.author,
+                                        post=post, text='Второй',
+                                        comment_p=old_root)
+        new_root = Comment.objects.create(author=PostPagesTests.author,
+                                          post=post, text='Новая ветка')
+        response = self.authorized_client.get(PostPagesTests.reverse_list[3])
+        self.assertIn('"path"', str(response.context['comments'].query))
+        tree = response.context['comment_tree']
+        self.assertEqual(tree, [new_root, old_root])
+        self.assertEqual(tree[1].replies, [second, first])
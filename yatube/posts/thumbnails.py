@@ -0,0 +1,291 @@
+import base64
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import delete as delete_thumbnails, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+from core import metrics
+from core.profiling import timed
+from .feed_cache import invalidate, post_scopes
+from .models import Post, ThumbnailJob
+
+logger = logging.getLogger(__name__)
+
+# Те же параметры, что были у {% thumbnail %} в шаблонах
+THUMBNAIL_GEOMETRY = '960x500'
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+# Варианты для srcset; переопределяются настройкой POSTS_IMAGE_RENDITIONS.
+# Форматы перечислены в порядке предпочтения, JPEG - запасной для <img>
+DEFAULT_RENDITIONS = {
+    'widths': (320, 640, 960),
+    'ratio': 500 / 960,
+    'formats': ('avif', 'webp', 'jpeg'),
+    'quality': 80,
+    'sizes': '(min-width: 992px) 720px, 100vw',
+    'placeholder': True,
+    'placeholder_width': 24,
+}
+MAX_ATTEMPTS = 3
+# Задание дольше этого в состоянии running считается брошенным
+STALE_AFTER = timedelta(minutes=10)
+
+_executor = None
+
+
+def thumbnail_workers():
+    """Потоков в процессе сервера; при 0 задания выполняет только
+    отдельный процесс generate_thumbnails --watch."""
+    return getattr(settings, 'POSTS_THUMBNAIL_WORKERS', 2)
+
+
+def thumbnails_sync():
+    """Строить миниатюры в потоке запроса (для отладки и тестов)."""
+    return getattr(settings, 'POSTS_THUMBNAILS_SYNC', False)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=thumbnail_workers(),
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def enqueue(post, run=True):
+    """Ставит в очередь миниатюру картинки поста.
+
+    Задание записывается в базу в той же транзакции, что и пост,
+    а исполнителю передается только после коммита. С run=False
+    задание только записывается в очередь (см. drain).
+    """
+    job, _ = ThumbnailJob.objects.update_or_create(
+        post=post,
+        defaults={'image': post.image.name, 'status': ThumbnailJob.PENDING,
+                  'attempts': 0, 'error': ''},
+    )
+    if run:
+        transaction.on_commit(lambda: submit(job.pk))
+    return job
+
+
+def submit(job_id):
+    if thumbnails_sync():
+        process_job(job_id)
+    elif thumbnail_workers():
+        _get_executor().submit(_run_in_worker, job_id)
+
+
+def _run_in_worker(job_id):
+    close_old_connections()
+    try:
+        return process_job(job_id)
+    except Exception:
+        logger.exception('Не удалось обработать задание %s', job_id)
+        return False
+    finally:
+        close_old_connections()
+
+
+def _claim(job_id):
+    """Переводит задание в running, если его никто не взял раньше."""
+    return ThumbnailJob.objects.filter(
+        pk=job_id, status=ThumbnailJob.PENDING
+    ).update(status=ThumbnailJob.RUNNING, attempts=F('attempts') + 1,
+             updated=timezone.now())
+
+
+def rendition_settings():
+    """Набор вариантов картинки: ширины, форматы, заглушка."""
+    return {**DEFAULT_RENDITIONS,
+            **getattr(settings, 'POSTS_IMAGE_RENDITIONS', {})}
+
+
+def supported_formats(formats):
+    """Форматы, которые умеют записывать и Pillow, и sorl.
+
+    AVIF и WebP зависят от сборки Pillow: недоступные пропускаются.
+    """
+    Image.init()
+    return [image_format for image_format in formats
+            if image_format.upper() in EXTENSIONS
+            and image_format.upper() in Image.SAVE]
+
+
+def _make_thumbnail(image, geometry, **options):
+    with timed('thumbnail'):
+        thumbnail = get_thumbnail(image, geometry, **options)
+    if not thumbnail.exists():
+        raise OSError(f'Не удалось построить миниатюру {image.name}')
+    return thumbnail
+
+
+def _geometry(width, config):
+    return f'{width}x{round(width * config["ratio"])}'
+
+
+def _placeholder(image, config):
+    """Крошечная копия картинки в виде data: URI."""
+    thumbnail = _make_thumbnail(
+        image, _geometry(config['placeholder_width'], config),
+        crop='center', upscale=True, format='JPEG', quality=30)
+    data = base64.b64encode(thumbnail.read()).decode()
+    return f'data:image/jpeg;base64,{data}'
+
+
+def _srcset(image, image_format, config):
+    urls = []
+    for width in config['widths']:
+        thumbnail = _make_thumbnail(
+            image, _geometry(width, config), crop='center', upscale=True,
+            format=image_format, quality=config['quality'])
+        urls.append(f'{thumbnail.url} {width}w')
+    return ', '.join(urls)
+
+
+def build_renditions(image):
+    """Строит варианты картинки для srcset.
+
+    Возвращает словарь для Post.image_renditions: источники
+    <picture> для современных форматов, srcset для <img> (JPEG),
+    значение sizes и заглушку.
+    """
+    config = rendition_settings()
+    renditions = {'sources': [], 'srcset': '', 'sizes': config['sizes'],
+                  'placeholder': ''}
+    for image_format in supported_formats(config['formats']):
+        srcset = _srcset(image, image_format.upper(), config)
+        if image_format.upper() == 'JPEG':
+            renditions['srcset'] = srcset
+        else:
+            renditions['sources'].append(
+                {'type': f'image/{image_format.lower()}', 'srcset': srcset})
+    if config['placeholder']:
+        renditions['placeholder'] = _placeholder(image, config)
+    return renditions
+
+
+def process_job(job_id):
+    """Строит миниатюру и записывает ее адрес в пост.
+
+    Возвращает True, если миниатюра готова.
+    """
+    if not _claim(job_id):
+        return False
+    job = ThumbnailJob.objects.select_related('post').get(pk=job_id)
+    post = job.post
+    if post.image.name != job.image:
+        # Картинку успели заменить, новое задание уже в очереди
+        job.status = ThumbnailJob.DONE
+        job.save(update_fields=('status', 'updated'))
+        return False
+    try:
+        # sorl не бросает исключений: при ошибке он возвращает
+        # несуществующий файл миниатюры
+        if not post.image.storage.exists(post.image.name):
+            raise FileNotFoundError(f'Нет файла {post.image.name}')
+        url = _make_thumbnail(post.image, THUMBNAIL_GEOMETRY,
+                              **THUMBNAIL_OPTIONS).url
+        renditions = build_renditions(post.image)
+    except Exception as error:
+        job.status = (ThumbnailJob.FAILED if job.attempts >= MAX_ATTEMPTS
+                      else ThumbnailJob.PENDING)
+        job.error = str(error)[:255]
+        job.save(update_fields=('status', 'error', 'updated'))
+        # failed - задание окончательно не выполнено, retry - попытка,
+        # после которой оно вернулось в очередь
+        metrics.inc('yatube_thumbnails_total', {
+            'status': 'failed' if job.status == ThumbnailJob.FAILED
+            else 'retry'})
+        return False
+    if Post.objects.filter(pk=post.pk, image=job.image).update(
+            thumbnail_url=url, image_renditions=json.dumps(renditions)):
+        invalidate(*post_scopes(post.author_id, post.group_id))
+    job.status = ThumbnailJob.DONE
+    job.error = ''
+    job.save(update_fields=('status', 'error', 'updated'))
+    metrics.inc('yatube_thumbnails_total', {'status': 'done'})
+    return True
+
+
+def reuse_existing(post):
+    """Берет готовые миниатюры у поста с той же картинкой.
+
+    Картинки хранятся по хешу содержимого, поэтому повторная
+    загрузка того же файла не требует новой работы.
+    """
+    ready = Post.objects.filter(image=post.image.name).exclude(
+        pk=post.pk).exclude(thumbnail_url='').exclude(
+        image_renditions='').values_list(
+        'thumbnail_url', 'image_renditions').first()
+    if ready is None:
+        return False
+    post.thumbnail_url, post.image_renditions = ready
+    Post.objects.filter(pk=post.pk).update(
+        thumbnail_url=post.thumbnail_url,
+        image_renditions=post.image_renditions)
+    return True
+
+
+def release_image(name):
+    """Удаляет файл картинки и его миниатюры, если на него больше
+    не ссылается ни один пост и его не заявила незаконченная загрузка."""
+    if not name:
+        return False
+    field = Post._meta.get_field('image')
+    image = field.attr_class(None, field, name)
+    storage = image.storage
+    try:
+        # Под той же блокировкой, что и сохранение одинаковой загрузки
+        with storage.lock(name):
+            if (Post.objects.filter(image=name).exists()
+                    or storage.claimed(name)
+                    or not storage.exists(name)):
+                return False
+            with timed('thumbnail'):
+                delete_thumbnails(image, delete_file=True)
+            storage.unclaim(name)
+    except SuspiciousFileOperation:
+        # Путь вне MEDIA_ROOT: файл не наш, не трогаем
+        return False
+    return True
+
+
+def requeue_stale():
+    """Возвращает в очередь задания, брошенные упавшим процессом."""
+    return ThumbnailJob.objects.filter(
+        status=ThumbnailJob.RUNNING,
+        updated__lt=timezone.now() - STALE_AFTER,
+    ).update(status=ThumbnailJob.PENDING)
+
+
+def enqueue_missing():
+    """Создает задания для картинок без готовых миниатюр."""
+    posts = Post.objects.exclude(image='').filter(
+        Q(thumbnail_url='') | Q(image_renditions='')
+    ).exclude(
+        thumbnail_job__status__in=(ThumbnailJob.PENDING,
+                                   ThumbnailJob.RUNNING))
+    count = 0
+    for post in posts.iterator():
+        enqueue(post, run=False)
+        count += 1
+    return count
+
+
+def drain(workers=1):
+    """Выполняет все задания из очереди, возвращает число готовых."""
+    job_ids = list(ThumbnailJob.objects.filter(
+        status=ThumbnailJob.PENDING).values_list('pk', flat=True))
+    if workers <= 1:
+        return sum(process_job(job_id) for job_id in job_ids)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(_run_in_worker, job_ids))
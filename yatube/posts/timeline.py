@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from .models import Post, Follow, TimelineEntry
+
+HEAVY_AUTHORS_CACHE_KEY = 'timeline:heavy_authors'
+HEAVY_AUTHORS_CACHE_TIMEOUT = 300
+BATCH_SIZE = 500
+
+
+def timeline_enabled():
+    return getattr(settings, 'POSTS_TIMELINE', False)
+
+
+def fanout_limit():
+    """Авторам с большим числом подписчиков посты не раскладываются
+    по лентам при публикации, они подмешиваются при чтении."""
+    return getattr(settings, 'POSTS_TIMELINE_FANOUT_LIMIT', 1000)
+
+
+def heavy_authors():
+    """Id авторов, у которых подписчиков больше fanout_limit()."""
+    authors = cache.get(HEAVY_AUTHORS_CACHE_KEY)
+    if authors is None:
+        authors = set(Follow.objects.values('author').annotate(
+            followers=Count('pk')
+        ).filter(followers__gt=fanout_limit()).values_list(
+            'author', flat=True
+        ))
+        cache.set(HEAVY_AUTHORS_CACHE_KEY, authors,
+                  HEAVY_AUTHORS_CACHE_TIMEOUT)
+    return authors
+
+
+def _add_entries(user_ids, posts):
+    """posts - пары (pk, pub_date)."""
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for user_id in user_ids for pk, pub_date in posts],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out(post):
+    """Кладет новый пост в ленты подписчиков автора."""
+    if post.author_id in heavy_authors():
+        return
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id).values_list('user', flat=True))
+    _add_entries(followers, [(post.pk, post.pub_date)])
+
+
+def sync_pub_date(post):
+    TimelineEntry.objects.filter(post=post).exclude(
+        pub_date=post.pub_date).update(pub_date=post.pub_date)
+
+
+def follow_author(user_id, author_id):
+    """Добавляет в ленту подписчика уже опубликованные посты автора."""
+    if author_id in heavy_authors():
+        return
+    _add_entries([user_id], Post.objects.filter(
+        author_id=author_id).values_list('pk', 'pub_date'))
+
+
+def unfollow_author(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild_timeline(user_id):
+    """Приводит ленту пользователя в соответствие с подписками.
+
+    Возвращает число добавленных и удаленных записей.
+    """
+    authors = Follow.objects.filter(user_id=user_id).exclude(
+        author_id__in=heavy_authors()).values('author')
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    removed, _ = entries.exclude(post__author__in=authors).delete()
+    entries.update(pub_date=Subquery(
+        Post.objects.filter(pk=OuterRef('post')).values('pub_date')[:1]
+    ))
+    missing = list(Post.objects.filter(author__in=authors).exclude(
+        pk__in=entries.values('post')).values_list('pk', 'pub_date'))
+    _add_entries([user_id], missing)
+    return len(missing), removed
+
+
+def timeline_posts(user):
+    """Посты ленты подписок пользователя.
+
+    Обычно это один проход по индексу (user, -pub_date, post) таблицы
+    TimelineEntry с присоединением постов. Посты авторов с большим
+    числом подписчиков не раскладываются по лентам и добавляются
+    при чтении (fan-out-on-read).
+    """
+    posts = Post.objects.select_related('group', 'author')
+    heavy = heavy_authors()
+    if heavy:
+        heavy = list(Follow.objects.filter(
+            user=user, author_id__in=heavy).values_list('author', flat=True))
+    if not heavy:
+        return posts.filter(timeline_entries__user=user).annotate(
+            timeline_pub_date=F('timeline_entries__pub_date'),
+            timeline_post=F('timeline_entries__post'),
+        ).order_by('-timeline_pub_date', 'timeline_post')
+    return posts.filter(
+        Q(pk__in=TimelineEntry.objects.filter(user=user).values('post'))
+        | Q(author_id__in=heavy)
+    )
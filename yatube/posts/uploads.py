@@ -0,0 +1,130 @@
+import os
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+
+# Параметры пересжатия слишком больших картинок
+JPEG_QUALITY = 90
+# Форматы, которые Pillow открывает, но не записывает (XPM, PSD,
+# WEBP без libwebp), пересжимаются в PNG
+FALLBACK_FORMAT = 'PNG'
+FALLBACK_MODES = ('1', 'L', 'LA', 'I', 'P', 'RGB', 'RGBA')
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png'}
+
+
+def max_upload_size():
+    """Предельный размер загружаемого файла в байтах."""
+    return getattr(settings, 'POSTS_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+
+
+def max_image_pixels():
+    """Предельное число пикселей картинки (ширина * высота)."""
+    return getattr(settings, 'POSTS_IMAGE_MAX_PIXELS', 40_000_000)
+
+
+def max_image_side():
+    """Картинки с большей стороной длиннее уменьшаются до нее."""
+    return getattr(settings, 'POSTS_IMAGE_MAX_SIDE', 2560)
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл по частям и не сохраняет
+    ничего сверх max_upload_size().
+
+    Файл, превысивший предел, усекается и помечается oversized:
+    форма сообщит об ошибке, а остальные поля запроса не пропадут,
+    как было бы при StopUpload.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.oversized = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.oversized:
+            return None
+        if self.received > max_upload_size():
+            self.oversized = True
+            self.file.seek(0)
+            self.file.truncate()
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.oversized = self.oversized
+        return upload
+
+
+def _output_format(image):
+    """Формат пересжатой картинки: исходный, если Pillow умеет его
+    записывать. Многокадровые снимки камер (MPO) - это JPEG."""
+    if image.format in ('JPEG', 'MPO'):
+        return 'JPEG'
+    Image.init()
+    return image.format if image.format in Image.SAVE else FALLBACK_FORMAT
+
+
+def _reencode(image, upload, side):
+    """Уменьшает картинку и сохраняет ее заново без EXIF."""
+    image_format = _output_format(image)
+    if image_format == 'JPEG':
+        # Декодер JPEG сразу распакует картинку в 2-8 раз меньше:
+        # полноразмерный растр в память не попадает
+        image.draft('RGB', (side, side))
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((side, side))
+    image.info.pop('exif', None)
+    options = {'quality': JPEG_QUALITY} if image_format == 'JPEG' else {}
+    if source_format != image_format:
+        if (image_format == FALLBACK_FORMAT
+                and image.mode not in FALLBACK_MODES):
+            image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+        upload.name = (os.path.splitext(upload.name)[0]
+                       + EXTENSIONS[image_format])
+        upload.content_type = Image.MIME[image_format]
+    # Растр уже в памяти: результат пишется поверх временного файла
+    # загрузки, который Django сам удалит в конце запроса
+    upload.seek(0)
+    upload.truncate()
+    image.save(upload, format=image_format, **options)
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload
+
+
+def prepare_image(upload):
+    """Проверяет размеры загруженной картинки до ее распаковки.
+
+    Pillow при открытии читает только заголовок. Картинки больше
+    max_image_side() уменьшаются, а метаданные EXIF (геометка,
+    модель камеры) удаляются; форматы, которые Pillow не умеет
+    записывать, при этом становятся PNG. Остальные файлы
+    возвращаются как есть, без пересжатия.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    width, height = image.size
+    if width * height > max_image_pixels():
+        raise ValidationError(
+            f'Картинка {width}x{height} слишком большая: допустимо '
+            f'не больше {max_image_pixels()} пикселей'
+        )
+    side = max_image_side()
+    too_large = max(width, height) > side
+    # Снимки телефонов в MPO открываются как анимация из нескольких
+    # кадров, но это обычные JPEG с EXIF
+    if getattr(image, 'is_animated', False) and image.format != 'MPO':
+        if too_large:
+            raise ValidationError(
+                f'Анимация должна быть не больше {side}x{side}')
+        upload.seek(0)
+        return upload
+    if not too_large and 'exif' not in image.info:
+        upload.seek(0)
+        return upload
+    return _reencode(image, upload, side)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = "posts"
 
@@ -35,6 +35,11 @@ urlpatterns = [
         name='comment_del'
     ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('api/posts/', api.index, name='api_index'),
+    path('api/group/<slug:slug>/', api.group_posts, name='api_group_list'),
+    path('api/profile/<str:username>/', api.profile, name='api_profile'),
+    path('api/posts/<int:post_id>/', api.post_detail,
+         name='api_post_detail'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -1,72 +1,111 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.http import HttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from core.db_router import replica_reads
 from .forms import PostForm, CommentForm
 from .models import Post, Group, User, Comment, Follow, Dislike, Like
+from .conditional import (
+    conditional, follow_validators, group_validators, index_validators,
+    per_user, post_detail_validators, profile_validators
+)
 from .decorators import post_author_only
-from django.db.models import Q
+from .feed_cache import (
+    INDEX_SCOPE, feed_cache_context, group_scope, profile_scope
+)
+from .reaction_buffer import (
+    PENDING_COOKIE, buffer_reaction, overlay_pending, overlay_pending_stats
+)
+from .paginators import CachedCountPaginator, CursorPaginator
+from .search import search_posts
+from .services import (
+    build_comment_tree, get_profile_stats, toggle_reaction
+)
+from .timeline import timeline_enabled, timeline_posts
 
 
 POSTS_PER_PAGE = 10
-
-
-def paginator_func(*args):
-    paginator = Paginator(args[1], POSTS_PER_PAGE)
-    page_number = args[0].GET.get('page')
-    page_obj = paginator.get_page(page_number)
+# Страницы с данными пользователя хранит только его браузер
+# и каждый раз переспрашивает: неизменившаяся страница - ответ 304
+PAGE_CACHE_CONTROL = {'private': True, 'no_cache': True}
+
+
+def paginator_func(*args, count=None, cursor=True):
+    if cursor and getattr(settings, 'POSTS_PAGINATION', 'pages') == 'cursor':
+        paginator = CursorPaginator(args[1], POSTS_PER_PAGE)
+        page_obj = paginator.get_page(args[0].GET.get('cursor'))
+    else:
+        paginator = CachedCountPaginator(args[1], POSTS_PER_PAGE,
+                                         count=count)
+        page_number = args[0].GET.get('page')
+        page_obj = paginator.get_page(page_number)
+    overlay_pending(args[0], page_obj)
     return page_obj
 
 
+@replica_reads
+@conditional(per_user(index_validators), **PAGE_CACHE_CONTROL)
 def index(request):
     post_list = Post.objects.select_related('group', 'author').all()
     template = "posts/index.html"
     text = "Последние обновления на сайте:"
     page_obj = paginator_func(request, post_list)
     context = {'text': text, 'page_obj': page_obj, }
+    context.update(feed_cache_context(request, INDEX_SCOPE))
     return render(request, template, context)
 
 
+@replica_reads
+@conditional(per_user(group_validators), **PAGE_CACHE_CONTROL)
 def group_posts(request, slug):
     template = "posts/group_list.html"
     group = get_object_or_404(Group, slug=slug)
     post_list = group.posts.select_related('author').all()
     page_obj = paginator_func(request, post_list)
     context = {'group': group, 'page_obj': page_obj}
+    context.update(feed_cache_context(request, group_scope(group.pk)))
     return HttpResponse(render(request, template, context))
 
 
+@replica_reads
+@conditional(per_user(profile_validators), **PAGE_CACHE_CONTROL)
 def profile(request, username):
     template = 'posts/profile.html'
     author = get_object_or_404(User, username=username)
     post_list = author.posts.all()
-    page_obj = paginator_func(request, post_list)
+    stats = get_profile_stats(author)
+    overlay_pending_stats(request, author, stats)
+    page_obj = paginator_func(request, post_list, count=stats['posts_count'])
     following = Follow.objects.filter(
         user__username=request.user, author=author
     )
-    likes = 0
-    dislikes = 0
-    for post in post_list:
-        likes += post.like.count()
-        dislikes += post.dislike.count()
     context = {'author': author,
                'page_obj': page_obj,
                'following': following,
-               'likes': likes,
-               'dislikes': dislikes
-    }
+               'stats': stats,
+               }
+    context.update(feed_cache_context(request, profile_scope(author.pk)))
     return render(request, template, context, )
 
 
+@replica_reads
+@conditional(per_user(post_detail_validators), **PAGE_CACHE_CONTROL)
 def post_detail(request, post_id):
     post = get_object_or_404(
         Post.objects.select_related('author', 'group'), pk=post_id
     )
-    comments = post.comments.select_related('author', 'comment_p').all()
+    overlay_pending(request, [post])
+    comments = Comment.objects.thread(post).select_related('author')
 
     form = CommentForm(request.POST or None)
     template = 'posts/post_detail.html'
-    context = {'post': post, 'comments': comments, 'form': form }
+    context = {'post': post,
+               'comments': comments,
+               'comment_tree': build_comment_tree(comments,
+                                                  newest_first=True),
+               'form': form,
+               'stats': get_profile_stats(post.author),
+               }
     return render(request, template, context)
 
 
@@ -126,6 +165,10 @@ def add_comment(request, post_id):
 def add_comment_to_comment(request, post_id, comment_id):
     post = get_object_or_404(Post, pk=post_id)
     comment_p = get_object_or_404(Comment, pk=comment_id)
+    if comment_p.depth + 1 >= Comment.MAX_DEPTH:
+        # Путь ограничен по длине: слишком глубокий ответ становится
+        # соседом комментария, на который отвечают
+        comment_p = comment_p.comment_p
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -139,7 +182,8 @@ def add_comment_to_comment(request, post_id, comment_id):
 def add_comment_with_quote(request, post_id, comment_id):
     post = get_object_or_404(Post, pk=post_id)
     comment = get_object_or_404(Comment, post=post_id, pk=comment_id)
-    comments = post.comments.select_related('author').all()
+    overlay_pending(request, [post])
+    comments = Comment.objects.thread(post).select_related('author')
     comment.hidden_text = f'<blockquote class="blockquote-2">' \
                    f'<p> {comment.text} </p> ' \
                    f'<cite> {comment.author}</cite></blockquote>'
@@ -152,7 +196,10 @@ def add_comment_with_quote(request, post_id, comment_id):
         comment.save()
         return redirect('posts:post_detail', post_id=post_id)
     template = 'posts/post_detail.html'
-    context = {'form': form, 'post': post, 'comments': comments, 'not_hidden': True}
+    context = {'form': form, 'post': post, 'comments': comments,
+               'comment_tree': build_comment_tree(comments,
+                                                  newest_first=True),
+               'not_hidden': True, 'stats': get_profile_stats(post.author)}
     return render(request, template, context)
 
 
@@ -164,12 +211,17 @@ def comment_delete(request, post_id, comment_id):
                                      'redirect_if_referer_not_found'))
 
 
+@replica_reads
 @login_required
+@conditional(per_user(follow_validators), **PAGE_CACHE_CONTROL)
 def follow_index(request):
     template = "posts/follow.html"
-    post_list = Post.objects.select_related('group', 'author').filter(
-        author__following__user=request.user
-    )
+    if timeline_enabled():
+        post_list = timeline_posts(request.user)
+    else:
+        post_list = Post.objects.select_related('group', 'author').filter(
+            author__following__user=request.user
+        )
     page_obj = paginator_func(request, post_list)
     context = {"page_obj": page_obj}
     return render(request, template, context)
@@ -190,19 +242,16 @@ def profile_unfollow(request, username):
     return redirect("posts:profile", username)
 
 
+@replica_reads
 def search(request):
     template = 'posts/search.html'
-    if request.method == 'GET' and request.GET['q']:
-        query = request.GET.get('q')
+    query = request.GET.get('q')
+    if query:
         query_q = f'?q={query}'
-        search_list = Post.objects.select_related('group', 'author').filter(
-            Q(text__iregex=query) |
-            Q(group__title__iregex=query) |
-            Q(author__first_name__iregex=query) |
-            Q(author__last_name__iregex=query) |
-            Q(author__username__iregex=query)
+        search_list = search_posts(
+            query, Post.objects.select_related('group', 'author')
         )
-        page_obj = paginator_func(request, search_list)
+        page_obj = paginator_func(request, search_list, cursor=False)
         context = {
             'page_obj': page_obj,
             'query': query,
@@ -212,36 +261,22 @@ def search(request):
     return render(request, template)
 
 
-@login_required
+def react(request, post_id, model):
+    response = redirect(request.META.get('HTTP_REFERER',
+                                         'redirect_if_referer_not_found'))
+    if buffer_reaction(request.user, post_id, model):
+        response.set_cookie(PENDING_COOKIE, '1', httponly=True,
+                            samesite='Lax')
+    else:
+        toggle_reaction(request.user, post_id, model)
+    return response
+
+
 @login_required
 def add_like(request, post_id):
-    try:
-        dislike = Dislike.objects.get(post_id=post_id, user=request.user)
-        dislike.delete()
-        Like.objects.create(user=request.user, post_id=post_id)
-    except Dislike.DoesNotExist:
-        try:
-            like = Like.objects.get(post_id=post_id, user=request.user)
-            like.delete()
-        except Like.DoesNotExist:
-            Like.objects.create(user=request.user, post_id=post_id)
-    return redirect(request.META.get('HTTP_REFERER',
-                                     'redirect_if_referer_not_found'))
+    return react(request, post_id, Like)
 
 
 @login_required
 def add_dislike(request, post_id):
-    try:
-        like = Like.objects.get(post_id=post_id, user=request.user)
-        like.delete()
-        Dislike.objects.create(user=request.user, post_id=post_id)
-    except Like.DoesNotExist:
-        try:
-            dislike = Dislike.objects.get(
-                post_id=post_id, user=request.user
-            )
-            dislike.delete()
-        except Dislike.DoesNotExist:
-            Dislike.objects.create(user=request.user, post_id=post_id)
-    return redirect(request.META.get('HTTP_REFERER',
-                                     'redirect_if_referer_not_found'))
\ No newline at end of file
+    return react(request, post_id, Dislike)
@@ -0,0 +1,12 @@
+"""Настройки выбираются переменной окружения YATUBE_ENV.
+
+dev (по умолчанию) - DEBUG и debug_toolbar, prod - без отладочных
+инструментов, см. prod.py. Модуль можно указать и напрямую:
+DJANGO_SETTINGS_MODULE=yatube.settings.prod.
+"""
+import os
+
+if os.environ.get('YATUBE_ENV', 'dev') == 'prod':
+    from .prod import *  # noqa: F401,F403
+else:
+    from .dev import *  # noqa: F401,F403
@@ -0,0 +1,282 @@
+"""Общие настройки. Окружение выбирается в yatube/settings/__init__.py."""
+import os
+
+# Build paths inside the project like this: os.path.join(BASE_DIR, ...)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+# dev или prod, см. yatube/settings/__init__.py
+YATUBE_ENV = 'base'
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = os.environ.get(
+    'YATUBE_SECRET_KEY',
+    '*$5sdq&u)hy#-bp52$9xz)wrf5+_bvl+7kvo*v1yw$b3(dw1ub'
+)
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+ALLOWED_HOSTS = [
+    'localhost',
+    '127.0.0.1',
+    '[::1]',
+    'testserver',
+    'www.spaikblog.pythonanywhere.com',
+    'spaikblog.pythonanywhere.com',
+    'spaikblog.pythonanywhere.com',
+]
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'sorl.thumbnail',
+    'posts.apps.PostsConfig',
+    'users.apps.UsersConfig',
+    'core.apps.CoreConfig',
+    'about.apps.AboutConfig',
+]
+
+MIDDLEWARE = [
+    # Первым: замеры включают все остальные middleware
+    'core.profiling.RequestProfileMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    # ETag по содержимому для страниц без своих валидаторов
+    # (поиск, "об авторе"): ответ все равно отрисовывается,
+    # но клиенту уходит короткий 304
+    'django.middleware.http.ConditionalGetMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.request_profiler.StaffProfilerMiddleware',
+    'core.db_router.ReplicaRoutingMiddleware',
+    'posts.reaction_buffer.ReactionBufferMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'yatube.urls'
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+
+TEMPLATES = [
+    {
+        # DjangoTemplates с замером времени отрисовки (core.profiling)
+        'BACKEND': 'core.backends.templates.DjangoTemplates',
+        'DIRS': [TEMPLATES_DIR],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'core.context_processors.year.year',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'yatube.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'core.backends.sqlite3',
+        'NAME': os.environ.get('YATUBE_DB_NAME',
+                               os.path.join(BASE_DIR, 'db.sqlite3')),
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # Соединение переживает запрос: PRAGMA и кеш страниц SQLite
+        # не пересоздаются на каждый запрос
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_CONN_MAX_AGE', 60)),
+    }
+}
+
+# Реплики для чтения лент (core.db_router): пути к копиям базы через
+# запятую в YATUBE_DB_REPLICAS. Репликацию настраивают отдельно,
+# в тестах реплики смотрят в тестовую default (MIRROR)
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+        filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': name,
+                        'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Сколько секунд после записи пользователь читает только из default
+DATABASE_REPLICA_PIN_SECONDS = 10
+
+# Поправки к PRAGMA каждого нового соединения с SQLite
+# (core.db.DEFAULT_PRAGMAS), None убирает PRAGMA. Сравнить
+# с настройками SQLite по умолчанию: manage.py benchmark_sqlite
+SQLITE_PRAGMAS = {}
+
+
+# Password validation
+# https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/2.2/topics/i18n/
+
+LANGUAGE_CODE = 'ru'
+
+TIME_ZONE = 'Europe/Moscow'
+
+USE_I18N = True
+
+USE_L10N = True
+
+USE_TZ = True
+
+# Бэкенд кеша выбирается переменной окружения YATUBE_CACHE.
+# locmem - свой кеш у каждого процесса, file/sqlite/redis - общий
+# для всех воркеров сервера. Все бэкенды из core.cache_backends
+# считают попадания и время операций
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'core.cache_backends.LocMemCache',
+    },
+    'file': {
+        'BACKEND': 'core.cache_backends.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'sqlite': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'redis': {
+        'BACKEND': 'core.cache_backends.RedisCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', 'redis://127.0.0.1:6379/0'
+        ),
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('YATUBE_CACHE', 'locmem')],
+}
+
+STATIC_URL = '/static/'
+STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+
+# Режим паджинации лент: 'pages' - номера страниц,
+# 'cursor' - keyset-курсоры без COUNT(*) и OFFSET
+POSTS_PAGINATION = 'pages'
+
+# Лента подписок из заранее разложенных записей TimelineEntry.
+# Посты авторов, у которых подписчиков больше лимита, подмешиваются
+# при чтении. После включения выполните manage.py rebuild_timelines
+POSTS_TIMELINE = True
+POSTS_TIMELINE_FANOUT_LIMIT = 1000
+
+# Миниатюры картинок строятся в фоне после сохранения поста пулом
+# из POSTS_THUMBNAIL_WORKERS потоков в процессе сервера (0 - только
+# отдельным процессом manage.py generate_thumbnails --watch). Команда
+# также доделывает брошенные задания и старые картинки
+POSTS_THUMBNAIL_WORKERS = 2
+POSTS_THUMBNAILS_SYNC = False
+# Варианты картинок для srcset. Форматы, которые не умеет записывать
+# установленный Pillow (часто AVIF, иногда WebP), пропускаются
+POSTS_IMAGE_RENDITIONS = {
+    'widths': (320, 640, 960),
+    'formats': ('avif', 'webp', 'jpeg'),
+    'quality': 80,
+    'placeholder': True,
+}
+
+LOGIN_URL = 'users:login'
+LOGIN_REDIRECT_URL = 'posts:index'
+
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+
+CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_URL = '/media/'
+
+# Отложенная запись лайков и дизлайков (posts.reaction_buffer):
+# None - сразу в базу, 'memory' - буфер в процессе (один процесс
+# сервера), путь к файлу - общий буфер для всех воркеров
+POSTS_REACTIONS_BUFFER = os.environ.get('YATUBE_REACTIONS_BUFFER') or None
+POSTS_REACTIONS_FLUSH_MS = 500
+POSTS_REACTIONS_FLUSH_EVENTS = 100
+
+# Загрузки пишутся во временный файл по частям, файлы больше
+# POSTS_IMAGE_MAX_UPLOAD_SIZE не сохраняются и не открываются Pillow
+FILE_UPLOAD_HANDLERS = ['posts.uploads.LimitedUploadHandler']
+POSTS_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+POSTS_IMAGE_MAX_PIXELS = 40_000_000
+POSTS_IMAGE_MAX_SIDE = 2560
+
+# Замеры запросов по представлениям (core.profiling): гистограммы
+# в памяти за REQUEST_PROFILING_WINDOW секунд и, если задан путь,
+# журнал JSONL с ротацией
+REQUEST_PROFILING = True
+REQUEST_PROFILING_LOG = os.environ.get('YATUBE_PROFILE_LOG') or None
+REQUEST_PROFILING_LOG_MAX_BYTES = 10 * 1024 * 1024
+REQUEST_PROFILING_LOG_BACKUPS = 5
+REQUEST_PROFILING_WINDOW = 600
+# Столько одинаковых запросов за один ответ - подозрение на N+1
+REQUEST_PROFILING_N_PLUS_ONE = 5
+# Заголовок Server-Timing (db, render, cache, thumbnail): True - всем,
+# 'staff' - только сотрудникам, False - никому
+SERVER_TIMING = 'staff'
+# Сотрудник добавляет к любому адресу ?_profile (или ?_profile=cprofile)
+# и получает в заголовке X-Profile ссылку на профиль этого запроса
+REQUEST_PROFILER_PARAM = '_profile'
+REQUEST_PROFILER_DIR = os.environ.get(
+    'YATUBE_PROFILER_DIR', os.path.join(BASE_DIR, 'profiles'))
+REQUEST_PROFILER_INTERVAL = 0.001
+
+# /metrics для Prometheus (core.metrics). С METRICS_DIR каждый процесс
+# раз в METRICS_FLUSH_INTERVAL секунд пишет туда свои значения,
+# и /metrics показывает сумму по всем воркерам; без него - только
+# ответивший процесс
+METRICS_DIR = os.environ.get('YATUBE_METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 1
+# Время ответа собирается по именам URL этих приложений
+METRICS_NAMESPACES = ('posts', 'users', 'about')
+# Кроме сотрудников, /metrics отдается с заголовком
+# Authorization: Bearer <METRICS_TOKEN> (bearer_token в Prometheus)
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN') or None
+
+# Журнал медленных SQL-запросов (core.slow_queries, команда
+# slow_queries): запросы дольше SLOW_QUERY_MS с вероятностью
+# SLOW_QUERY_SAMPLE_RATE записываются вместе с EXPLAIN
+SLOW_QUERY_LOG = os.environ.get('YATUBE_SLOW_QUERY_LOG') or None
+SLOW_QUERY_MS = int(os.environ.get('YATUBE_SLOW_QUERY_MS', 100))
+SLOW_QUERY_SAMPLE_RATE = float(
+    os.environ.get('YATUBE_SLOW_QUERY_SAMPLE_RATE', 1.0))
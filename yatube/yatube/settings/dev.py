@@ -0,0 +1,14 @@
+"""Разработка: DEBUG, debug_toolbar и раздача media самим Django."""
+from .base import *  # noqa: F401,F403
+from .base import INSTALLED_APPS, MIDDLEWARE
+
+YATUBE_ENV = 'dev'
+
+DEBUG = True
+SERVER_TIMING = True
+
+INSTALLED_APPS = INSTALLED_APPS + ['debug_toolbar']
+MIDDLEWARE = MIDDLEWARE + ['debug_toolbar.middleware.DebugToolbarMiddleware']
+INTERNAL_IPS = [
+    '127.0.0.1',
+]
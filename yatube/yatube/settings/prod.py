@@ -0,0 +1,74 @@
+"""Боевой сервер: без отладочных инструментов на пути запроса.
+
+Обязательна переменная YATUBE_SECRET_KEY. Если сюда все же попадут
+DEBUG или debug_toolbar, сервер не запустится (core.checks).
+"""
+import os
+from django.core.exceptions import ImproperlyConfigured
+from .base import *  # noqa: F401,F403
+from .base import ALLOWED_HOSTS, BASE_DIR, CACHE_BACKENDS, DATABASES
+
+YATUBE_ENV = 'prod'
+
+DEBUG = False
+
+if 'YATUBE_SECRET_KEY' not in os.environ:
+    raise ImproperlyConfigured('Задайте YATUBE_SECRET_KEY для prod')
+SECRET_KEY = os.environ['YATUBE_SECRET_KEY']
+
+ALLOWED_HOSTS = ALLOWED_HOSTS + list(filter(
+    None, os.environ.get('YATUBE_ALLOWED_HOSTS', '').split(',')))
+
+# Шаблоны компилируются один раз на процесс; контекстный процессор
+# debug не нужен
+TEMPLATES = [
+    {
+        'BACKEND': 'core.backends.templates.DjangoTemplates',
+        'DIRS': [os.path.join(BASE_DIR, 'templates')],
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'core.context_processors.year.year',
+            ],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+# Постоянные соединения с базой и репликами
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = int(
+        os.environ.get('YATUBE_CONN_MAX_AGE', 600))
+
+# Кеш лент и счетчиков общий для всех воркеров
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('YATUBE_CACHE', 'sqlite')],
+}
+
+# Воркеры сервера складывают метрики в общий каталог
+METRICS_DIR = os.environ.get(
+    'YATUBE_METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+
+# Журнал медленных запросов всех воркеров
+SLOW_QUERY_LOG = os.environ.get(
+    'YATUBE_SLOW_QUERY_LOG', os.path.join(BASE_DIR, 'slow_queries.sqlite3'))
+
+STATIC_ROOT = os.environ.get(
+    'YATUBE_STATIC_ROOT', os.path.join(BASE_DIR, 'collected_static'))
+
+# HTTPS терминирует прокси хостинга
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SECURE_SSL_REDIRECT = os.environ.get('YATUBE_SSL_REDIRECT', '1') == '1'
+SECURE_HSTS_SECONDS = int(os.environ.get('YATUBE_HSTS_SECONDS', 3600))
+SECURE_CONTENT_TYPE_NOSNIFF = True
+SECURE_BROWSER_XSS_FILTER = True
+SESSION_COOKIE_SECURE = True
+CSRF_COOKIE_SECURE = True
+X_FRAME_OPTIONS = 'DENY'
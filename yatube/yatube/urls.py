@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import path, include
+from core.views import metrics
 
 
 urlpatterns = [
@@ -10,6 +11,8 @@ urlpatterns = [
     path('auth/', include('users.urls', namespace="users")),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace="about")),
+    path('_core/', include('core.urls', namespace="core")),
+    path('metrics', metrics, name='metrics'),
 ]
 
 handler404 = 'core.views.page_not_found'
@@ -20,5 +23,6 @@ if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
     )
+if 'debug_toolbar' in settings.INSTALLED_APPS:
     import debug_toolbar
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
\ No newline at end of file